@@ -5,6 +5,11 @@ import ReactMarkdown from 'react-markdown';
 import { motion, AnimatePresence } from 'framer-motion';
 import { useSearchParams } from 'next/navigation';
 
+const POLL_INTERVAL_MS = 1000;
+// While the coach's text streams in, poll faster so it reads as it is written
+const STREAM_POLL_INTERVAL_MS = 400;
+const PENDING_NOTE = "\n\n*Coach is writing the analysis...*";
+
 export default function Analysis() {
   const searchParams = useSearchParams();
   const [matchId, setMatchId] = useState('');
@@ -43,11 +48,29 @@ export default function Analysis() {
           manual_agent: manualAgent
         }),
       });
-      const result = await res.json();
-      if (!res.ok) throw new Error(result.error || 'Failed to fetch analysis');
+      const started = await res.json();
+      if (!res.ok) throw new Error(started.error || 'Failed to fetch analysis');
+
+      // Poll: the stats block, the coach and then the streamed text show up before the LLM finishes
+      while (true) {
+        const pollRes = await fetch(`/api/analysis?execution_id=${encodeURIComponent(started.execution_id)}`);
+        const result = await pollRes.json();
+        if (!pollRes.ok) throw new Error(result.error || 'Failed to fetch analysis');
 
-      setAnalysis(result.text || "No analysis text returned.");
-      setContextData(result.context || {});
+        if (result.stage === 'done') {
+          setAnalysis(result.text || "No analysis text returned.");
+          setContextData(result.context || {});
+          break;
+        }
+        if (result.stats_text) {
+          // Same layout as the final text: stats, persona, then the coaching text so far
+          const coaching = result.partial ? `\n\n${result.partial}` : PENDING_NOTE;
+          setAnalysis(result.stats_text + (result.persona ? `\n${result.persona}` : '') + coaching);
+          setContextData(result.context || {});
+        }
+        const interval = result.stage === 'generating' ? STREAM_POLL_INTERVAL_MS : POLL_INTERVAL_MS;
+        await new Promise((resolve) => setTimeout(resolve, interval));
+      }
     } catch (err: any) {
       setError(err.message);
     } finally {
@@ -175,7 +198,7 @@ export default function Analysis() {
               {/* Chat Column */}
               <div className="lg:col-span-5">
                 <div className="sticky top-8">
-                  <ChatInterface context={contextData} />
+                  <ChatInterface key={matchId} context={contextData} matchId={matchId.trim()} playerName={playerName.trim()} />
                 </div>
               </div>
             </motion.div>
@@ -186,17 +209,20 @@ export default function Analysis() {
   );
 }
 
-function ChatInterface({ context }: { context: any }) {
+function ChatInterface({ context, matchId, playerName }: { context: any, matchId: string, playerName: string }) {
   const [messages, setMessages] = useState<{ role: string, content: string }[]>([]);
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
+  // The coach's reply as it streams in, shown until the turn completes
+  const [partial, setPartial] = useState('');
   const scrollRef = useRef<HTMLDivElement>(null);
 
   useEffect(() => {
     if (scrollRef.current) {
       scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
     }
-  }, [messages, loading]);
+  }, [messages, loading, partial]);
 
   const sendMessage = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -208,19 +234,39 @@ function ChatInterface({ context }: { context: any }) {
     setLoading(true);
 
     try {
-      const res = await fetch('/api/chat', {
-        method: 'POST',
-        body: JSON.stringify({
-          message: userMsg.content,
-          context: context,
-          history: messages
-        })
-      });
-      const data = await res.json();
+      // The context goes up only until the server holds a session for this match
+      const ask = async (withContext: boolean) => {
+        const res = await fetch('/api/chat', {
+          method: 'POST',
+          body: JSON.stringify({
+            message: userMsg.content,
+            match_id: matchId,
+            player_name: playerName,
+            session_id: sessionId,
+            context: withContext ? context : undefined
+          })
+        });
+        const started = await res.json();
+        if (!res.ok) throw new Error(started.error);
+
+        // Poll: the reply streams in before the turn completes
+        while (true) {
+          const pollRes = await fetch(`/api/chat?execution_id=${encodeURIComponent(started.execution_id)}`);
+          const result = await pollRes.json();
+          if (!pollRes.ok) throw new Error(result.error);
+          if (result.stage === 'done') return result;
+          setPartial(result.partial || '');
+          await new Promise((resolve) => setTimeout(resolve, STREAM_POLL_INTERVAL_MS));
+        }
+      };
+      let data = await ask(!sessionId);
+      if (data.session_expired) data = await ask(true);
+      if (data.session_id) setSessionId(data.session_id);
       setMessages(prev => [...prev, { role: 'assistant', content: data.reply || "Connection error." }]);
     } catch (err) {
       setMessages(prev => [...prev, { role: 'assistant', content: "Failed to reach the coach." }]);
     } finally {
+      setPartial('');
       setLoading(false);
     }
   };
@@ -262,7 +308,17 @@ function ChatInterface({ context }: { context: any }) {
           </motion.div>
         ))}
 
-        {loading && (
+        {loading && partial && (
+          <div className="flex justify-start">
+            <div className="max-w-[85%] rounded-2xl px-5 py-3 text-sm leading-relaxed bg-white/5 text-neutral-200 rounded-bl-sm border border-white/5">
+              <div className="prose prose-invert prose-sm max-w-none">
+                <ReactMarkdown>{partial}</ReactMarkdown>
+              </div>
+            </div>
+          </div>
+        )}
+
+        {loading && !partial && (
           <motion.div initial={{ opacity: 0 }} animate={{ opacity: 1 }} className="flex justify-start">
             <div className="bg-white/5 rounded-2xl px-4 py-3 flex gap-1.5 items-center rounded-bl-none">
               <div className="w-1.5 h-1.5 bg-neutral-400 rounded-full animate-bounce"></div>
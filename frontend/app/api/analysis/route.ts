@@ -1,4 +1,20 @@
 import { NextResponse } from 'next/server';
+import { readProgress } from '@/lib/progress';
+
+// Progressive analysis:
+//   POST { match_id, ... }         -> starts ai_match_analysis_v3, returns { execution_id }
+//   GET  ?execution_id=...         -> { stage, stats_text?, context?, decision?, persona?, partial?, text? }
+// The pipeline publishes the stats block, then the router decision and persona,
+// then the coaching text as it streams (`partial`), before the LLM has finished;
+// the page polls GET and renders each as it arrives.
+
+const TERMINAL_FAILURES = ['FAILED', 'KILLED', 'CANCELLED'];
+
+function kestraAuth() {
+  const kestraUser = process.env.KESTRA_USER;
+  const kestraPass = process.env.KESTRA_PASSWORD;
+  return Buffer.from(`${kestraUser}:${kestraPass}`).toString('base64');
+}
 
 export async function POST(request: Request) {
   const { match_id, player_name, agent_mode, manual_agent } = await request.json();
@@ -8,10 +24,7 @@ export async function POST(request: Request) {
   }
 
   const kestraUrl = process.env.KESTRA_URL;
-  // Force HMR refresh
-  const kestraUser = process.env.KESTRA_USER;
-  const kestraPass = process.env.KESTRA_PASSWORD;
-  const auth = Buffer.from(`${kestraUser}:${kestraPass}`).toString('base64');
+  const auth = kestraAuth();
 
   try {
     const formData = new FormData();
@@ -29,8 +42,8 @@ export async function POST(request: Request) {
       formData.append('manual_agent', manual_agent);
     }
 
-    // Trigger flow and wait
-    const triggerRes = await fetch(`${kestraUrl}/api/v1/executions/valorant/ai_match_analysis_v3?wait=true`, {
+    // Trigger flow; results are polled by execution id
+    const triggerRes = await fetch(`${kestraUrl}/api/v1/executions/valorant/ai_match_analysis_v3`, {
       method: 'POST',
       headers: {
         'Authorization': `Basic ${auth}`,
@@ -49,35 +62,58 @@ export async function POST(request: Request) {
     }
 
     const execution = await triggerRes.json();
+    return NextResponse.json({ execution_id: execution.id });
 
-    if (execution.state.current !== 'SUCCESS') {
-      return NextResponse.json({ error: 'Workflow failed', details: execution.state }, { status: 500 });
-    }
+  } catch (error: any) {
+    console.error(error);
+    return NextResponse.json({ error: error.message }, { status: 500 });
+  }
+}
+
+export async function GET(request: Request) {
+  const executionId = new URL(request.url).searchParams.get('execution_id');
+  if (!executionId) {
+    return NextResponse.json({ error: 'execution_id is required' }, { status: 400 });
+  }
 
-    // Find the task that generates the output
-    // We expect an output file 'analysis.json' containing { "text": "..." }
-    // Or we find a specific task output.
+  const kestraUrl = process.env.KESTRA_URL;
+  const auth = kestraAuth();
+
+  try {
+    // Artifacts published so far by the pipeline (optional: without the worker we just wait for the end)
+    const progress = await readProgress(executionId);
+    if (progress?.stage === 'failed') {
+      return NextResponse.json({ error: progress.error || 'Analysis failed' }, { status: 500 });
+    }
+    if (progress?.stage === 'done') {
+      return NextResponse.json(progress);
+    }
 
-    // Let's assume the flow outputs a file named 'analysis.json'
-    const taskRun = execution.taskRunList.find((tr: any) => tr.taskId === 'generate_insight');
-    if (!taskRun) {
-      return NextResponse.json({ error: 'Analysis task not found' }, { status: 500 });
+    const execRes = await fetch(`${kestraUrl}/api/v1/executions/${encodeURIComponent(executionId)}`, {
+      headers: { 'Authorization': `Basic ${auth}` },
+      cache: 'no-store',
+    });
+    if (!execRes.ok) {
+      return NextResponse.json({ error: 'Execution not found' }, { status: execRes.status });
     }
+    const execution = await execRes.json();
+    const state = execution.state?.current;
 
-    const outputUri = taskRun.outputs?.outputFiles?.['analysis.json'];
+    if (TERMINAL_FAILURES.includes(state)) {
+      return NextResponse.json({ error: 'Workflow failed', details: execution.state }, { status: 500 });
+    }
+    if (state !== 'SUCCESS') {
+      return NextResponse.json({ ...(progress || {}), stage: progress?.stage || 'queued' });
+    }
 
+    // The execution finished: analysis.json is the complete result
+    const taskRun = (execution.taskRunList || []).find((tr: any) => tr.taskId === 'generate_insight');
+    const outputUri = taskRun?.outputs?.outputFiles?.['analysis.json'];
     if (!outputUri) {
-      // Fallback: check if the task output itself has 'choices' (Plugin behavior)
-      if (taskRun.outputs?.choices && taskRun.outputs?.choices?.length > 0) {
-        const text = taskRun.outputs.choices[0].message.content;
-        return NextResponse.json({ text });
-      }
-
-      console.error('Task Outputs:', taskRun.outputs);
-      return NextResponse.json({ error: 'No analysis generated', outputs: taskRun.outputs }, { status: 500 });
+      console.error('Task Outputs:', taskRun?.outputs);
+      return NextResponse.json({ error: 'No analysis generated', outputs: taskRun?.outputs }, { status: 500 });
     }
 
-    // Fetch the file
     const fileRes = await fetch(`${kestraUrl}/api/v1/executions/${execution.id}/file?path=${encodeURIComponent(outputUri)}`, {
       headers: {
         'Authorization': `Basic ${auth}`,
@@ -90,8 +126,8 @@ export async function POST(request: Request) {
 
     const jsonText = await fileRes.text();
     try {
-      const data = JSON.parse(jsonText); // Expected { text: "Markdwon..." }
-      return NextResponse.json(data);
+      const data = JSON.parse(jsonText); // Expected { text: "Markdown...", context, decision, persona }
+      return NextResponse.json({ ...data, stage: 'done' });
     } catch (e) {
       return NextResponse.json({ error: 'Invalid JSON output' }, { status: 500 });
     }
@@ -1,24 +1,36 @@
-
 import { NextResponse } from 'next/server';
+import { readProgress } from '@/lib/progress';
 
-export async function POST(request: Request) {
-  const { message, context, history } = await request.json();
+// Chat turn, polled like the analysis:
+//   POST { message, match_id?, player_name?, session_id?, context? } -> starts ai_chat, returns { execution_id }
+//   GET  ?execution_id=...  -> { stage, partial? } while the coach writes, then reply.json with stage 'done'
 
-  const kestraUrl = process.env.KESTRA_URL;
+const TERMINAL_FAILURES = ['FAILED', 'KILLED', 'CANCELLED'];
+
+function kestraAuth() {
   const kestraUser = process.env.KESTRA_USER;
   const kestraPass = process.env.KESTRA_PASSWORD;
-  const auth = Buffer.from(`${kestraUser}:${kestraPass}`).toString('base64');
+  return Buffer.from(`${kestraUser}:${kestraPass}`).toString('base64');
+}
+
+export async function POST(request: Request) {
+  const { message, match_id, player_name, session_id, context } = await request.json();
+
+  const kestraUrl = process.env.KESTRA_URL;
+  const auth = kestraAuth();
 
   try {
+    // History and the formatting instruction live in the server-side session;
+    // the match context is only sent to open (or reopen) it
     const formData = new FormData();
-    // Inject formatting instruction
-    const systemInstruction = " (Respond using bullet points or lists. DO NOT use Markdown Tables.)";
-    formData.append('message', message + systemInstruction);
-    formData.append('context', JSON.stringify(context));
-    formData.append('history', JSON.stringify(history));
-
-    // Trigger flow and wait
-    const triggerRes = await fetch(`${kestraUrl}/api/v1/executions/valorant/ai_chat?wait=true`, {
+    formData.append('message', message);
+    formData.append('match_id', match_id || '');
+    formData.append('player_name', player_name || '');
+    formData.append('session_id', session_id || '');
+    if (context) formData.append('context', JSON.stringify(context));
+
+    // Trigger flow; the reply is polled by execution id
+    const triggerRes = await fetch(`${kestraUrl}/api/v1/executions/valorant/ai_chat`, {
       method: 'POST',
       headers: {
         'Authorization': `Basic ${auth}`,
@@ -29,9 +41,46 @@ export async function POST(request: Request) {
     if (!triggerRes.ok) throw new Error('Failed to contact AI Coach.');
 
     const execution = await triggerRes.json();
+    return NextResponse.json({ execution_id: execution.id });
+
+  } catch (error: any) {
+    return NextResponse.json({ error: error.message }, { status: 500 });
+  }
+}
+
+export async function GET(request: Request) {
+  const executionId = new URL(request.url).searchParams.get('execution_id');
+  if (!executionId) {
+    return NextResponse.json({ error: 'execution_id is required' }, { status: 400 });
+  }
+
+  const kestraUrl = process.env.KESTRA_URL;
+  const auth = kestraAuth();
+
+  try {
+    // The streamed reply so far (optional: without the worker we just wait for the end)
+    const progress = await readProgress(executionId);
+
+    const execRes = await fetch(`${kestraUrl}/api/v1/executions/${encodeURIComponent(executionId)}`, {
+      headers: { 'Authorization': `Basic ${auth}` },
+      cache: 'no-store',
+    });
+    if (!execRes.ok) {
+      return NextResponse.json({ error: 'Execution not found' }, { status: execRes.status });
+    }
+    const execution = await execRes.json();
+    const state = execution.state?.current;
+
+    if (TERMINAL_FAILURES.includes(state) || progress?.stage === 'failed') {
+      return NextResponse.json({ error: 'Workflow failed', details: progress?.error || execution.state }, { status: 500 });
+    }
+    if (state !== 'SUCCESS') {
+      // reply.json (session id, expiry) only exists once the execution ends; show the text meanwhile
+      return NextResponse.json({ stage: 'pending', partial: progress?.text || progress?.partial || '' });
+    }
 
     // Find output
-    const taskRun = execution.taskRunList.find((tr: any) => tr.taskId === 'generate_reply');
+    const taskRun = (execution.taskRunList || []).find((tr: any) => tr.taskId === 'generate_reply');
     const outputUri = taskRun?.outputs?.outputFiles?.['reply.json'];
 
     if (!outputUri) throw new Error('No reply generated.');
@@ -42,7 +91,7 @@ export async function POST(request: Request) {
     });
 
     const data = await fileRes.json();
-    return NextResponse.json(data);
+    return NextResponse.json({ ...data, stage: 'done' });
 
   } catch (error: any) {
     return NextResponse.json({ error: error.message }, { status: 500 });
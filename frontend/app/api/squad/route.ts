@@ -0,0 +1,80 @@
+import { NextResponse } from 'next/server';
+
+// Squad dashboard: POST { players: ["Name#Tag", ...] | "Name#Tag, Name#Tag", region? }
+// -> { players: [card...], squad: { shared_win_rate, members: { "Name#Tag": { together, apart } } }, shared_matches }
+
+export async function POST(request: Request) {
+  const { players, region } = await request.json();
+
+  const riotIds = (Array.isArray(players) ? players : String(players || '').split(','))
+    .map((id: string) => id.trim())
+    .filter(Boolean);
+
+  if (riotIds.length === 0) {
+    return NextResponse.json({ error: 'At least one Riot ID (Name#Tag) is required' }, { status: 400 });
+  }
+  const invalid = riotIds.filter((id: string) => !/^.+#.+$/.test(id));
+  if (invalid.length > 0) {
+    return NextResponse.json({ error: `Invalid Riot ID(s): ${invalid.join(', ')}` }, { status: 400 });
+  }
+
+  const kestraUrl = process.env.KESTRA_URL;
+  const kestraUser = process.env.KESTRA_USER;
+  const kestraPass = process.env.KESTRA_PASSWORD;
+  const auth = Buffer.from(`${kestraUser}:${kestraPass}`).toString('base64');
+
+  try {
+    const formData = new FormData();
+    formData.append('players', riotIds.join(', '));
+    formData.append('region', region || 'ap');
+
+    const triggerRes = await fetch(`${kestraUrl}/api/v1/executions/valorant/squad_dashboard?wait=true`, {
+      method: 'POST',
+      headers: {
+        'Authorization': `Basic ${auth}`,
+      },
+      body: formData,
+    });
+
+    if (!triggerRes.ok) {
+      const txt = await triggerRes.text();
+      console.error('Kestra Error:', txt);
+      return NextResponse.json({ error: 'Failed to trigger workflow' }, { status: triggerRes.status });
+    }
+
+    const execution = await triggerRes.json();
+
+    if (execution.state.current !== 'SUCCESS') {
+      return NextResponse.json({ error: 'Workflow failed', details: execution.state }, { status: 500 });
+    }
+
+    const taskRun = (execution.taskRunList || []).find((tr: any) => tr.taskId === 'process_squad');
+    const outputUri = taskRun?.outputs?.outputFiles?.['squad.json'];
+
+    if (!outputUri) {
+      console.error('Task Outputs:', taskRun?.outputs);
+      return NextResponse.json({ error: 'No squad.json generated', outputs: taskRun?.outputs }, { status: 500 });
+    }
+
+    const fileRes = await fetch(`${kestraUrl}/api/v1/executions/${execution.id}/file?path=${encodeURIComponent(outputUri)}`, {
+      headers: {
+        'Authorization': `Basic ${auth}`,
+      },
+    });
+
+    if (!fileRes.ok) {
+      return NextResponse.json({ error: 'Failed to read output file' }, { status: 500 });
+    }
+
+    const jsonText = await fileRes.text();
+    try {
+      return NextResponse.json(JSON.parse(jsonText));
+    } catch (e) {
+      return NextResponse.json({ error: 'Invalid JSON output from script', raw: jsonText }, { status: 500 });
+    }
+
+  } catch (error: any) {
+    console.error(error);
+    return NextResponse.json({ error: error.message }, { status: 500 });
+  }
+}
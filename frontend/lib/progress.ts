@@ -0,0 +1,17 @@
+// Progress records the analysis worker publishes per Kestra execution
+// (GET /progress/<execution_id> on the worker): the stage reached so far plus its
+// artifacts, including the text streamed so far (`partial`) while the LLM writes.
+// Optional: without a reachable worker this returns null and callers wait for the execution.
+
+export async function readProgress(executionId: string) {
+  const workerUrl = process.env.ANALYSIS_WORKER_URL || 'http://localhost:8790';
+  try {
+    const res = await fetch(`${workerUrl}/progress/${encodeURIComponent(executionId)}`, {
+      cache: 'no-store',
+      signal: AbortSignal.timeout(2000),
+    });
+    return res.ok ? await res.json() : null;
+  } catch (e) {
+    return null;
+  }
+}
@@ -0,0 +1,247 @@
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+from contextlib import redirect_stdout, contextmanager
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'scripts')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# Keep the scripts' on-disk side effects (memo, percentile store, trace) out of the timings
+os.environ.setdefault('BUILD_MEMO_DIR', '')
+os.environ.setdefault('PERCENTILE_DB', '')
+os.environ.setdefault('TRACE_ENABLED', 'false')
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic_match
+import ai_prompt_builder
+import analyze_context
+import dashboard_parser
+import match_analyzer
+import match_stream
+import percentiles
+
+# Micro-benchmarks for the metric scripts on synthetic HenrikDev payloads.
+# Every metric function and the full scripts' main() are timed per scenario;
+# results (throughput, latency percentiles, peak traced memory) are written
+# as JSON under bench/results/ and two result files can be compared.
+
+SCENARIOS = {
+    "regular": {"rounds": 24, "kill_density": 1.0, "players": 10},
+    "stomp": {"rounds": 13, "kill_density": 1.0, "players": 10},
+    "overtime": {"rounds": 52, "kill_density": 1.0, "players": 10},
+    "dense": {"rounds": 24, "kill_density": 1.6, "players": 10},
+    "sparse": {"rounds": 24, "kill_density": 0.5, "players": 10}
+}
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    i = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[i]
+
+def measure(fn, min_time=0.5, min_calls=5, max_calls=10000):
+    """Times fn() until min_time has elapsed (at least min_calls). Latencies in microseconds."""
+    fn() # warmup
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_calls and (len(samples) < min_calls or time.perf_counter() < deadline):
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - t0) / 1000)
+    samples.sort()
+
+    # Peak memory from one separate traced call (tracing slows the timed calls)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(samples)
+    return {
+        "calls": len(samples),
+        "mean_us": round(total / len(samples), 1),
+        "p50_us": round(percentile(samples, 0.50), 1),
+        "p90_us": round(percentile(samples, 0.90), 1),
+        "p99_us": round(percentile(samples, 0.99), 1),
+        "ops_per_sec": round(len(samples) / (total / 1e6), 1) if total else 0,
+        "peak_kb": round(peak / 1024, 1)
+    }
+
+@contextmanager
+def workdir(files):
+    """Temporary cwd holding the given {filename: payload} files, as a Kestra task would see them."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, payload in files.items():
+            with open(os.path.join(tmp, name), 'w') as f:
+                json.dump(payload, f)
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+def quiet(fn):
+    """Runs a script main() with its stdout discarded."""
+    def run():
+        with redirect_stdout(io.StringIO()):
+            try:
+                fn()
+            except SystemExit:
+                pass
+    return run
+
+def function_benchmarks(payload):
+    """(name, fn) pairs for each metric function on one parsed v2 payload."""
+    match = payload['data']
+    players = match['players']['all_players']
+    rounds = match['rounds']
+    target = players[0]
+    puuid, team = target['puuid'], target['team']
+    index = ai_prompt_builder.build_match_index(players, rounds)
+    batch = ai_prompt_builder.calculate_combat_batch(index)
+    timeline = ai_prompt_builder.build_round_timeline(index)
+    rounds_played = match['metadata']['rounds_played']
+    _, minified = ai_prompt_builder.build_outputs(payload, target['name'].lower())
+
+    return [
+        ("build_match_index", lambda: ai_prompt_builder.build_match_index(players, rounds)),
+        ("calculate_first_bloods", lambda: ai_prompt_builder.calculate_first_bloods(index, puuid)),
+        ("build_round_timeline", lambda: ai_prompt_builder.build_round_timeline(index)),
+        ("calculate_clutches", lambda: ai_prompt_builder.calculate_clutches(index, puuid, timeline)),
+        ("calculate_combat_batch", lambda: ai_prompt_builder.calculate_combat_batch(index)),
+        ("calculate_advanced_combat", lambda: ai_prompt_builder.calculate_advanced_combat(index, puuid, team, batch, timeline)),
+        ("calculate_positioning", lambda: ai_prompt_builder.calculate_positioning(index, puuid, batch)),
+        ("calculate_advanced_economy", lambda: ai_prompt_builder.calculate_advanced_economy(index, puuid, team)),
+        ("get_economy_start", lambda: ai_prompt_builder.get_economy_start(index, puuid)),
+        ("get_simple_player_stats", lambda: [ai_prompt_builder.get_simple_player_stats(p, rounds_played) for p in players]),
+        ("build_outputs", lambda: ai_prompt_builder.build_outputs(payload, target['name'].lower())),
+        ("encode_prompt_data.compact", lambda: ai_prompt_builder.encode_prompt_data(minified, 0, 'compact')),
+        ("analyze_context.decide", lambda: analyze_context.decide(minified)),
+        ("percentiles.match_samples", lambda: percentiles.match_samples(match)),
+        ("dashboard_parser.summarize_match", lambda: dashboard_parser.summarize_match(match, target['name'], target['tag']))
+    ]
+
+def run_scenario(options, seed, min_time):
+    payload = synthetic_match.v2_match(seed, **options)
+    matches = synthetic_match.v3_match_list(seed, 10, **options)
+    target = payload['data']['players']['all_players'][0]
+    results = {}
+
+    for fn_name, fn in function_benchmarks(payload):
+        results[fn_name] = measure(fn, min_time)
+
+    # Parsing, from the file the tasks receive
+    with workdir({'match_data.json': payload}) as tmp:
+        path = os.path.join(tmp, 'match_data.json')
+        results["json.load"] = measure(lambda: dashboard_parser.load_json(path), min_time)
+        results["match_stream.load_projected"] = measure(lambda: match_stream.load_projected(path), min_time)
+    with workdir({'matches.json': matches}) as tmp:
+        path = os.path.join(tmp, 'matches.json')
+        results["dashboard_parser.load_match_list"] = measure(lambda: dashboard_parser.load_match_list(path), min_time)
+
+    # Full scripts, each in a task-like working directory
+    os.environ['TARGET_PLAYER'] = target['name'].lower()
+    os.environ['TARGET_NAME'] = target['name']
+    os.environ['TARGET_TAG'] = target['tag']
+    with workdir({'match_data.json': payload}):
+        results["ai_prompt_builder.main"] = measure(quiet(ai_prompt_builder.main), min_time)
+    with workdir({'match_detail.json': payload}):
+        results["match_analyzer.main"] = measure(quiet(match_analyzer.main), min_time)
+    with workdir({'account.json': synthetic_match.v1_account(), 'mmr.json': synthetic_match.v1_mmr(), 'matches.json': matches}):
+        results["dashboard_parser.main"] = measure(quiet(dashboard_parser.main), min_time)
+
+    return {
+        "options": options,
+        "payload_bytes": len(json.dumps(payload)),
+        "results": results
+    }
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or 'unknown'
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+
+def print_report(report):
+    for scenario, data in report['scenarios'].items():
+        print(f"\n[{scenario}] {data['options']} payload={data['payload_bytes'] // 1024} KB")
+        print(f"  {'benchmark':<36}{'p50 us':>11}{'p90 us':>11}{'p99 us':>11}{'ops/s':>11}{'peak KB':>10}")
+        for name, r in data['results'].items():
+            print(f"  {name:<36}{r['p50_us']:>11}{r['p90_us']:>11}{r['p99_us']:>11}{r['ops_per_sec']:>11}{r['peak_kb']:>10}")
+
+def compare(base_path, head_path, threshold):
+    """Prints p50 / peak memory deltas between two result files; returns the number of regressions."""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+    print(f"base {base['meta']['commit']} -> head {head['meta']['commit']} (threshold {threshold:.0%})")
+    regressions = 0
+    for scenario, data in head['scenarios'].items():
+        base_results = base['scenarios'].get(scenario, {}).get('results', {})
+        print(f"\n[{scenario}]")
+        print(f"  {'benchmark':<36}{'base p50':>11}{'head p50':>11}{'delta':>9}{'peak KB':>18}")
+        for name, r in data['results'].items():
+            b = base_results.get(name)
+            if not b:
+                print(f"  {name:<36}{'-':>11}{r['p50_us']:>11}{'new':>9}")
+                continue
+            delta = (r['p50_us'] - b['p50_us']) / b['p50_us'] if b['p50_us'] else 0
+            flag = ''
+            if delta > threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"  {name:<36}{b['p50_us']:>11}{r['p50_us']:>11}{delta:>+9.1%}{b['peak_kb']:>9}->{r['peak_kb']:<8}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the kestra metric scripts on synthetic payloads")
+    sub = parser.add_subparsers(dest='command')
+    run = sub.add_parser('run', help="run the suite (default)")
+    run.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="repeatable; default: all")
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--min-time', type=float, default=0.5, help="seconds per benchmark")
+    run.add_argument('-o', '--output', help="result file (default: results/<commit>.json)")
+    cmp = sub.add_parser('compare', help="compare two result files")
+    cmp.add_argument('base')
+    cmp.add_argument('head')
+    cmp.add_argument('--threshold', type=float, default=0.10, help="p50 slowdown flagged as a regression")
+    args = parser.parse_args(sys.argv[1:] or ['run'])
+
+    if args.command == 'compare':
+        sys.exit(1 if compare(args.base, args.head, args.threshold) else 0)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": int(time.time()),
+            "seed": args.seed,
+            "min_time": args.min_time
+        },
+        "scenarios": {}
+    }
+    for scenario in args.scenario or list(SCENARIOS):
+        report['scenarios'][scenario] = run_scenario(SCENARIOS[scenario], args.seed, args.min_time)
+
+    print_report(report)
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+if __name__ == "__main__":
+    main()
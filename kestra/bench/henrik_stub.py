@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'scripts')
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic_match
+
+# Local stand-in for the HenrikDev API that enforces a rate limit.
+# `serve` answers the endpoints the flows use with synthetic payloads, counts
+# requests per API key in a fixed window, sends x-ratelimit-* headers and
+# returns 429 once the window is spent. `load` starts a stub, runs several
+# processes hammering it through henrik_client (interactive + background,
+# with duplicate URLs) and reports upstream 429s, coalesced requests and the
+# wait per priority.
+
+class Limiter:
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.hits = {}
+        self.rejected = 0
+
+    def check(self, key, path):
+        """Returns (allowed, remaining, reset seconds)."""
+        now = time.time()
+        with self.lock:
+            start, count = self.windows.get(key, (now, 0))
+            if now - start >= self.window:
+                start, count = now, 0
+            allowed = count < self.limit
+            if allowed:
+                count += 1
+                self.hits[path] = self.hits.get(path, 0) + 1
+            else:
+                self.rejected += 1
+            self.windows[key] = (start, count)
+            return allowed, self.limit - count, max(0, int(start + self.window - now + 0.999))
+
+def make_handler(limiter, latency):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, body, headers):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, str(v))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path == '/stats':
+                return self._send(200, {"hits": limiter.hits, "rejected": limiter.rejected}, {})
+            allowed, remaining, reset = limiter.check(self.headers.get('Authorization', ''), path)
+            headers = {"x-ratelimit-limit": limiter.limit, "x-ratelimit-remaining": remaining, "x-ratelimit-reset": reset}
+            if not allowed:
+                return self._send(429, {"status": 429, "errors": [{"message": "Rate limit reached"}]}, dict(headers, **{"Retry-After": reset}))
+            time.sleep(latency)
+
+            parts = path.strip('/').split('/')
+            if parts[1:3] == ['v1', 'account']:
+                body = synthetic_match.v1_account()
+            elif parts[1:3] == ['v1', 'mmr']:
+                body = synthetic_match.v1_mmr()
+            elif parts[1:3] == ['v2', 'match']:
+                body = synthetic_match.v2_match(sum(map(ord, parts[-1])))
+            elif parts[1:3] == ['v3', 'matches']:
+                body = synthetic_match.v3_match_list(sum(map(ord, parts[-1])), 5)
+            else:
+                return self._send(404, {"status": 404, "errors": [{"message": "Not found"}]}, headers)
+            self._send(200, body, headers)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+def serve(port, limit, window, latency):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(Limiter(limit, window), latency))
+    print(f"HenrikDev stub on http://127.0.0.1:{port} ({limit} req / {window:g}s per key)", flush=True)
+    server.serve_forever()
+
+WORKER = """
+import os, sys, json, time
+sys.path.insert(0, {scripts!r})
+import henrik_client
+url, paths, priority = sys.argv[1], json.loads(sys.argv[2]), henrik_client.PRIORITIES[sys.argv[3]]
+out = []
+for path in paths:
+    t0 = time.time()
+    r = henrik_client.get(url + path, 'stub-key', priority=priority)
+    out.append({{"status": r.status, "source": r.source, "ms": int((time.time() - t0) * 1000)}})
+print(json.dumps(out))
+"""
+
+def load(port, limit, window, processes, requests):
+    """Runs `processes` clients (half background) against a fresh stub and prints the outcome."""
+    env = dict(os.environ, HENRIK_STATE_DIR=tempfile.mkdtemp(prefix='henrik_state_'), TRACE_ENABLED='false',
+               HENRIK_RATE_LIMIT=str(limit), HENRIK_RATE_WINDOW_SEC=str(window))
+    stub = subprocess.Popen([sys.executable, __file__, 'serve', '--port', str(port), '--limit', str(limit),
+                             '--window', str(window)], stdout=subprocess.PIPE)
+    stub.stdout.readline()
+    url = f"http://127.0.0.1:{port}"
+    try:
+        workers = []
+        start = time.time()
+        for i in range(processes):
+            priority = 'interactive' if i % 2 == 0 else 'background'
+            # Every client asks for the same profile, plus its own matches
+            paths = ["/valorant/v1/account/WorstJett/1000"] + [f"/valorant/v2/match/m{i}-{n}" for n in range(requests - 1)]
+            workers.append((priority, subprocess.Popen(
+                [sys.executable, '-c', WORKER.format(scripts=SCRIPTS_DIR), url, json.dumps(paths), priority],
+                stdout=subprocess.PIPE, env=env, text=True
+            )))
+        by_priority = {}
+        for priority, proc in workers:
+            out, _ = proc.communicate()
+            by_priority.setdefault(priority, []).extend(json.loads(out))
+        elapsed = time.time() - start
+
+        import urllib.request
+        with urllib.request.urlopen(url + '/stats') as res:
+            stats = json.loads(res.read())
+    finally:
+        stub.terminate()
+
+    print(f"{processes} clients x {requests} requests in {elapsed:.1f}s against {limit} req / {window:g}s")
+    print(f"upstream: {sum(stats['hits'].values())} served, {stats['rejected']} rejected (429), "
+          f"profile fetched {stats['hits'].get('/valorant/v1/account/WorstJett/1000', 0)}x")
+    for priority, results in sorted(by_priority.items()):
+        ms = sorted(r['ms'] for r in results)
+        failed = sum(1 for r in results if r['status'] != 200)
+        coalesced = sum(1 for r in results if r['source'] == 'COALESCED')
+        print(f"  {priority:<12} {len(results)} requests, {failed} failed, {coalesced} coalesced, "
+              f"p50 {ms[len(ms) // 2]} ms, max {ms[-1]} ms")
+    return stats['rejected']
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate-limited HenrikDev API stub")
+    sub = parser.add_subparsers(dest='command')
+    for name in ('serve', 'load'):
+        p = sub.add_parser(name)
+        p.add_argument('--port', type=int, default=8799)
+        p.add_argument('--limit', type=int, default=10, help="requests per window per key")
+        p.add_argument('--window', type=float, default=5.0, help="window length in seconds")
+    sub.choices['serve'].add_argument('--latency', type=float, default=0.05, help="seconds per response")
+    sub.choices['load'].add_argument('--processes', type=int, default=6)
+    sub.choices['load'].add_argument('--requests', type=int, default=4, help="per process")
+    args = parser.parse_args(sys.argv[1:] or ['load'])
+
+    if args.command == 'serve':
+        serve(args.port, args.limit, args.window, args.latency)
+    else:
+        sys.exit(1 if load(args.port, args.limit, args.window, args.processes, args.requests) else 0)
+
+if __name__ == "__main__":
+    main()
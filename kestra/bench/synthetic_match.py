@@ -0,0 +1,294 @@
+import sys
+import json
+import random
+import argparse
+
+# Deterministic, HenrikDev-shaped synthetic payloads for benchmarking the
+# metric scripts: v2 match detail (/valorant/v2/match/{id}), v3 match lists
+# (/valorant/v3/matches/...), plus the v1 account / mmr bodies the dashboard
+# reads. The same seed and options always produce the same bytes.
+
+AGENTS = ["Jett", "Reyna", "Raze", "Phoenix", "Neon", "Sova", "Fade", "Skye", "Breach", "KAY/O",
+          "Omen", "Brimstone", "Viper", "Astra", "Harbor", "Killjoy", "Cypher", "Sage", "Chamber", "Deadlock"]
+MAPS = ["Ascent", "Bind", "Haven", "Split", "Lotus", "Sunset", "Icebox", "Breeze"]
+TIERS = ["Iron", "Bronze", "Silver", "Gold", "Platinum", "Diamond", "Ascendant", "Immortal"]
+WEAPONS = ["Vandal", "Phantom", "Operator", "Sheriff", "Spectre", "Ghost", "Guardian", "Classic"]
+LOADOUTS = [800, 1600, 2400, 3900, 4700, 5400]
+SITES = ["A", "B", "C"]
+
+TARGET_NAME = "WorstJett"
+TARGET_TAG = "1000"
+
+def score_split(rounds):
+    """Final (winner, loser) round counts for a match of `rounds` rounds (13-0 up to long overtime)."""
+    if rounds <= 24:
+        return 13, max(0, rounds - 13)
+    # Overtime is won by two clear rounds
+    return rounds // 2 + 1, rounds - (rounds // 2 + 1)
+
+def make_player(rng, i, team, tier, match_seed):
+    name, tag = (TARGET_NAME, TARGET_TAG) if i == 0 else (f"Player{match_seed % 97}x{i}", f"{1000 + i}")
+    return {
+        "puuid": f"puuid-{match_seed}-{i}",
+        "name": name,
+        "tag": tag,
+        "team": team,
+        "level": rng.randint(20, 400),
+        "character": rng.choice(AGENTS),
+        "currenttier": TIERS.index(tier) * 3 + 3,
+        "currenttier_patched": f"{tier} {rng.randint(1, 3)}",
+        "player_card": f"card-{i}",
+        "player_title": f"title-{i}",
+        "party_id": f"party-{match_seed}-{i % 3}",
+        "session_playtime": {"minutes": rng.randint(20, 50), "seconds": 0, "milliseconds": 0},
+        "behavior": {"afk_rounds": 0, "friendly_fire": {"incoming": 0, "outgoing": 0}, "rounds_in_spawn": 0},
+        "platform": {"type": "PC", "os": {"name": "Windows", "version": "10.0.19045.1.256.64bit"}},
+        "ability_casts": {"c_cast": 0, "q_cast": 0, "e_cast": 0, "x_cast": 0},
+        "assets": {
+            "card": {"small": "https://media.example/card/small.png", "large": "https://media.example/card/large.png", "wide": "https://media.example/card/wide.png"},
+            "agent": {"small": "https://media.example/agent/small.png", "bust": "https://media.example/agent/bust.png", "full": "https://media.example/agent/full.png", "killfeed": "https://media.example/agent/killfeed.png"}
+        },
+        "stats": {"score": 0, "kills": 0, "deaths": 0, "assists": 0, "bodyshots": 0, "headshots": 0, "legshots": 0},
+        "economy": {"spent": {"overall": 0, "average": 0}, "loadout_value": {"overall": 0, "average": 0}},
+        "damage_made": 0,
+        "damage_received": 0
+    }
+
+def location(rng):
+    return {"x": rng.randint(-8000, 8000), "y": rng.randint(-8000, 8000)}
+
+def generate_match(seed, rounds=24, kill_density=1.0, players=10, mode="Competitive"):
+    """
+    One v2 match `data` document.
+    rounds: total rounds played (13+; above 24 is overtime).
+    kill_density: scales kills per round (1.0 ~ 7 kills per round, capped by who is alive).
+    players: total players, split evenly between Red and Blue.
+    """
+    rng = random.Random(seed)
+    tier = rng.choice(TIERS)
+    roster = [make_player(rng, i, "Red" if i < players // 2 else "Blue", tier, seed) for i in range(players)]
+    by_team = {"Red": [p for p in roster if p["team"] == "Red"], "Blue": [p for p in roster if p["team"] == "Blue"]}
+
+    win_count, lose_count = score_split(rounds)
+    winner = rng.choice(["Red", "Blue"])
+    loser = "Blue" if winner == "Red" else "Red"
+    # Shuffle round winners but keep the match-winning round last
+    order = [winner] * (win_count - 1) + [loser] * lose_count
+    rng.shuffle(order)
+    order.append(winner)
+
+    all_kills = []
+    round_docs = []
+    match_time = 0
+    for r, round_winner in enumerate(order):
+        round_loser = "Blue" if round_winner == "Red" else "Red"
+        alive = {p["puuid"]: p for p in roster}
+        stats = {}
+        for p in roster:
+            loadout = rng.choice(LOADOUTS)
+            casts = {k: rng.randint(0, 2) for k in ("c_casts", "q_casts", "e_casts")}
+            casts["x_casts"] = 1 if rng.random() < 0.1 else 0
+            stats[p["puuid"]] = {
+                "ability_casts": casts,
+                "player_puuid": p["puuid"],
+                "player_display_name": f"{p['name']}#{p['tag']}",
+                "player_team": p["team"],
+                "damage_events": [],
+                "damage": 0,
+                "bodyshots": 0,
+                "headshots": 0,
+                "legshots": 0,
+                "kill_events": [],
+                "kills": 0,
+                "score": 0,
+                "economy": {
+                    "loadout_value": loadout,
+                    "weapon": {"id": "w", "name": rng.choice(WEAPONS), "assets": {"display_icon": "https://media.example/weapon.png"}},
+                    "armor": {"id": "a", "name": "Heavy Shields", "assets": {"display_icon": "https://media.example/armor.png"}},
+                    "remaining": rng.randint(0, 4000),
+                    "spent": min(loadout, rng.randint(0, 4500))
+                },
+                "was_afk": False,
+                "was_penalized": False,
+                "stayed_in_spawn": False
+            }
+
+        # Kills until one side is wiped (loser first) or the budget runs out
+        budget = max(1, int(round(rng.uniform(4, 10) * kill_density)))
+        t = rng.randint(3000, 20000)
+        for _ in range(budget):
+            if not any(p["team"] == round_loser for p in alive.values()):
+                break
+            victim_team = round_loser if rng.random() < 0.62 else round_winner
+            victims = [p for p in alive.values() if p["team"] == victim_team]
+            killers = [p for p in alive.values() if p["team"] != victim_team]
+            # Never wipe the round winner
+            if not victims or not killers or (victim_team == round_winner and len(victims) == 1):
+                continue
+            victim, killer = rng.choice(victims), rng.choice(killers)
+            t += rng.randint(150, 12000)
+            hits = rng.randint(1, 5)
+            head = rng.randint(0, hits)
+            damage = rng.randint(100, 180)
+            kill = {
+                "kill_time_in_round": t,
+                "kill_time_in_match": match_time + t,
+                "killer_puuid": killer["puuid"],
+                "killer_display_name": f"{killer['name']}#{killer['tag']}",
+                "killer_team": killer["team"],
+                "victim_puuid": victim["puuid"],
+                "victim_display_name": f"{victim['name']}#{victim['tag']}",
+                "victim_team": victim["team"],
+                "victim_death_location": location(rng),
+                "damage_weapon_id": "w",
+                "damage_weapon_name": rng.choice(WEAPONS),
+                "damage_weapon_assets": {"display_icon": "https://media.example/weapon.png", "killfeed_icon": "https://media.example/killfeed.png"},
+                "secondary_fire_mode": False,
+                "player_locations_on_kill": [
+                    {"player_puuid": p["puuid"], "player_display_name": p["name"], "player_team": p["team"],
+                     "location": location(rng), "view_radians": round(rng.uniform(0, 6.28), 3)}
+                    for p in alive.values()
+                ],
+                "assistants": []
+            }
+            ks = stats[killer["puuid"]]
+            ks["kill_events"].append(kill)
+            ks["kills"] += 1
+            ks["score"] += 150 + damage
+            ks["damage"] += damage
+            ks["headshots"] += head
+            ks["bodyshots"] += hits - head
+            ks["damage_events"].append({
+                "receiver_puuid": victim["puuid"], "receiver_display_name": victim["name"], "receiver_team": victim["team"],
+                "bodyshots": hits - head, "damage": damage, "headshots": head, "legshots": 0
+            })
+            all_kills.append(dict(kill, round=r))
+            victim["stats"]["deaths"] += 1
+            victim["damage_received"] += damage
+            del alive[victim["puuid"]]
+
+        planted = rng.random() < 0.5
+        plant_time = rng.randint(20000, 60000)
+        planter = rng.choice(by_team[round_winner])
+        defused = planted and rng.random() < 0.25
+        round_docs.append({
+            "winning_team": round_winner,
+            "end_type": "Bomb defused" if defused else ("Bomb detonated" if planted else "Eliminated"),
+            "bomb_planted": planted,
+            "bomb_defused": defused,
+            "plant_events": {
+                "plant_location": location(rng) if planted else None,
+                "planted_by": {"puuid": planter["puuid"], "display_name": planter["name"], "team": planter["team"]} if planted else None,
+                "plant_site": rng.choice(SITES) if planted else None,
+                "plant_time_in_round": plant_time if planted else 0,
+                "player_locations_on_plant": [{"player_puuid": p["puuid"], "location": location(rng)} for p in roster] if planted else None
+            },
+            "defuse_events": {
+                "defuse_location": location(rng) if defused else None,
+                "defused_by": {"puuid": planter["puuid"], "display_name": planter["name"], "team": planter["team"]} if defused else None,
+                "defuse_time_in_round": plant_time + 30000 if defused else 0,
+                "player_locations_on_defuse": None
+            },
+            "player_stats": list(stats.values())
+        })
+        match_time += 100000
+
+        # Roll the round into the match totals
+        for p in roster:
+            ps = stats[p["puuid"]]
+            totals = p["stats"]
+            totals["score"] += ps["score"]
+            totals["kills"] += ps["kills"]
+            totals["headshots"] += ps["headshots"]
+            totals["bodyshots"] += ps["bodyshots"]
+            totals["legshots"] += ps["legshots"]
+            p["damage_made"] += ps["damage"]
+            p["economy"]["spent"]["overall"] += ps["economy"]["spent"]
+            p["economy"]["loadout_value"]["overall"] += ps["economy"]["loadout_value"]
+            for key in ("c", "q", "e", "x"):
+                p["ability_casts"][f"{key}_cast"] += ps["ability_casts"][f"{key}_casts"]
+
+    n = len(order)
+    for p in roster:
+        p["stats"]["assists"] = rng.randint(0, n // 3)
+        p["economy"]["spent"]["average"] = p["economy"]["spent"]["overall"] // n
+        p["economy"]["loadout_value"]["average"] = p["economy"]["loadout_value"]["overall"] // n
+
+    rounds_won = {winner: win_count, loser: lose_count}
+    return {
+        "metadata": {
+            "map": rng.choice(MAPS),
+            "game_version": "release-09.00-shipping-1-0000000",
+            "game_length": n * 100000,
+            "game_start": 1700000000 + seed * 3600,
+            "game_start_patched": "Tuesday, November 14, 2023 10:13 PM",
+            "rounds_played": n,
+            "mode": mode,
+            "mode_id": mode.lower(),
+            "queue": "Standard",
+            "season_id": "season",
+            "platform": "PC",
+            "matchid": f"synthetic-{seed:08d}-{n}r",
+            "premier_info": {"tournament_id": None, "matchup_id": None},
+            "region": "ap",
+            "cluster": "Singapore"
+        },
+        "players": {"all_players": roster, "red": by_team["Red"], "blue": by_team["Blue"]},
+        "observers": [],
+        "coaches": [],
+        "teams": {
+            team.lower(): {"has_won": team == winner, "rounds_won": rounds_won[team], "rounds_lost": rounds_won["Blue" if team == "Red" else "Red"],
+                           "roster": None}
+            for team in ("Red", "Blue")
+        },
+        "rounds": round_docs,
+        "kills": all_kills
+    }
+
+def v2_match(seed, **options):
+    """Body of /valorant/v2/match/{id}."""
+    return {"status": 200, "data": generate_match(seed, **options)}
+
+def v3_match_list(seed, size=10, **options):
+    """Body of /valorant/v3/matches/{region}/{name}/{tag}?size=N (newest first, target player in every match)."""
+    matches = [generate_match(seed * 1000 + i, **options) for i in range(size)]
+    matches.sort(key=lambda m: m["metadata"]["game_start"], reverse=True)
+    return {"status": 200, "data": matches}
+
+def v1_account():
+    return {"status": 200, "data": {"puuid": "puuid-target", "region": "ap", "account_level": 187, "name": TARGET_NAME, "tag": TARGET_TAG,
+                                    "card": {"small": "https://media.example/card/small.png"}, "last_update": "now"}}
+
+def v1_mmr():
+    return {"status": 200, "data": {"currenttier": 14, "currenttierpatched": "Gold 2", "ranking_in_tier": 55, "mmr_change_to_last_game": 18, "elo": 1255}}
+
+def main():
+    parser = argparse.ArgumentParser(description="Write seeded synthetic HenrikDev payloads")
+    parser.add_argument('kind', choices=['v2', 'v3', 'account', 'mmr'])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=24)
+    parser.add_argument('--kill-density', type=float, default=1.0)
+    parser.add_argument('--players', type=int, default=10)
+    parser.add_argument('--mode', default='Competitive')
+    parser.add_argument('--size', type=int, default=10, help="matches in a v3 list")
+    parser.add_argument('-o', '--output', help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    options = {"rounds": args.rounds, "kill_density": args.kill_density, "players": args.players, "mode": args.mode}
+    if args.kind == 'v2':
+        payload = v2_match(args.seed, **options)
+    elif args.kind == 'v3':
+        payload = v3_match_list(args.seed, args.size, **options)
+    elif args.kind == 'account':
+        payload = v1_account()
+    else:
+        payload = v1_mmr()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(payload, f)
+    else:
+        json.dump(payload, sys.stdout)
+
+if __name__ == "__main__":
+    main()
@@ -41,6 +41,96 @@ curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/analyz
   -F "fileContent=@scripts/analyze_context.py" \
   --user "$USER"
 
+echo -e "\nUploading henrik_client.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/henrik_client.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/henrik_client.py" \
+  --user "$USER"
+
+echo -e "\nUploading match_store.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/match_store.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/match_store.py" \
+  --user "$USER"
+
+echo -e "\nUploading match_stream.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/match_stream.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/match_stream.py" \
+  --user "$USER"
+
+echo -e "\nUploading http_client.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/http_client.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/http_client.py" \
+  --user "$USER"
+
+echo -e "\nUploading match_history.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/match_history.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/match_history.py" \
+  --user "$USER"
+
+echo -e "\nUploading percentiles.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/percentiles.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/percentiles.py" \
+  --user "$USER"
+
+echo -e "\nUploading tracing.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/tracing.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/tracing.py" \
+  --user "$USER"
+
+echo -e "\nUploading chat_session.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/chat_session.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/chat_session.py" \
+  --user "$USER"
+
+echo -e "\nUploading batch_analysis.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/batch_analysis.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/batch_analysis.py" \
+  --user "$USER"
+
+echo -e "\nUploading analysis_pipeline.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/analysis_pipeline.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/analysis_pipeline.py" \
+  --user "$USER"
+
+echo -e "\nUploading analysis_worker.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/analysis_worker.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/analysis_worker.py" \
+  --user "$USER"
+
+echo -e "\nUploading worker_client.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/worker_client.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/worker_client.py" \
+  --user "$USER"
+
+echo -e "\nUploading progress.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/progress.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/progress.py" \
+  --user "$USER"
+
+echo -e "\nUploading prewarm.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/prewarm.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/prewarm.py" \
+  --user "$USER"
+
+echo -e "\nUploading squad_dashboard.py..."
+curl -X POST "$KESTRA_URL/api/v1/namespaces/$NAMESPACE/files?path=scripts/squad_dashboard.py" \
+  -H "Content-Type: multipart/form-data" \
+  -F "fileContent=@scripts/squad_dashboard.py" \
+  --user "$USER"
+
 # Upload Prompts
 PROMPTS=("standard.txt" "tactical.txt" "mental.txt" "validator.txt" "backpack.txt")
 mkdir -p prompts # Ensure dir exists locally just in case, though it should be mapped
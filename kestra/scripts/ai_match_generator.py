@@ -1,8 +1,301 @@
 import os
 import sys
 import json
-import requests
+import time
+import fcntl
+import hashlib
 import argparse
+import http_client
+import task_outputs
+import tracing
+from contextlib import contextmanager
+
+# Response Cache
+# Identical (model, prompt) pairs reuse a previous generation. Concurrent identical
+# requests are coalesced: the first one holds a per-key file lock while generating,
+# the others block on it and then read its result. Empty LLM_CACHE_DIR disables it.
+CACHE_DIR = os.environ.get('LLM_CACHE_DIR', '')
+CACHE_TTL_SEC = int(os.environ.get('LLM_CACHE_TTL_SEC', '86400'))
+CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '500'))
+
+# Streaming
+# With LLM_STREAM on, text is appended to LLM_STREAM_FILE as Ollama's NDJSON chunks arrive
+# (empty: no file), and the text so far is handed to the caller's on_text callback at most
+# every LLM_STREAM_PUBLISH_SEC (the pipeline publishes it as the execution's progress).
+STREAM = os.environ.get('LLM_STREAM', '').lower() in ('1', 'true', 'yes')
+STREAM_FILE = os.environ.get('LLM_STREAM_FILE', 'analysis.partial.txt')
+STREAM_PUBLISH_SEC = float(os.environ.get('LLM_STREAM_PUBLISH_SEC', '0.25'))
+
+def cache_key(model, prompt):
+    return hashlib.sha256(f"{model}\0{prompt}".encode('utf-8')).hexdigest()
+
+def cache_get(key):
+    path = os.path.join(CACHE_DIR, f"{key}.json")
+    try:
+        with open(path, 'r') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get('created', 0) > CACHE_TTL_SEC:
+        drop_entry(key)
+        return None
+    return entry.get('text')
+
+def cache_put(key, text):
+    path = os.path.join(CACHE_DIR, f"{key}.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({"created": time.time(), "text": text}, f)
+    os.replace(tmp, path)
+    prune_cache()
+
+def drop_entry(key):
+    """
+    Deletes a response and its lock file while holding that lock.
+    Skipped (returns False) while a generation for the key holds it.
+    """
+    lock_path = os.path.join(CACHE_DIR, f"{key}.lock")
+    with open(lock_path, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            for path in (os.path.join(CACHE_DIR, f"{key}.json"), lock_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return True
+
+def prune_cache():
+    """Drops expired responses, then keeps at most CACHE_MAX_ENTRIES, oldest first (lock files included)."""
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith('.json') and name != 'stats.json':
+            try:
+                entries.append((os.path.getmtime(os.path.join(CACHE_DIR, name)), name[:-len('.json')]))
+            except OSError:
+                continue
+    entries.sort()
+    expired = time.time() - CACHE_TTL_SEC
+    excess = len(entries) - CACHE_MAX_ENTRIES
+    for i, (mtime, key) in enumerate(entries):
+        if mtime >= expired and i >= excess:
+            break
+        drop_entry(key)
+
+STAT_KEYS = {"HIT": "hits", "MISS": "misses", "COALESCED": "coalesced"}
+
+def record_stat(status):
+    """Bumps the counter for a HIT/MISS/COALESCED status and returns all counters."""
+    path = os.path.join(CACHE_DIR, 'stats.json')
+    with lock_file(os.path.join(CACHE_DIR, 'stats.lock')):
+        try:
+            with open(path, 'r') as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        stats[STAT_KEYS[status]] = stats.get(STAT_KEYS[status], 0) + 1
+        with open(path, 'w') as f:
+            json.dump(stats, f)
+    return stats
+
+@contextmanager
+def lock_file(path):
+    """Exclusive flock on path. Yields True if the lock had to be waited for."""
+    waited = False
+    while True:
+        with open(path, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waited = True
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # drop_entry may have deleted the file while we waited: lock the new one instead
+                if os.path.exists(path) and os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                    yield waited
+                    return
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def generate_cached(model, prompt, generate_fn):
+    """
+    Returns (text, status) where status is 'HIT', 'MISS' or 'COALESCED'.
+    generate_fn() is only called on a miss, and only by one caller per key at a time.
+    """
+    if not CACHE_DIR:
+        return generate_fn(), 'MISS'
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    key = cache_key(model, prompt)
+
+    text = cache_get(key)
+    if text is not None:
+        return text, 'HIT'
+
+    with lock_file(os.path.join(CACHE_DIR, f"{key}.lock")) as waited:
+        # Whoever held the lock may have just produced our answer
+        text = cache_get(key)
+        if text is not None:
+            return text, 'COALESCED' if waited else 'HIT'
+
+        text = generate_fn()
+        cache_put(key, text)
+        return text, 'MISS'
+
+def stream_ollama(url, payload, headers, partial_path, timeout=120, on_text=None):
+    """
+    POSTs to an Ollama /api/generate or /api/chat endpoint with stream on and appends
+    each chunk's text to partial_path (if any) as it arrives; on_text(text so far) is
+    called at most every STREAM_PUBLISH_SEC.
+    Returns (full_text, metrics) with time-to-first-token, tokens/sec and, for
+    /api/generate, the final chunk's context tokens.
+    """
+    payload = dict(payload, stream=True)
+    start = time.time()
+    first_token_at = None
+    published_at = 0.0
+    pieces = []
+    eval_count = None
+    eval_duration = None
+    prompt_eval_count = None
+    context = None
+
+    with http_client.post(url, json=payload, headers=headers, read_timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        with open(partial_path or os.devnull, 'w') as out:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise RuntimeError(chunk['error'])
+
+                # /api/generate streams 'response', /api/chat streams 'message.content'
+                piece = chunk.get('response') or (chunk.get('message') or {}).get('content', '')
+                if piece:
+                    if first_token_at is None:
+                        first_token_at = time.time()
+                    pieces.append(piece)
+                    out.write(piece)
+                    out.flush()
+                    if on_text and time.time() - published_at >= STREAM_PUBLISH_SEC:
+                        published_at = time.time()
+                        on_text(''.join(pieces))
+
+                if chunk.get('done'):
+                    eval_count = chunk.get('eval_count')
+                    prompt_eval_count = chunk.get('prompt_eval_count')
+                    eval_duration = chunk.get('eval_duration') # nanoseconds
+                    context = chunk.get('context') # /api/generate only
+                    break
+
+    end = time.time()
+    first_token_at = first_token_at or end
+    tokens = eval_count or len(pieces)
+    if eval_duration:
+        tokens_per_sec = tokens / (eval_duration / 1e9)
+    else:
+        gen_sec = end - first_token_at
+        tokens_per_sec = tokens / gen_sec if gen_sec > 0 else 0
+
+    metrics = {
+        "ttft_ms": int((first_token_at - start) * 1000),
+        "total_ms": int((end - start) * 1000),
+        "tokens": tokens,
+        "prompt_tokens": prompt_eval_count,
+        "tokens_per_sec": round(tokens_per_sec, 1),
+        "context": context
+    }
+    return ''.join(pieces), metrics
+
+def print_stream_metrics(metrics):
+    print(f"Streamed {metrics['tokens']} tokens: TTFT {metrics['ttft_ms']} ms, "
+          f"{metrics['tokens_per_sec']} tok/s, total {metrics['total_ms']} ms")
+
+def stream_summary(metrics):
+    """The streaming figures a result carries back to its task (task_outputs prints them as outputs)."""
+    return {"ttft_ms": metrics['ttft_ms'], "tokens_per_sec": metrics['tokens_per_sec']}
+
+def generate(ollama_host, model, api_key, prompt_content, stream=None, on_text=None, stream_metrics=None):
+    """
+    stream: defaults to LLM_STREAM. When streaming, on_text gets the text so far and
+    stream_metrics (a dict) receives stream_summary() of the request.
+    """
+    stream = STREAM if stream is None else stream
+    # 4. Payload
+    payload = {
+        "model": model,
+        "prompt": prompt_content,
+        "stream": False
+    }
+
+    headers = {}
+    if api_key:
+        headers['Authorization'] = f"Bearer {api_key}"
+
+    # 5. Send Request (streamed chunks land in STREAM_FILE / on_text as they arrive)
+    with tracing.span('llm_request', model=model, stream=stream) as sp:
+        sp.set('prompt_chars', len(prompt_content))
+        if stream:
+            text, metrics = stream_ollama(f"{ollama_host}/api/generate", payload, headers, STREAM_FILE, on_text=on_text)
+            print_stream_metrics(metrics)
+            if stream_metrics is not None:
+                stream_metrics.update(stream_summary(metrics))
+            sp.set('ttft_ms', metrics['ttft_ms'])
+            record_tokens(sp, metrics.get('prompt_tokens'), metrics['tokens'])
+            return text
+
+        response = http_client.post(f"{ollama_host}/api/generate", json=payload, headers=headers, read_timeout=120)
+        response.raise_for_status()
+
+        # 6. Parse Response
+        result = response.json()
+        record_tokens(sp, result.get('prompt_eval_count'), result.get('eval_count'))
+        return result.get('response', 'No response from AI.')
+
+def record_tokens(sp, prompt_tokens, response_tokens):
+    """Ollama's prompt_eval_count / eval_count, on the span and as counters."""
+    sp.set('prompt_tokens', prompt_tokens).set('response_tokens', response_tokens)
+    tracing.counter('prompt_tokens', prompt_tokens)
+    tracing.counter('response_tokens', response_tokens)
+
+def generate_analysis(prompt_content, stream=None, on_text=None, stream_metrics=None):
+    """
+    Generates coaching text for a full prompt, going through the response cache.
+    stream / on_text / stream_metrics: see generate().
+    """
+    stream = STREAM if stream is None else stream
+    # 2. Configuration
+    ollama_host = os.environ.get('OLLAMA_HOST', 'https://ollama.com')
+    model = os.environ.get('OLLAMA_MODEL', 'gpt-oss:120b-cloud')
+    api_key = os.environ.get('OLLAMA_API_KEY')
+
+    print(f"Connecting to AI at {ollama_host} with model {model}...")
+
+    with tracing.span('llm') as sp:
+        output_text, cache_status = generate_cached(
+            model, prompt_content,
+            lambda: generate(ollama_host, model, api_key, prompt_content, stream, on_text, stream_metrics)
+        )
+        sp.set('cache', cache_status)
+
+    if CACHE_DIR:
+        stats = record_stat(cache_status)
+        print(f"LLM cache {cache_status} "
+              f"(hits={stats.get('hits', 0)}, misses={stats.get('misses', 0)}, coalesced={stats.get('coalesced', 0)})")
+        print(f"::set-output name=llm_cache::{cache_status}", flush=True)
+
+    # Cached answers never streamed; publish them whole so readers of the stream file still see text
+    if stream and STREAM_FILE and cache_status != 'MISS':
+        with open(STREAM_FILE, 'w') as f:
+            f.write(output_text)
+
+    return output_text
 
 def main():
     try:
@@ -12,48 +305,27 @@ def main():
         args = parser.parse_args()
         prompt_file = args.prompt
 
-        # 2. Configuration
-        ollama_host = os.environ.get('OLLAMA_HOST', 'https://ollama.com')
-        model = os.environ.get('OLLAMA_MODEL', 'gpt-oss:120b-cloud')
-        api_key = os.environ.get('OLLAMA_API_KEY')
-        
         # 3. Read Prompt
         if not os.path.exists(prompt_file):
             raise FileNotFoundError(f"Prompt file not found: {prompt_file}")
-            
+
         with open(prompt_file, 'r') as f:
             prompt_content = f.read()
 
-        print(f"Connecting to AI at {ollama_host} with model {model}...")
+        stream_metrics = {}
+        output_text = generate_analysis(prompt_content, stream_metrics=stream_metrics)
 
-        # 4. Payload
-        payload = {
-            "model": model,
-            "prompt": prompt_content,
-            "stream": False
-        }
-        
-        headers = {}
-        if api_key:
-            headers['Authorization'] = f"Bearer {api_key}"
-
-        # 5. Send Request
-        response = requests.post(f"{ollama_host}/api/generate", json=payload, headers=headers, timeout=120)
-        response.raise_for_status()
-        
-        # 6. Parse Response
-        result = response.json()
-        output_text = result.get('response', 'No response from AI.')
-        
         # 7. Output
         # We wrap it in a JSON object as expected by the frontend/next steps
         output_obj = {
             "text": output_text
         }
-        
+        if stream_metrics:
+            task_outputs.write_stream_metrics(stream_metrics)
+
         with open('analysis.json', 'w') as f:
             json.dump(output_obj, f)
-            
+
         print("Analysis generated successfully.")
 
     except Exception as e:
@@ -61,6 +333,9 @@ def main():
         print(err_msg)
         with open('analysis.json', 'w') as f:
             json.dump({"text": err_msg}, f)
-            
+
+    http_client.print_metrics()
+    tracing.flush()
+
 if __name__ == "__main__":
     main()
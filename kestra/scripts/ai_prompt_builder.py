@@ -1,7 +1,39 @@
+import hashlib
 import json
+from itertools import compress
+import math
 import os
+import re
+import shutil
 import sys
 
+import tracing
+
+try:
+    # Streaming projection parser (shipped next to this script in the pipeline)
+    import match_stream
+except ImportError:
+    match_stream = None
+
+try:
+    # Rank/agent/map percentile sketches (optional; empty PERCENTILE_DB disables)
+    import percentiles
+except ImportError:
+    percentiles = None
+
+# Memo of built outputs, keyed by (match_id, target player, builder code hash).
+# Outputs are memoised without percentiles (the sketches keep changing); the
+# lookup runs on every build from the saved percentile query.
+# Empty BUILD_MEMO_DIR disables it.
+MEMO_DIR = os.environ.get('BUILD_MEMO_DIR', '')
+MEMO_FILES = ['match_stats.txt', 'minified_match.json', 'percentile_query.json']
+
+# Prompt data encoding: 'json' (indented, as minified_match.json) or 'compact'
+# (tabular rows, short keys, no whitespace). A non-zero budget trims the least
+# important sections until the estimated prompt fits.
+PROMPT_ENCODING = os.environ.get('PROMPT_ENCODING', 'json')
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', '0'))
+
 # Helper Functions for Advanced Metrics
 
 def calculate_hs_percent(stats):
@@ -12,169 +44,373 @@ def calculate_hs_percent(stats):
     total_hits = head + body + leg
     return round((head / total_hits * 100), 1) if total_hits > 0 else 0
 
-def calculate_first_bloods(rounds, puuid):
-    fb = 0
-    for rnd in rounds:
-        earliest = 9999999
-        killer = None
+def build_match_index(players, rounds):
+    """
+    Builds a compact, integer-indexed view of the match once per payload.
+    Every metric below reads from this instead of re-walking `player_stats`.
+
+    Returns:
+    - ids: { puuid: int }, puuids: [puuid by id]
+    - teams: { puuid: team }, team_of: [lowercase team by id]
+    - kills: struct-of-arrays kill table (round, time, killer, victim, victim_team),
+      sorted by round then kill time
+    - round_offsets: kills of round r live in [round_offsets[r], round_offsets[r + 1])
+    - round_stats: per round { player id: player_stats row }
+    - round_winner: lowercase winning team per round
+    - plants / defuses: per round (time in round, lowercase team) or None
+    - economy: round x player economy matrix (see build_economy_matrix)
+    """
+    index = {
+        "ids": {},
+        "puuids": [],
+        "teams": {},
+        "team_of": [],
+        "kills": {"round": [], "time": [], "killer": [], "victim": [], "victim_team": []},
+        "round_offsets": [0],
+        "round_stats": [],
+        "round_winner": [],
+        "plants": [],
+        "defuses": []
+    }
+
+    for p in players:
+        player_id(index, p.get('puuid'), p.get('team', ''))
+
+    kills = index['kills']
+    for r, rnd in enumerate(rounds):
+        stats_by_id = {}
+        round_kills = []
         for ps in rnd.get('player_stats', []):
+            pid = player_id(index, ps.get('player_puuid'), ps.get('player_team') or '')
+            if pid >= 0:
+                stats_by_id[pid] = ps
             for k in ps.get('kill_events', []):
-                kt = k.get('kill_time_in_round', 99999)
-                if kt < earliest:
-                    earliest = kt
-                    killer = k.get('killer_puuid')
-        if killer == puuid:
+                round_kills.append(k)
+
+        # Stable sort keeps the API order for kills on the same tick
+        round_kills.sort(key=lambda x: x.get('kill_time_in_round', 0))
+
+        for k in round_kills:
+            victim = player_id(index, k.get('victim_puuid'), k.get('victim_team') or '')
+            v_team = (index['team_of'][victim] if victim >= 0 else '') or (k.get('victim_team') or '')
+            kills['round'].append(r)
+            kills['time'].append(k.get('kill_time_in_round', 0))
+            kills['killer'].append(player_id(index, k.get('killer_puuid')))
+            kills['victim'].append(victim)
+            kills['victim_team'].append(v_team.lower())
+
+        index['round_offsets'].append(len(kills['round']))
+        index['round_stats'].append(stats_by_id)
+        index['round_winner'].append((rnd.get('winning_team') or '').lower())
+        index['plants'].append(_bomb_event(rnd.get('plant_events'), 'plant_time_in_round', 'planted_by'))
+        index['defuses'].append(_bomb_event(rnd.get('defuse_events'), 'defuse_time_in_round', 'defused_by'))
+
+    index['economy'] = build_economy_matrix(index)
+    return index
+
+def _bomb_event(event, time_key, by_key):
+    """(time in round, lowercase team) of a plant / defuse, or None."""
+    by = (event or {}).get(by_key)
+    if not by:
+        return None
+    return event.get(time_key) or 0, (by.get('team') or '').lower()
+
+def build_economy_matrix(index):
+    """
+    Dense round x player economy matrix, built once from the round_stats rows.
+    Each column is a flat row-major list (cell = round * players + player id),
+    so a player's rounds are the slice [pid::players] and a round is
+    [r * players:(r + 1) * players]:
+    - loadout / spent / remaining: credits (0 where the player has no row)
+    - present: 1 where the player has an economy row that round
+    """
+    n = len(index['puuids'])
+    size = len(index['round_stats']) * n
+    eco = {
+        "players": n,
+        "rounds": len(index['round_stats']),
+        "loadout": [0] * size,
+        "spent": [0] * size,
+        "remaining": [0] * size,
+        "present": [0] * size
+    }
+    for r, stats_by_id in enumerate(index['round_stats']):
+        base = r * n
+        for pid, ps in stats_by_id.items():
+            e = ps.get('economy')
+            if not e:
+                continue
+            cell = base + pid
+            eco['loadout'][cell] = e.get('loadout_value') or 0
+            eco['spent'][cell] = e.get('spent') or 0
+            eco['remaining'][cell] = e.get('remaining') or 0
+            eco['present'][cell] = 1
+    return eco
+
+def team_loadout_totals(eco, mask):
+    """Per-round (loadout sums, player counts) over the player ids selected by mask."""
+    n = eco['players']
+    sums, counts = [], []
+    for base in range(0, eco['rounds'] * n, n):
+        sums.append(sum(compress(eco['loadout'][base:base + n], mask)))
+        counts.append(sum(compress(eco['present'][base:base + n], mask)))
+    return sums, counts
+
+def _averages(sums, counts):
+    return [s / c if c else 0 for s, c in zip(sums, counts)]
+
+def player_id(index, puuid, team=''):
+    """Returns the integer id for a puuid, registering unknown players on the fly (-1 for missing)."""
+    if not puuid:
+        return -1
+    pid = index['ids'].get(puuid)
+    if pid is None:
+        pid = len(index['puuids'])
+        index['ids'][puuid] = pid
+        index['puuids'].append(puuid)
+        index['teams'][puuid] = team
+        index['team_of'].append(team.lower())
+    return pid
+
+def round_kill_range(index, r):
+    return range(index['round_offsets'][r], index['round_offsets'][r + 1])
+
+def calculate_first_bloods(index, puuid):
+    pid = index['ids'].get(puuid, -1)
+    if pid < 0:
+        return 0
+    killers = index['kills']['killer']
+    offsets = index['round_offsets']
+    fb = 0
+    for r in range(len(offsets) - 1):
+        if offsets[r] < offsets[r + 1] and killers[offsets[r]] == pid:
             fb += 1
     return fb
 
-def calculate_clutches(rounds, target_puuid, target_team):
+MAX_CLUTCH = 5
+
+def build_round_timeline(index):
     """
-    Analyzes rounds to find 1vX situations that were won.
-    Returns: { "1v1": count, "1v2": count, ... }
+    One sweep per round over the kill table (already sorted by time) merged with
+    the plant / defuse moments, tracking who is alive on each team. Starting
+    rosters are the players with a row in that round, so nothing assumes 5v5,
+    and victims are placed by the puuid -> team map.
+
+    Returns:
+    - teams: team names, the order of the alive tuples
+    - rounds: per round {"start": alive tuple, "events": [(time, kind, alive tuple)]},
+      kind is 'kill', 'plant' or 'defuse'
+    - clutch_attempts / clutch_wins: per player id, counts indexed by enemies
+      alive (1..5) when the player became the last one alive on their team;
+      won when their team takes the round
+    - advantage_rounds / advantage_won: per team, rounds where it was ahead in
+      players alive after some kill, and how many of those it won
+    - post_plant: per team, rounds it planted / defended a plant, and wins of each
     """
-    clutches = {
-        "1v1": 0,
-        "1v2": 0,
-        "1v3": 0,
-        "1v4": 0,
-        "1v5": 0
+    teams = sorted({t for t in index['team_of'] if t})
+    slot = {t: i for i, t in enumerate(teams)}
+    n = len(index['puuids'])
+    timeline = {
+        "teams": teams,
+        "rounds": [],
+        "clutch_attempts": [[0] * (MAX_CLUTCH + 1) for _ in range(n)],
+        "clutch_wins": [[0] * (MAX_CLUTCH + 1) for _ in range(n)],
+        "advantage_rounds": dict.fromkeys(teams, 0),
+        "advantage_won": dict.fromkeys(teams, 0),
+        "post_plant": {t: {"planted": 0, "planted_won": 0, "retake": 0, "retake_won": 0} for t in teams}
     }
 
-    for rnd in rounds:
-        # 1. Check Win
-        winning_team = rnd.get('winning_team', '').lower()
-        if winning_team != target_team.lower():
-            continue 
-
-        # 2. Replay Kills to find Clutch Moment
-        # We need to track alive counts.
-        # Assuming 5v5 start.
-        # Ideally we'd map all players to teams, but simplified:
-        # Clutch = At some point, allies_alive == 1 (YOU) and enemies_alive >= 1.
-        # AND you survive (or trade out last? No, you must be alive at end usually, or bomb explodes).
-        # Simplified Check: 
-        # - You are the ONLY one alive on your team at end of round (or moment of win).
-        # - Count enemies alive at the moment you BECAME the only one alive.
-        
-        kill_events = []
-        for ps in rnd.get('player_stats', []):
-            for k in ps.get('kill_events', []):
-                kill_events.append(k)
-        
-        kill_events.sort(key=lambda x: x.get('kill_time_in_round', 0))
-        
-        target_died = False
-        allies_alive = 5
-        enemies_alive = 5
-        
-        clutch_situation = None # e.g. 2 for 1v2
-        
-        # We also need to account for players who might be AFK or not spawned? 
-        # Assuming 5v5 for simplicity.
-        
-        for k in kill_events:
-            victim = k.get('victim_puuid')
-            killer = k.get('killer_puuid')
-            
-            # We need to know victim's team.
-            # API kill events validly usually have `victim_team`.
-            # If not, we can infer if victim == target (ally) or not? 
-            # No, if victim != target, it could be ally or enemy.
-            # We strictly need a PUUID->Team look up to be accurate.
-            # Since we don't passed it, we try `victim_team` from event.
-            # If unavailable, heuristics fail.
-            # But let's assume `victim_team` exists (Red/Blue).
-            
-            v_team = k.get('victim_team', '')
-            if not v_team: 
-                # Fallback: We can't determine clutch without team. Skip.
+    team_of = index['team_of']
+    kills = index['kills']
+
+    for r, stats_by_id in enumerate(index['round_stats']):
+        alive = [set() for _ in teams]
+        # Players with a row this round (everyone when the round has no rows)
+        for pid in (stats_by_id or range(n)):
+            if team_of[pid] in slot:
+                alive[slot[team_of[pid]]].add(pid)
+        start = tuple(len(a) for a in alive)
+        total = sum(start)
+
+        events = []
+        clutcher = {} # team slot -> (player id, enemies alive)
+        ahead = set() # team slots that had the numbers advantage
+
+        markers = sorted((e[0], kind) for kind, e in (("plant", index['plants'][r]), ("defuse", index['defuses'][r])) if e)
+        m = 0
+        for i in round_kill_range(index, r):
+            t = kills['time'][i]
+            while m < len(markers) and markers[m][0] <= t:
+                events.append((markers[m][0], markers[m][1], tuple(len(a) for a in alive)))
+                m += 1
+
+            victim = kills['victim'][i]
+            v_slot = slot.get(kills['victim_team'][i])
+            if v_slot is None or victim not in alive[v_slot]:
                 continue
-                
-            if victim == target_puuid:
-                target_died = True
-                break # Failed clutch
-                
-            if v_team.lower() == target_team.lower():
-                allies_alive -= 1
-            else:
-                enemies_alive -= 1
-            
-            # Did clutch start?
-            if allies_alive == 1 and not target_died:
-                # You are last alive.
-                if clutch_situation is None:
-                    clutch_situation = enemies_alive
-                    
-        # Check success
-        if clutch_situation and not target_died and clutch_situation > 0:
-            key = f"1v{clutch_situation}"
-            if key in clutches:
-                clutches[key] += 1
-            elif clutch_situation > 5:
-                clutches["1v5"] += 1
-                
+            alive[v_slot].discard(victim)
+            total -= 1
+            counts = tuple(len(a) for a in alive)
+            events.append((t, "kill", counts))
+
+            for s_i, count in enumerate(counts):
+                enemies = total - count
+                if count > enemies:
+                    ahead.add(s_i)
+                if count == 1 and enemies > 0 and s_i not in clutcher:
+                    survivor = next(iter(alive[s_i]))
+                    timeline['clutch_attempts'][survivor][min(enemies, MAX_CLUTCH)] += 1
+                    clutcher[s_i] = (survivor, min(enemies, MAX_CLUTCH))
+        for t, kind in markers[m:]:
+            events.append((t, kind, tuple(len(a) for a in alive)))
+
+        winner = index['round_winner'][r]
+        for s_i, (survivor, enemies) in clutcher.items():
+            if teams[s_i] == winner:
+                timeline['clutch_wins'][survivor][enemies] += 1
+        for s_i in ahead:
+            timeline['advantage_rounds'][teams[s_i]] += 1
+            if teams[s_i] == winner:
+                timeline['advantage_won'][teams[s_i]] += 1
+        plant = index['plants'][r]
+        if plant and plant[1] in slot:
+            for t in teams:
+                side = "planted" if t == plant[1] else "retake"
+                timeline['post_plant'][t][side] += 1
+                if t == winner:
+                    timeline['post_plant'][t][side + "_won"] += 1
+
+        timeline['rounds'].append({"start": start, "events": events})
+
+    return timeline
+
+def calculate_clutches(index, target_puuid, timeline=None):
+    """
+    1vX situations from the round timeline: how often the player was the last
+    one alive on their team against X enemies, and how many of those rounds
+    their team won. Returns { "attempts", "won", "1vX": "won/attempts" }.
+    """
+    if timeline is None:
+        timeline = build_round_timeline(index)
+    pid = index['ids'].get(target_puuid, -1)
+    clutches = {"attempts": 0, "won": 0}
+    if pid < 0:
+        return clutches
+    attempts = timeline['clutch_attempts'][pid]
+    wins = timeline['clutch_wins'][pid]
+    for x in range(1, MAX_CLUTCH + 1):
+        if attempts[x]:
+            clutches[f"1v{x}"] = f"{wins[x]}/{attempts[x]}"
+    clutches['attempts'] = sum(attempts)
+    clutches['won'] = sum(wins)
     return clutches
 
-def calculate_advanced_combat(rounds, puuid, team):
+def calculate_round_control(team, timeline):
+    """
+    Team-level round conversion from the timeline:
+    - Man advantage: rounds the team was ahead in players alive, and how many it won
+    - Post-plant: rounds it planted (and won), rounds it had to retake (and won)
+    """
+    team = team.lower()
+    ahead = timeline['advantage_rounds'].get(team, 0)
+    converted = timeline['advantage_won'].get(team, 0)
+    post_plant = timeline['post_plant'].get(team, {"planted": 0, "planted_won": 0, "retake": 0, "retake_won": 0})
+    return {
+        "man_advantage": {
+            "rounds": ahead,
+            "converted": converted,
+            "win_rate": round(converted / ahead * 100, 1) if ahead > 0 else 0
+        },
+        "post_plant": {
+            "planted": f"{post_plant['planted_won']}/{post_plant['planted']}",
+            "retakes": f"{post_plant['retake_won']}/{post_plant['retake']}"
+        }
+    }
+
+TRADE_WINDOW_MS = 5000
+
+def calculate_combat_batch(index):
+    """
+    One sweep per round over the kill table, producing per-player counters for
+    everyone in the match (struct-of-arrays, indexed by player id):
+    - duels_taken / duels_won (first kill of the round)
+    - trade_kills (killing someone who got a kill within the trade window)
+    - traded_deaths (your killer dies within the trade window)
+    - entry_deaths, death_time_total / deaths (first death per round)
+
+    Trades use the last kill time per killer, so each round is linear in its kill count.
+    """
+    n = len(index['puuids'])
+    batch = {
+        "duels_taken": [0] * n,
+        "duels_won": [0] * n,
+        "trade_kills": [0] * n,
+        "traded_deaths": [0] * n,
+        "entry_deaths": [0] * n,
+        "death_time_total": [0] * n,
+        "deaths": [0] * n
+    }
+
+    kills = index['kills']
+    times = kills['time']
+    killers = kills['killer']
+    victims = kills['victim']
+
+    for r in range(len(index['round_offsets']) - 1):
+        kill_range = round_kill_range(index, r)
+        if not kill_range:
+            continue
+
+        # 1. First Duel / Entry Death
+        first = kill_range[0]
+        if killers[first] >= 0:
+            batch['duels_taken'][killers[first]] += 1
+            batch['duels_won'][killers[first]] += 1
+        if victims[first] >= 0 and victims[first] != killers[first]:
+            batch['duels_taken'][victims[first]] += 1
+            batch['entry_deaths'][victims[first]] += 1
+
+        # 2. Trade Kills: did this victim get a kill inside the window?
+        last_kill_at = {} # killer id -> latest kill time this round
+        died_at = {} # victim id -> (death time, killer id)
+        for i in kill_range:
+            killer = killers[i]
+            victim = victims[i]
+            t = times[i]
+            if killer >= 0:
+                prev = last_kill_at.get(victim)
+                if prev is not None and t - prev <= TRADE_WINDOW_MS:
+                    batch['trade_kills'][killer] += 1
+                last_kill_at[killer] = t
+            if victim >= 0 and victim not in died_at:
+                died_at[victim] = (t, killer)
+                batch['death_time_total'][victim] += t
+                batch['deaths'][victim] += 1
+
+        # 3. Traded Deaths: did my killer die (to someone else) inside the window?
+        for victim, (t, killer) in died_at.items():
+            revenge = died_at.get(killer)
+            if revenge and revenge[1] != victim and 0 <= revenge[0] - t <= TRADE_WINDOW_MS:
+                batch['traded_deaths'][victim] += 1
+
+    return batch
+
+def calculate_advanced_combat(index, puuid, team, batch=None, timeline=None):
     """
     Calculates:
     - First Duels (Taken, Won, Win%)
-    - Clutches (Opportunities, Won, Best)
+    - Clutches (Attempts, Won, per 1vX)
     - Trades (Kills on enemy who just killed teammate, Deaths traded by teammate)
+    - Round Control (Man-advantage conversion, Post-plant / retake outcomes)
     """
-    duels_taken = 0
-    duels_won = 0
-    trade_kills = 0
-    traded_deaths = 0 
-    
-    for rnd in rounds:
-        # 1. First Duels
-        kill_events = []
-        for ps in rnd.get('player_stats', []):
-            for k in ps.get('kill_events', []):
-                kill_events.append(k)
-        
-        kill_events.sort(key=lambda x: x.get('kill_time_in_round', 0))
-        
-        if kill_events:
-            first_kill = kill_events[0]
-            if first_kill['killer_puuid'] == puuid:
-                duels_taken += 1
-                duels_won += 1
-            elif first_kill['victim_puuid'] == puuid:
-                duels_taken += 1
-                
-        # 2. Trades 
-        for k in kill_events:
-            if k['killer_puuid'] == puuid:
-                victim_id = k['victim_puuid']
-                kill_time = k['kill_time_in_round']
-                # Did this victim kill a teammate recently?
-                for prev_k in kill_events:
-                    if prev_k == k: break 
-                    if (prev_k['killer_puuid'] == victim_id and 
-                        (kill_time - prev_k['kill_time_in_round']) <= 5000):
-                        trade_kills += 1
-                        break
-            
-            if k['victim_puuid'] == puuid:
-                killer_id = k['killer_puuid']
-                death_time = k['kill_time_in_round']
-                # Did a teammate kill this killer soon after?
-                for future_k in kill_events:
-                    if future_k['kill_time_in_round'] < death_time: continue
-                    if (future_k['killer_puuid'] != puuid and 
-                        future_k['victim_puuid'] == killer_id and
-                        (future_k['kill_time_in_round'] - death_time) <= 5000):
-                        traded_deaths += 1
-                        break
-                        
-    # 3. Clutches 
-    clutch_stats = calculate_clutches(rounds, puuid, team)
-    
-    # Calculate opportunities (approximated as sum of 1vX wons + fails?)
-    # For now just showing won breakdown is cleaner.
-    
+    if batch is None:
+        batch = calculate_combat_batch(index)
+    if timeline is None:
+        timeline = build_round_timeline(index)
+    pid = index['ids'].get(puuid, -1)
+    duels_taken = batch['duels_taken'][pid] if pid >= 0 else 0
+    duels_won = batch['duels_won'][pid] if pid >= 0 else 0
+
     return {
         "first_duels": {
             "taken": duels_taken,
@@ -182,97 +418,124 @@ def calculate_advanced_combat(rounds, puuid, team):
             "win_rate": round(duels_won/duels_taken*100, 1) if duels_taken > 0 else 0
         },
         "trades": {
-            "trade_kills": trade_kills,
-            "traded_deaths": traded_deaths
+            "trade_kills": batch['trade_kills'][pid] if pid >= 0 else 0,
+            "traded_deaths": batch['traded_deaths'][pid] if pid >= 0 else 0
         },
-        "clutches": clutch_stats
+        "clutches": calculate_clutches(index, puuid, timeline),
+        **calculate_round_control(team, timeline)
     }
 
-def calculate_positioning(rounds, puuid):
+def calculate_positioning(index, puuid, batch=None):
     """
     Calculates:
     - Avg Death Time (in seconds)
     - Entry Deaths (Dying first in the round)
     """
-    total_death_time = 0
-    deaths = 0
-    entry_deaths = 0
-    
-    for rnd in rounds:
-        kill_events = []
-        for ps in rnd.get('player_stats', []):
-            for k in ps.get('kill_events', []):
-                kill_events.append(k)
-        
-        kill_events.sort(key=lambda x: x.get('kill_time_in_round', 0))
-        
-        # Check Entry Death
-        if kill_events:
-            if kill_events[0]['victim_puuid'] == puuid:
-                entry_deaths += 1
-                
-        # Find Player Death
-        for k in kill_events:
-            if k['victim_puuid'] == puuid:
-                dt = k.get('kill_time_in_round', 0)
-                total_death_time += dt
-                deaths += 1
-                break
-                
-    avg_time_ms = total_death_time / deaths if deaths > 0 else 0
+    if batch is None:
+        batch = calculate_combat_batch(index)
+    pid = index['ids'].get(puuid, -1)
+    if pid < 0:
+        return {"avg_death_time_sec": 0, "entry_deaths": 0}
+
+    deaths = batch['deaths'][pid]
+    avg_time_ms = batch['death_time_total'][pid] / deaths if deaths > 0 else 0
     
     return {
         "avg_death_time_sec": int(avg_time_ms / 1000),
-        "entry_deaths": entry_deaths
+        "entry_deaths": batch['entry_deaths'][pid]
     }
 
-def calculate_advanced_economy(rounds, puuid, player_team):
+def get_combat_summary(batch, pid):
+    """Compact per-player view of the batch counters, used for the scoreboard."""
+    taken = batch['duels_taken'][pid]
+    deaths = batch['deaths'][pid]
+    return {
+        "first_duels": f"{batch['duels_won'][pid]}/{taken}",
+        "trade_kills": batch['trade_kills'][pid],
+        "traded_deaths": batch['traded_deaths'][pid],
+        "entry_deaths": batch['entry_deaths'][pid],
+        "avg_death_time_sec": int(batch['death_time_total'][pid] / deaths / 1000) if deaths > 0 else 0
+    }
+
+# Economy thresholds (loadout value in credits)
+ECO_MAX_LOADOUT = 1500      # pistol / save round
+FULL_BUY_LOADOUT = 3900     # rifle + full shields
+FORCE_TEAM_MAX_AVG = 2500   # teammates are saving
+ECO_FRAG_MIN_VICTIM = 3000  # the victim was on a real buy
+THRIFTY_GAP = 2000          # won with a team average this far below the enemy's
+
+def calculate_advanced_economy(index, puuid, player_team):
     """
-    Calculates:
-    - Bad Force Buys (Player bought > 3900 while Team Avg < 2500)
-    - Eco Frags (Kills when Player Loadout < 1500 vs Enemy > 3000)
-    - Team Economy Context (Who had better guns?)
+    Calculates from the round x player economy matrix:
+    - Team / enemy average buy (mean loadout per round, averaged over the match)
+    - Bad Force Buys (Player bought a >= 3900 loadout while teammates averaged < 2500)
+    - Eco Frags (Kills on a < 1500 loadout against a victim on >= 3000), plus the
+      same kills weighted by victim loadout in full-buy units
+    - Thrifty Rounds (Team won with an average loadout >= 2000 below the enemy's)
     """
-    bad_forces = 0
-    eco_kills = 0
-    
-    for rnd in rounds:
-        # Get Team Economies
-        my_team_val = 0
-        my_team_count = 0
-        player_val = 0
-        
-        # Parse Round Loadouts
-        for ps in rnd.get('player_stats', []):
-            val = ps.get('economy', {}).get('loadout_value', 0)
-            pid = ps.get('player_puuid')
-            
-            # Identify Team (Simplified: Match PUUID = My Team? 
-            # Wait, we need to know teammates. We can infer from `match_info` players list or just `stats` if available.
-            # Assuming we can't easily map team without pre-processing.
-            # TRICK: Check if they are on same team string 'Blue'/'Red' from players meta.
-            # But inside rounds we only have PUUID.
-            # We will skip team-avg calc for now and just look at "Full Save Kills"
-            
-            if pid == puuid:
-                player_val = val
-                
-                # Check Eco Frags for this round
-                if player_val < 1500:
-                    for k in ps.get('kill_events', []):
-                        # We'd need victim loadout value... requires lookup map.
-                        # Doable but complex. Let's simplify:
-                        # Eco Frag = Kills round where player_val < 1500
-                        eco_kills += 1
-                        
+    result = {
+        "team_avg_buy": 0,
+        "enemy_avg_buy": 0,
+        "bad_force_buys": 0,
+        "bad_force_rounds": [],
+        "eco_frags": 0,
+        "eco_frag_weight": 0,
+        "thrifty_rounds": 0
+    }
+    eco = index['economy']
+    n = eco['players']
+    pid = index['ids'].get(puuid, -1)
+    if pid < 0 or not eco['rounds']:
+        return result
 
+    my_team = player_team.lower()
+    team_of = index['team_of']
+    team_sum, team_n = team_loadout_totals(eco, [t == my_team for t in team_of])
+    enemy_sum, enemy_n = team_loadout_totals(eco, [bool(t) and t != my_team for t in team_of])
+    team_avg = _averages(team_sum, team_n)
+    enemy_avg = _averages(enemy_sum, enemy_n)
 
-    return {
-        "bad_force_buys": 0, # Placeholder until team mapping
-        "full_save_kills": eco_kills
-    }
+    # The player's column
+    loadout = eco['loadout']
+    mine = loadout[pid::n]
+    spent = eco['spent'][pid::n]
+    present = eco['present'][pid::n]
 
-def get_simple_player_stats(player, rounds_played):
+    # Teammates only: take the player out of the team totals
+    mates_avg = [(s - v) / (c - p) if c - p > 0 else None
+                 for s, c, v, p in zip(team_sum, team_n, mine, present)]
+    bad_forces = [
+        r + 1 for r, (p, v, sp, mates) in enumerate(zip(present, mine, spent, mates_avg))
+        if p and sp > 0 and v >= FULL_BUY_LOADOUT and mates is not None and mates < FORCE_TEAM_MAX_AVG
+    ]
+
+    kills = index['kills']
+    eco_frag_values = [
+        loadout[r * n + victim]
+        for r, killer, victim in zip(kills['round'], kills['killer'], kills['victim'])
+        if killer == pid and victim >= 0 and team_of[victim] != my_team and present[r]
+        and mine[r] < ECO_MAX_LOADOUT and loadout[r * n + victim] >= ECO_FRAG_MIN_VICTIM
+    ]
+
+    thrifty = sum(
+        1 for winner, c, e, ours, theirs in zip(index['round_winner'], team_n, enemy_n, team_avg, enemy_avg)
+        if winner == my_team and c and e and ours <= theirs - THRIFTY_GAP
+    )
+
+    played = [(ours, theirs) for ours, theirs, c in zip(team_avg, enemy_avg, team_n) if c]
+    if played:
+        result['team_avg_buy'] = int(sum(o for o, _ in played) / len(played))
+        result['enemy_avg_buy'] = int(sum(t for _, t in played) / len(played))
+    result.update(
+        bad_force_buys=len(bad_forces),
+        bad_force_rounds=bad_forces,
+        eco_frags=len(eco_frag_values),
+        eco_frag_weight=round(sum(eco_frag_values) / FULL_BUY_LOADOUT, 1),
+        thrifty_rounds=thrifty
+    )
+    return result
+
+def get_simple_player_stats(player, rounds_played, combat=None):
     """Extracts high-level stats for context comparison."""
     stats = player.get('stats', {})
     k = stats.get('kills', 0)
@@ -293,214 +556,477 @@ def get_simple_player_stats(player, rounds_played):
         "rank": player.get('currenttier_patched', 'Unranked'),
         "kda": kda,
         "acs": acs,
-        "hs_percent": hs
+        "hs_percent": hs,
+        "combat": combat or {}
     }
 
-def get_economy_start(rounds, puuid):
+def player_round_stats(index, puuid):
+    """Yields (round_number, player_stats row) for every round the player has a row in."""
+    pid = index['ids'].get(puuid, -1)
+    for i, stats_by_id in enumerate(index['round_stats']):
+        ps = stats_by_id.get(pid)
+        if ps is not None:
+            yield i + 1, ps
+
+def get_economy_start(index, puuid):
     eco = []
-    for i, rnd in enumerate(rounds):
-        for ps in rnd.get('player_stats', []):
-            if ps.get('player_puuid') == puuid:
-                e = ps.get('economy', {})
-                w = e.get('weapon', {})
-                w_name = w.get('name', 'Unknown') if w else 'Unknown'
-                eco.append({
-                    "round": i+1,
-                    "weapon": w_name,
-                    "value": e.get('loadout_value', 0),
-                    "spent": e.get('spent', 0)
-                })
+    for round_no, ps in player_round_stats(index, puuid):
+        e = ps.get('economy', {})
+        w = e.get('weapon', {})
+        w_name = w.get('name', 'Unknown') if w else 'Unknown'
+        eco.append({
+            "round": round_no,
+            "weapon": w_name,
+            "value": e.get('loadout_value', 0),
+            "spent": e.get('spent', 0)
+        })
     return eco
 
-def main():
-    try:
-        # 1. Load Data
-        with open('match_data.json', 'r') as f:
-            data = json.load(f)
-            
-        target_player_name = os.environ.get("TARGET_PLAYER", "").lower()
-        
-        match_info = data.get('data', {})
-        metadata = match_info.get('metadata', {})
-        players = match_info.get('players', {}).get('all_players', [])
-        rounds = match_info.get('rounds', [])
-        if not rounds and 'rounds' in data: 
-             rounds = data.get('rounds', [])
-
-        # 2. Extract Match Context
-        map_name = metadata.get('map', 'Unknown')
-        mode = metadata.get('mode', 'Standard')
-        rounds_played = metadata.get('rounds_played', 0)
-        
-        # 3. Find THE Target Player
-        if target_player_name:
-            player = next((p for p in players if p.get('name', '').lower() == target_player_name), None)
+# Prompt Data Encoding
+
+# long key -> (short key, legend text); self-explanatory aliases have no legend entry
+KEY_ALIASES = {
+    "metadata": ("meta", None), "identity": ("me", None), "combat": ("cmb", None), "utility": ("util", None),
+    "rounds_played": ("rounds", None), "score_string": ("score", None), "hs_percent": ("hs", None),
+    "combat_advanced": ("adv", None), "positioning": ("pos", None), "economy_context": ("eco", None),
+    "objective_and_economy": ("obj", None), "economy_summary": ("eco_sum", None), "percentiles": ("pct", None),
+    "scoreboard": ("board", None), "weapon": ("wpn", None), "value": ("val", None), "round": ("r", None),
+    "first_duels": ("fd", "first duels won/taken"), "win_rate": ("wr", "win %"),
+    "trade_kills": ("tk", "trade kills"), "traded_deaths": ("td", "deaths traded by a teammate"),
+    "entry_deaths": ("ed", "died first in the round"), "avg_death_time_sec": ("dt", "avg seconds into round at death"),
+    "bad_force_buys": ("bfb", "bad force buys"), "bad_force_rounds": ("bfr", "bad force rounds"),
+    "eco_frags": ("eco_k", "kills on a <1500 loadout vs a >=3000 victim"),
+    "eco_frag_weight": ("eco_w", "eco kills weighted by victim loadout, in full buys"),
+    "thrifty_rounds": ("thrifty", "rounds won on a much cheaper team buy"),
+    "team_avg_buy": ("buy", "team avg loadout"), "enemy_avg_buy": ("opp_buy", "enemy avg loadout"),
+    "ultimate_casts": ("x", "ult casts"), "ability_e_casts": ("e", "E casts"), "ability_q_casts": ("q", "Q casts"),
+    "ability_c_casts": ("c", "C casts"), "economy_full": ("eco_rounds", "per-round loadout"),
+    "loadout_val_overall": ("load", "loadout value total"), "loadout_val_avg": ("load_avg", "loadout value avg"),
+    "spent_overall": ("spent", None), "percentile": ("p", "percentile"), "median": ("med", "median"),
+    "clutches": ("cl", "clutches won/attempts"), "man_advantage": ("adv_conv", "rounds ahead in players alive, converted"),
+    "post_plant": ("pp", "post-plant won/rounds"), "retakes": ("retake", None), "planted": ("plant", None),
+    "converted": ("conv", None), "attempts": ("att", None)
+}
+
+ECONOMY_COLUMNS = ["round", "weapon", "value", "spent"]
+SCOREBOARD_COLUMNS = ["name", "agent", "team", "rank", "kda", "acs", "hs_percent",
+                      "first_duels", "trade_kills", "traded_deaths", "entry_deaths", "avg_death_time_sec"]
+
+# Least important first; each step drops columns, rows or a whole section
+TRIM_STEPS = [
+    ("scoreboard.detail", lambda d: _drop_columns(d.get('scoreboard'), ["traded_deaths", "entry_deaths", "avg_death_time_sec"])),
+    ("economy_full.spent", lambda d: _drop_columns(d['objective_and_economy'].get('economy_full'), ["spent"])),
+    ("scoreboard.rows", lambda d: _top_rows(d.get('scoreboard'), 5)),
+    ("economy_full", lambda d: d['objective_and_economy'].pop('economy_full', None)),
+    ("scoreboard", lambda d: d.pop('scoreboard', None)),
+    ("percentiles", lambda d: d.pop('percentiles', None)),
+    ("utility", lambda d: d.pop('utility', None))
+]
+
+_TOKEN_RE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+def estimate_tokens(text):
+    """
+    Rough BPE token count without a tokenizer: letter runs ~4 chars per token,
+    digit runs ~3 per token, every other non-space character one token.
+    """
+    tokens = 0
+    for piece in _TOKEN_RE.findall(text):
+        c = piece[0]
+        if c.isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif c.isdigit():
+            tokens += math.ceil(len(piece) / 3)
         else:
-            player = max(players, key=lambda x: x.get('stats', {}).get('score', 0))
+            tokens += 1
+    return tokens
 
-        if not player:
-            # Error handling same as before...
-            err_msg = "Player not found"
-            with open('prompt.txt', 'w') as f: f.write(err_msg)
-            with open('minified_match.json', 'w') as f: json.dump({"error": err_msg}, f)
-            return
+def _table(rows, columns):
+    return {"cols": list(columns), "rows": [[row.get(c) for c in columns] for row in rows]}
 
-        # 4. Extract Metrics (Basic)
-        stats = player.get('stats', {})
-        puuid = player.get('puuid')
-        team = player.get('team', 'Blue')
-        agent = player.get('character', 'Unknown Agent')
-        
-        k = stats.get('kills') or 0
-        d = stats.get('deaths') or 0
-        a = stats.get('assists') or 0
-        
-        damage = stats.get('damage_made') or stats.get('damage', 0)
-        # Fallback ADR
-        if damage == 0 and rounds:
-             for rnd in rounds:
-                for ps in rnd.get('player_stats', []):
-                    if ps.get('player_puuid') == puuid:
-                        damage += ps.get('damage', 0)
-        adr = round(damage / rounds_played, 0) if rounds_played > 0 else 0
-        avg_score = round(stats.get('score', 0) / rounds_played, 0) if rounds_played > 0 else 0
-
-        # HS%
-        head = stats.get('headshots') or 0
-        body = stats.get('bodyshots') or 0
-        leg = stats.get('legshots') or 0
-        total_hits = head + body + leg
-        hs_percent = round((head / total_hits * 100), 1) if total_hits > 0 else 0
-        
-        # Utility
-        casts = player.get('ability_casts') or {}
-        if casts is None: casts = {}
-        
-        c_cast = casts.get('c_cast') or 0
-        q_cast = casts.get('q_cast') or 0
-        e_cast = casts.get('e_cast') or 0
-        x_cast = casts.get('x_cast') or 0
-        
-        # Fallback Utility
-        if (c_cast + q_cast + e_cast + x_cast) == 0 and rounds:
-            for rnd in rounds:
-                for ps in rnd.get('player_stats', []):
-                    if ps.get('player_puuid') == puuid:
-                        round_casts = ps.get('ability_casts') or {}
-                        if round_casts:
-                            c_cast += (round_casts.get('c_cast') or round_casts.get('c_casts') or 0)
-                            q_cast += (round_casts.get('q_cast') or round_casts.get('q_casts') or 0)
-                            e_cast += (round_casts.get('e_cast') or round_casts.get('e_casts') or 0)
-                            x_cast += (round_casts.get('x_cast') or round_casts.get('x_casts') or 0)
-
-        plants = stats.get('plants', 0)
-        defuses = stats.get('defuses', 0)
-        
-        # Economy (Full)
-        economy_full = get_economy_start(rounds, puuid)
-        eco_stats = player.get('economy', {})
-        eco_summary = {
-            "spent_overall": eco_stats.get('spent', {}).get('overall', 0),
-            "spent_avg": eco_stats.get('spent', {}).get('average', 0),
-            "loadout_val_overall": eco_stats.get('loadout_value', {}).get('overall', 0),
-            "loadout_val_avg": eco_stats.get('loadout_value', {}).get('average', 0)
-        }
+def _drop_columns(table, columns):
+    if not table:
+        return
+    keep = [i for i, c in enumerate(table['cols']) if c not in columns]
+    table['cols'] = [table['cols'][i] for i in keep]
+    table['rows'] = [[row[i] for i in keep] for row in table['rows']]
 
-        # Advanced Metrics Stub 
-        adv_combat = calculate_advanced_combat(rounds, puuid, team)
-        first_bloods = calculate_first_bloods(rounds, puuid)
-        pos_stats = calculate_positioning(rounds, puuid)
-        adv_eco = calculate_advanced_economy(rounds, puuid, team)
-        
-        # Match Context (Scoreboard)
-        scoreboard = [get_simple_player_stats(p, rounds_played) for p in players]
-        scoreboard.sort(key=lambda x: x['acs'], reverse=True)
+def _top_rows(table, n):
+    """Keeps the target's row plus the top n by ACS (rows are already ACS-sorted)."""
+    if not table:
+        return
+    target = table.get('target')
+    table['rows'] = [row for i, row in enumerate(table['rows']) if i < n or row[0] == target]
 
-        # Robust Win Check
-        team_key = team.lower() # 'red' or 'blue'
-        team_data = match_info.get('teams', {}).get(team_key, {})
-        
-        # Primary Check: 'has_won' boolean
-        won_match = team_data.get('has_won', False)
+def _num(v):
+    return int(v) if isinstance(v, float) and v.is_integer() else v
+
+def _alias(key, used):
+    short, legend = KEY_ALIASES.get(key, (key, None))
+    if legend:
+        used[short] = legend
+    return short
+
+def _shorten(value, used):
+    """Renames keys through KEY_ALIASES (recording legend entries) and tightens floats."""
+    if isinstance(value, dict):
+        return {_alias(k, used): _shorten(v, used) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shorten(v, used) for v in value]
+    return _num(value)
+
+def compact_sections(minified):
+    """minified_match dict -> same data with the per-round economy and scoreboard as tables."""
+    data = json.loads(json.dumps(minified))
+    clutches = data.get('combat_advanced', {}).get('clutches')
+    if clutches is not None:
+        data['combat_advanced']['clutches'] = {k: v for k, v in clutches.items() if v}
+    obj = data.get('objective_and_economy', {})
+    if obj.get('economy_full'):
+        obj['economy_full'] = _table(obj['economy_full'], ECONOMY_COLUMNS)
+    if data.get('scoreboard'):
+        rows = []
+        for p in data['scoreboard']:
+            combat = p.get('combat') or {}
+            rows.append(dict(p, **combat))
+        data['scoreboard'] = _table(rows, SCOREBOARD_COLUMNS)
+        identity = data.get('identity', {})
+        data['scoreboard']['target'] = f"{identity.get('name')}#{identity.get('tag')}"
+    return data
+
+def _render_compact(data, trimmed):
+    """Legend line + whitespace-free JSON. data is consumed (column names are aliased in place)."""
+    used = {}
+    for table in (data.get('scoreboard'), data.get('objective_and_economy', {}).get('economy_full')):
+        if table:
+            table.pop('target', None)
+            table['cols'] = [_alias(c, used) for c in table['cols']]
+    body = json.dumps(_shorten(data, used), separators=(',', ':'), ensure_ascii=False)
+    legend = "KEYS: " + "; ".join(f"{k}={v}" for k, v in sorted(used.items()))
+    if trimmed:
+        legend += f" | OMITTED FOR LENGTH: {', '.join(trimmed)}"
+    return legend + "\n" + body
+
+def encode_prompt_data(minified, budget_tokens=0, encoding=None):
+    """
+    Text for the [DATA_START]..[DATA_END] block.
+    Returns (text, trimmed section names). With a budget (tokens for this block),
+    TRIM_STEPS are applied in order until the estimate fits.
+    """
+    encoding = encoding or PROMPT_ENCODING
+    if encoding != 'compact':
+        return json.dumps(minified, indent=2), []
+
+    data = compact_sections(minified)
+    trimmed = []
+    text = _render_compact(json.loads(json.dumps(data)), trimmed)
+    for name, step in TRIM_STEPS:
+        if not budget_tokens or estimate_tokens(text) <= budget_tokens:
+            break
+        step(data)
+        trimmed.append(name)
+        text = _render_compact(json.loads(json.dumps(data)), trimmed)
+    return text, trimmed
+
+def builder_version():
+    """
+    Hash of the builder's source, the percentile module it renders and the
+    match_stream projection it reads from, so any change invalidates the memo.
+    """
+    try:
+        h = hashlib.sha256()
+        sources = [__file__] + [m.__file__ for m in (percentiles, match_stream) if m]
+        for path in sources:
+            with open(os.path.abspath(path), 'rb') as f:
+                h.update(f.read())
+        return h.hexdigest()[:16]
+    except (OSError, NameError):
+        return 'unknown'
+
+def memo_key(match_id, target_player):
+    if not MEMO_DIR or not match_id:
+        return None
+    # Riot names are case-insensitive: 'WorstJett' and 'worstjett' share one entry
+    raw = f"{match_id.strip().lower()}|{(target_player or '').strip().lower()}|{builder_version()}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def read_memo(key):
+    """Returns (match_stats text, minified_match text, percentile query text) for a memo key, or None."""
+    if not key:
+        return None
+    memo_path = os.path.join(MEMO_DIR, key[:2], key)
+    try:
+        contents = []
+        for name in MEMO_FILES:
+            with open(os.path.join(memo_path, name), 'r') as f:
+                contents.append(f.read())
+    except OSError:
+        return None
+    return contents[0], contents[1], contents[2]
+
+def write_memo(key, stats_text, minified_text, query_text):
+    if not key:
+        return
+    memo_path = os.path.join(MEMO_DIR, key[:2], key)
+    tmp_path = f"{memo_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, content in zip(MEMO_FILES, [stats_text, minified_text, query_text]):
+            with open(os.path.join(tmp_path, name), 'w') as f:
+                f.write(content)
+        os.replace(tmp_path, memo_path)
+    except OSError as e:
+        # Another run may have saved the same key first; the memo is an optimisation only
+        print(f"Memo save skipped: {e}")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def load_match_data(path):
+    """Loads a v2 match payload, keeping only the fields the metrics read when possible."""
+    size = os.path.getsize(path)
+    tracing.counter('payload_bytes', size, source='match')
+    with tracing.span('parse', parser='stream' if match_stream else 'json') as sp:
+        sp.set('bytes', size)
+        if match_stream:
+            return match_stream.load_projected(path)
+        with open(path, 'r') as f:
+            return json.load(f)
+
+def build_outputs(data, target_player_name):
+    """
+    Builds (stats_markdown, minified) from a v2 match payload, percentiles included.
+    stats_markdown is None when the target player is not in the match.
+    """
+    stats_markdown, minified, query = build_base_outputs(data, target_player_name)
+    if stats_markdown is None:
+        return stats_markdown, minified
+    return apply_percentiles(stats_markdown, minified, query)
+
+# The percentile line goes right above the utility block of match_stats.txt
+PERCENTILE_ANCHOR = "\n\n**🛡️ Utility Usage:**"
+
+def apply_percentiles(stats_text, minified, query):
+    """
+    Looks up the percentile context for a build_base_outputs query against the
+    current sketches and adds it to both outputs. Returns (stats_text, minified).
+    """
+    if not percentiles or not query:
+        return stats_text, minified
+    context = percentiles.lookup(query['rank'], query['agent'], query['map'], query['mode'], query['values'])
+    if not context:
+        return stats_text, minified
+    minified = dict(minified, percentiles=context)
+    line = percentiles.format_line(context)
+    if PERCENTILE_ANCHOR in stats_text:
+        stats_text = stats_text.replace(PERCENTILE_ANCHOR, "\n" + line + PERCENTILE_ANCHOR, 1)
+    else:
+        stats_text += "\n" + line + "\n"
+    return stats_text, minified
+
+def build_base_outputs(data, target_player_name):
+    """
+    Builds (stats_markdown, minified, percentile query) from a v2 match payload,
+    without percentiles: this is what the memo keeps. The query holds what
+    apply_percentiles() looks up. stats_markdown is None when the target player
+    is not in the match.
+    """
+    match_info = data.get('data', {})
+    metadata = match_info.get('metadata', {})
+    players = match_info.get('players', {}).get('all_players', [])
+    rounds = match_info.get('rounds', [])
+    if not rounds and 'rounds' in data: 
+         rounds = data.get('rounds', [])
+
+    # 2. Extract Match Context
+    map_name = metadata.get('map', 'Unknown')
+    mode = metadata.get('mode', 'Standard')
+    rounds_played = metadata.get('rounds_played', 0)
+    
+    # 3. Find THE Target Player
+    if target_player_name:
+        player = next((p for p in players if p.get('name', '').lower() == target_player_name), None)
+    else:
+        player = max(players, key=lambda x: x.get('stats', {}).get('score', 0))
+
+    if not player:
+        return None, {"error": "Player not found"}, None
+
+    # 4. Extract Metrics (Basic)
+    stats = player.get('stats', {})
+    puuid = player.get('puuid')
+    team = player.get('team', 'Blue')
+    agent = player.get('character', 'Unknown Agent')
+    
+    k = stats.get('kills') or 0
+    d = stats.get('deaths') or 0
+    a = stats.get('assists') or 0
+    
+    # Index the match once; every metric below reads from it
+    index = build_match_index(players, rounds)
+
+    damage = stats.get('damage_made') or stats.get('damage', 0)
+    # Fallback ADR
+    if damage == 0 and rounds:
+         for _, ps in player_round_stats(index, puuid):
+            damage += ps.get('damage', 0)
+    adr = round(damage / rounds_played, 0) if rounds_played > 0 else 0
+    avg_score = round(stats.get('score', 0) / rounds_played, 0) if rounds_played > 0 else 0
+
+    # HS%
+    head = stats.get('headshots') or 0
+    body = stats.get('bodyshots') or 0
+    leg = stats.get('legshots') or 0
+    total_hits = head + body + leg
+    hs_percent = round((head / total_hits * 100), 1) if total_hits > 0 else 0
+    
+    # Utility
+    casts = player.get('ability_casts') or {}
+    if casts is None: casts = {}
+    
+    c_cast = casts.get('c_cast') or 0
+    q_cast = casts.get('q_cast') or 0
+    e_cast = casts.get('e_cast') or 0
+    x_cast = casts.get('x_cast') or 0
+    
+    # Fallback Utility
+    if (c_cast + q_cast + e_cast + x_cast) == 0 and rounds:
+        for _, ps in player_round_stats(index, puuid):
+            round_casts = ps.get('ability_casts') or {}
+            if round_casts:
+                c_cast += (round_casts.get('c_cast') or round_casts.get('c_casts') or 0)
+                q_cast += (round_casts.get('q_cast') or round_casts.get('q_casts') or 0)
+                e_cast += (round_casts.get('e_cast') or round_casts.get('e_casts') or 0)
+                x_cast += (round_casts.get('x_cast') or round_casts.get('x_casts') or 0)
+
+    plants = stats.get('plants', 0)
+    defuses = stats.get('defuses', 0)
+    
+    # Economy (Full)
+    economy_full = get_economy_start(index, puuid)
+    eco_stats = player.get('economy', {})
+    eco_summary = {
+        "spent_overall": eco_stats.get('spent', {}).get('overall', 0),
+        "spent_avg": eco_stats.get('spent', {}).get('average', 0),
+        "loadout_val_overall": eco_stats.get('loadout_value', {}).get('overall', 0),
+        "loadout_val_avg": eco_stats.get('loadout_value', {}).get('average', 0)
+    }
+
+    # Advanced Metrics Stub 
+    combat_batch = calculate_combat_batch(index)
+    timeline = build_round_timeline(index)
+    adv_combat = calculate_advanced_combat(index, puuid, team, combat_batch, timeline)
+    first_bloods = calculate_first_bloods(index, puuid)
+    pos_stats = calculate_positioning(index, puuid, combat_batch)
+    adv_eco = calculate_advanced_economy(index, puuid, team)
+    
+    # Match Context (Scoreboard)
+    scoreboard = [
+        get_simple_player_stats(p, rounds_played, get_combat_summary(combat_batch, index['ids'][p['puuid']]) if p.get('puuid') in index['ids'] else None)
+        for p in players
+    ]
+    scoreboard.sort(key=lambda x: x['acs'], reverse=True)
+
+    # Robust Win Check
+    team_key = team.lower() # 'red' or 'blue'
+    team_data = match_info.get('teams', {}).get(team_key, {})
+    
+    # Primary Check: 'has_won' boolean
+    won_match = team_data.get('has_won', False)
+    
+    # Fallback: Compare rounds if has_won is missing or ambiguous
+    if 'has_won' not in team_data:
+         my_rounds = team_data.get('rounds_won', 0)
+         enemy_key = 'blue' if team_key == 'red' else 'red'
+         enemy_rounds = match_info.get('teams', {}).get(enemy_key, {}).get('rounds_won', 0)
+         won_match = my_rounds > enemy_rounds
+
+    # Calculate Relative Score
+    red_rounds = match_info.get('teams', {}).get('red', {}).get('rounds_won', 0)
+    blue_rounds = match_info.get('teams', {}).get('blue', {}).get('rounds_won', 0)
+    
+    if team_key == 'red':
+        my_score = red_rounds
+        enemy_score = blue_rounds
+    else:
+        my_score = blue_rounds
+        enemy_score = red_rounds
         
-        # Fallback: Compare rounds if has_won is missing or ambiguous
-        if 'has_won' not in team_data:
-             my_rounds = team_data.get('rounds_won', 0)
-             enemy_key = 'blue' if team_key == 'red' else 'red'
-             enemy_rounds = match_info.get('teams', {}).get(enemy_key, {}).get('rounds_won', 0)
-             won_match = my_rounds > enemy_rounds
-
-        # Calculate Relative Score
-        red_rounds = match_info.get('teams', {}).get('red', {}).get('rounds_won', 0)
-        blue_rounds = match_info.get('teams', {}).get('blue', {}).get('rounds_won', 0)
+    # Sanity Fix: If Result says Victory but score implies loss, trust Result and swap scores.
+    # This protects against API data inconsistencies or team mapping errors.
+    if won_match and my_score < enemy_score:
+         my_score, enemy_score = enemy_score, my_score
+    elif not won_match and my_score > enemy_score:
+         my_score, enemy_score = enemy_score, my_score
+         
+    score_str = f"{my_score} - {enemy_score}"
+
+    # 5. Construct Minified JSON
+    minified = {
+        "metadata": {
+            "map": map_name,
+            "mode": mode,
+            "result": "Victory" if won_match else "Defeat",
+            "rounds_played": rounds_played,
+            "score_string": score_str
+        },
+        "identity": {
+            "name": player.get('name'),
+            "tag": player.get('tag'),
+            "agent": agent,
+            "rank": player.get('currenttier_patched', 'Unranked'),
+            "team": team
+        },
+        "combat": {
+            "kda": f"{k}/{d}/{a}",
+            "adr": adr,
+            "hs_percent": hs_percent,
+            "acs": avg_score
+        },
+        "combat_advanced": adv_combat,
+        "positioning": pos_stats,
+        "economy_context": adv_eco,
         
-        if team_key == 'red':
-            my_score = red_rounds
-            enemy_score = blue_rounds
-        else:
-            my_score = blue_rounds
-            enemy_score = red_rounds
-            
-        # Sanity Fix: If Result says Victory but score implies loss, trust Result and swap scores.
-        # This protects against API data inconsistencies or team mapping errors.
-        if won_match and my_score < enemy_score:
-             my_score, enemy_score = enemy_score, my_score
-        elif not won_match and my_score > enemy_score:
-             my_score, enemy_score = enemy_score, my_score
-             
-        score_str = f"{my_score} - {enemy_score}"
-
-        # 5. Construct Minified JSON
-        minified = {
-            "metadata": {
-                "map": map_name,
-                "mode": mode,
-                "result": "Victory" if won_match else "Defeat",
-                "rounds_played": rounds_played,
-                "score_string": score_str
-            },
-            "identity": {
-                "name": player.get('name'),
-                "tag": player.get('tag'),
-                "agent": agent,
-                "rank": player.get('currenttier_patched', 'Unranked'),
-                "team": team
-            },
-            "combat": {
-                "kda": f"{k}/{d}/{a}",
-                "adr": adr,
-                "hs_percent": hs_percent,
-                "acs": avg_score
-            },
-            "combat_advanced": adv_combat,
-            "positioning": pos_stats,
-            "economy_context": adv_eco,
-            
-            "utility": {
-                "ultimate_casts": x_cast,
-                "ability_e_casts": e_cast,
-                "ability_q_casts": q_cast,
-                "ability_c_casts": c_cast
-            },
-            "objective_and_economy": {
-                "plants": plants,
-                "defuses": defuses,
-                "economy_full": economy_full,
-                "economy_summary": eco_summary
-            },
-            "scoreboard": scoreboard
+        "utility": {
+            "ultimate_casts": x_cast,
+            "ability_e_casts": e_cast,
+            "ability_q_casts": q_cast,
+            "ability_c_casts": c_cast
+        },
+        "objective_and_economy": {
+            "plants": plants,
+            "defuses": defuses,
+            "economy_full": economy_full,
+            "economy_summary": eco_summary
+        },
+        "scoreboard": scoreboard
+    }
+    
+    # Percentile query for this rank/agent/map (looked up by apply_percentiles)
+    target_pid = index['ids'].get(puuid, -1)
+    duels_taken = combat_batch['duels_taken'][target_pid] if target_pid >= 0 else 0
+    percentile_query = {
+        "rank": minified['identity']['rank'],
+        "agent": agent,
+        "map": map_name,
+        "mode": mode,
+        "values": {
+            "acs": avg_score,
+            "adr": adr,
+            "hs_percent": hs_percent if total_hits > 0 else None,
+            "kd": k / d if d > 0 else float(k),
+            "first_duel_win": combat_batch['duels_won'][target_pid] / duels_taken * 100 if duels_taken else None
         }
-        
-        # 6. Build Outputs
-        
-        # Mode-Specific Context Note for Stats
-        is_standard_mode = mode.lower() in ['competitive', 'unrated', 'premier', 'swiftplay', 'standard', 'custom game']
-        mode_note = f"(Mode: {mode})" if is_standard_mode else f"(Mode: {mode} - Fun/Warmup, Stats may be limited)"
-
-        # Construct Visual Stats Summary (match_stats.txt)
-        # This is solely for the LLM to 'see' the formatted data or for user display.
-        # It does NOT contain coaching instructions.
-        stats_markdown = f"""
+    }
+
+    # 6. Build Outputs
+    
+    # Mode-Specific Context Note for Stats
+    is_standard_mode = mode.lower() in ['competitive', 'unrated', 'premier', 'swiftplay', 'standard', 'custom game']
+    mode_note = f"(Mode: {mode})" if is_standard_mode else f"(Mode: {mode} - Fun/Warmup, Stats may be limited)"
+
+    # Construct Visual Stats Summary (match_stats.txt)
+    # This is solely for the LLM to 'see' the formatted data or for user display.
+    # It does NOT contain coaching instructions.
+    stats_markdown = f"""
 ### 📝 Match Context
 **👤 Player:** {player.get('name')} | **🏆 Rank:** {minified['identity']['rank']}
 **🦸 Agent:** {agent} | **📍 Map:** {map_name}
@@ -516,18 +1042,67 @@ def main():
 • **Ability (Q):** {q_cast} | **Ability (C):** {c_cast}
 """
 
+    return stats_markdown, minified, percentile_query
+
+def build_cached(match_id, target_player_name, load_data):
+    """
+    Memo read -> (load_data() + build + memo write on a miss) -> percentile
+    lookup -> percentile ingest of a freshly loaded match.
+    Returns (stats_markdown, minified) like build_outputs.
+    """
+    key = memo_key(match_id, target_player_name)
+    with tracing.span('memo_read') as sp:
+        memo = read_memo(key)
+        sp.set('hit', bool(memo))
+    data = None
+    if memo:
+        print(f"Build memo HIT ({key[:12]})")
+        stats_markdown, minified, query = memo[0], json.loads(memo[1]), json.loads(memo[2])
+    else:
+        data = load_data()
+        with tracing.span('metrics'):
+            stats_markdown, minified, query = build_base_outputs(data, target_player_name)
+        if stats_markdown is None:
+            return stats_markdown, minified
+        write_memo(key, stats_markdown, json.dumps(minified, indent=2), json.dumps(query))
+
+    # Percentiles against the current sketches (never memoised)
+    with tracing.span('percentiles'):
+        stats_markdown, minified = apply_percentiles(stats_markdown, minified, query)
+
+    # Feed this match into the percentile sketches (after the lookup, so it is not ranked against itself)
+    if percentiles and data is not None:
+        percentiles.ingest_payload(data)
+    return stats_markdown, minified
+
+def main():
+    try:
+        target_player_name = os.environ.get("TARGET_PLAYER", "").lower()
+
+        # Memo hit (same match, same player, same builder code), else load + build
+        stats_markdown, minified = build_cached(
+            os.environ.get("MATCH_ID", ""), target_player_name, lambda: load_match_data('match_data.json')
+        )
+        if stats_markdown is None:
+            # Error handling same as before...
+            with open('prompt.txt', 'w') as f: f.write(minified['error'])
+            with open('minified_match.json', 'w') as f: json.dump(minified, f)
+            return
+
         with open('match_stats.txt', 'w') as f:
             f.write(stats_markdown)
             
         # Write Minified JSON (Data Payload)
         with open('minified_match.json', 'w') as f:
-            json.dump(minified, f, indent=2)
+            f.write(json.dumps(minified, indent=2))
 
     except Exception as e:
         print(f"Error: {e}")
         # Fallback outputs
         with open('match_stats.txt', 'w') as f: f.write(f"Error extracting stats: {e}")
         with open('minified_match.json', 'w') as f: json.dump({"error": str(e)}, f)
+    finally:
+        tracing.flush()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
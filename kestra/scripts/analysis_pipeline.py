@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+# Kestra drops sibling scripts next to this one as inputFiles
+sys.path.insert(0, os.getcwd())
+
+import ai_prompt_builder
+import analyze_context
+import ai_match_generator
+import http_client
+import progress
+import task_outputs
+import tracing
+
+# Fused analysis pipeline: builder -> router -> persona assembly -> generation
+# in one process, passing data in memory instead of through task files.
+# With an execution id, each stage's artifacts are published as soon as they
+# exist (progress.py), so the UI does not have to wait for the LLM.
+
+PROMPTS_DIR = os.environ.get('PROMPTS_DIR', 'prompts')
+
+MANUAL_PERSONAS = {
+    'Tactical Coach': 'tactical',
+    'Mental Coach': 'mental',
+    'The Backpack': 'backpack',
+    'The Validator': 'validator'
+}
+
+ROUTER_PERSONAS = {
+    'TEAM_DIFF': 'validator',
+    'CARRIED_WIN': 'backpack',
+    'CLOSE_MATCH': 'tactical',
+    'TILT_DETECTED': 'mental',
+    'STOMP_WIN': 'standard'
+}
+
+_persona_cache = {}
+
+def load_persona(decision_key):
+    """Persona prompt text for a key; read once per process."""
+    if decision_key not in _persona_cache:
+        with open(os.path.join(PROMPTS_DIR, f"{decision_key}.txt"), 'r') as f:
+            _persona_cache[decision_key] = f.read()
+    return _persona_cache[decision_key]
+
+def select_persona(agent_mode, manual_agent, router_decision):
+    """Maps the agent mode / router decision to a prompts/<key>.txt persona key."""
+    if agent_mode == 'manual':
+        return MANUAL_PERSONAS.get(manual_agent, 'standard')
+    return ROUTER_PERSONAS.get(router_decision, 'standard')
+
+def assemble_prompt(stats_text, persona_content, minified_text):
+    """Stats + Persona + Data, same layout as the old assemble_prompt task."""
+    return (
+        stats_text + "\n\n---\n\n" +
+        persona_content + "\n\n---\n\n" +
+        "[DATA_START]\n" + minified_text + "\n[DATA_END]\n"
+    )
+
+def persona_title(persona_content, decision_key):
+    first_line = persona_content.split('\n')[0].replace("ACT AS:", "").strip()
+    if not first_line: first_line = f"AI Coach ({decision_key})"
+    return f"### 🧠 Active Agent: {first_line}"
+
+@contextmanager
+def timed(timings, name):
+    """Records the wall-clock milliseconds of a pipeline stage into timings[name] (and a trace span)."""
+    t0 = time.time()
+    try:
+        with tracing.span(name):
+            yield
+    finally:
+        timings[name] = int((time.time() - t0) * 1000)
+
+def prepare(match_source, target_player='', agent_mode='autonomous', manual_agent='', match_id='', timings=None,
+            execution_id=''):
+    """
+    Build, route and assemble stages (everything before the LLM call).
+    match_source: parsed v2 payload (dict) or a path to match_data.json.
+    execution_id: publishes the stats, then the decision and persona, under this id.
+    Returns the state finish() needs: stats, context, decision, persona and the full prompt.
+    """
+    timings = {} if timings is None else timings
+    target_player = (target_player or '').lower()
+
+    # 1. Build (memo first, then parse + metrics; percentiles either way)
+    with timed(timings, 'build'):
+        stats_text, minified = ai_prompt_builder.build_cached(
+            match_id, target_player,
+            lambda: ai_prompt_builder.load_match_data(match_source) if isinstance(match_source, str) else match_source
+        )
+        if stats_text is None:
+            raise ValueError(minified['error'])
+        minified_text = json.dumps(minified, indent=2)
+    progress.publish(execution_id, 'stats', stats_text=stats_text, context=minified)
+
+    # 2. Route
+    with timed(timings, 'route'):
+        router_decision = "MANUAL_MODE"
+        if agent_mode != 'manual':
+            router_decision, summary = analyze_context.decide(minified)
+            print(summary)
+
+    # 3. Assemble
+    with timed(timings, 'assemble'):
+        decision_key = select_persona(agent_mode, manual_agent, router_decision)
+        print(f"Selecting Persona File: {decision_key}.txt (Decision: {router_decision})")
+        persona_content = load_persona(decision_key)
+        budget = ai_prompt_builder.PROMPT_TOKEN_BUDGET
+        if budget:
+            # The budget covers the whole prompt; the data block gets what stats + persona leave
+            budget = max(1, budget - ai_prompt_builder.estimate_tokens(assemble_prompt(stats_text, persona_content, '')))
+        data_text, trimmed = ai_prompt_builder.encode_prompt_data(minified, budget)
+        full_prompt = assemble_prompt(stats_text, persona_content, data_text)
+        prompt_tokens = {
+            "before": ai_prompt_builder.estimate_tokens(assemble_prompt(stats_text, persona_content, minified_text)),
+            "after": ai_prompt_builder.estimate_tokens(full_prompt),
+            "trimmed": trimmed
+        }
+        print(f"Prompt tokens (est): {prompt_tokens['before']} -> {prompt_tokens['after']}"
+              + (f" (trimmed: {', '.join(trimmed)})" if trimmed else ""))
+        tracing.counter('prompt_chars', len(full_prompt))
+        tracing.counter('prompt_tokens_est', prompt_tokens['after'])
+        persona_name = persona_title(persona_content, decision_key)
+    progress.publish(execution_id, 'routed', decision=router_decision, persona=persona_name)
+
+    return {
+        "stats_text": stats_text,
+        "context": minified,
+        "decision": router_decision,
+        "persona": persona_name,
+        "prompt": full_prompt,
+        "prompt_tokens": prompt_tokens,
+        "timings": timings,
+        "execution_id": execution_id
+    }
+
+def finish(prepared, stream=None):
+    """
+    Generate stage; returns the analysis.json dict: { text, context, decision, persona, prompt_tokens, timings }.
+    stream: defaults to LLM_STREAM; the text so far is published as the execution's 'generating' progress,
+    and the result gets the request's stream_metrics.
+    """
+    timings = prepared['timings']
+    execution_id = prepared.get('execution_id', '')
+    stream_metrics = {}
+    generation_error = None
+    with timed(timings, 'generate'):
+        try:
+            ai_text = ai_match_generator.generate_analysis(
+                prepared['prompt'], stream=stream, stream_metrics=stream_metrics,
+                on_text=lambda text: progress.publish(execution_id, 'generating', partial=text)
+            )
+        except Exception as e:
+            generation_error = str(e)
+            ai_text = f"AI Generation Failed: {generation_error}"
+            print(ai_text)
+
+    # Format: Stats [Newline] Persona Name [Newline] AI Analysis
+    text = prepared['stats_text'] + "\n" + prepared['persona'] + "\n\n" + ai_text
+    progress.publish(execution_id, 'done', text=text)
+    result = {
+        "text": text,
+        "context": prepared['context'],
+        "decision": prepared['decision'],
+        "persona": prepared['persona'],
+        "prompt_tokens": prepared['prompt_tokens'],
+        "timings": timings
+    }
+    if stream_metrics:
+        result['stream_metrics'] = stream_metrics
+    if generation_error:
+        result['generation_error'] = generation_error
+    return result
+
+def run_pipeline(match_source, target_player='', agent_mode='autonomous', manual_agent='', match_id='', execution_id='',
+                 stream=None):
+    """Runs the whole analysis in memory. Returns the analysis.json dict."""
+    start = time.time()
+    result = finish(prepare(match_source, target_player, agent_mode, manual_agent, match_id, execution_id=execution_id),
+                    stream=stream)
+    result['timings']['total'] = int((time.time() - start) * 1000)
+    return result
+
+def main():
+    match_file = os.environ.get('MATCH_FILE', 'match_data.json')
+    execution_id = os.environ.get('KESTRA_EXECUTION_ID', '')
+    try:
+        result = run_pipeline(
+            match_file,
+            target_player=os.environ.get('TARGET_PLAYER', ''),
+            agent_mode=os.environ.get('AGENT_MODE', 'autonomous'),
+            manual_agent=os.environ.get('MANUAL_AGENT', ''),
+            match_id=os.environ.get('MATCH_ID', ''),
+            execution_id=execution_id
+        )
+    except Exception as e:
+        print(f"Pipeline Error: {e}")
+        result = {"text": f"Error extracting stats: {e}", "timings": {}}
+        progress.publish(execution_id, 'failed', error=str(e))
+
+    task_outputs.write_analysis(result)
+    http_client.print_metrics()
+    tracing.flush()
+
+if __name__ == "__main__":
+    main()
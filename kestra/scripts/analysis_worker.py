@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Spans would pile up in a process that never exits: each request's spans are
+# captured (tracing.capture) and returned to the calling task instead
+os.environ.setdefault('TRACE_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ai_match_generator
+import analysis_pipeline
+import ai_prompt_builder
+import analyze_context
+import chat_session
+import henrik_client
+import http_client
+import match_store
+import prewarm
+import progress
+import tracing
+
+# Resident analysis worker.
+# One long-running process serves the prompt-building, routing, generation
+# and chat operations over HTTP, so a Kestra task only makes one local call
+# instead of starting a container, installing packages and re-reading the
+# personas. Personas stay cached in memory, and the pooled Ollama session
+# stays open. At most WORKER_CONCURRENCY operations run at once; up to
+# WORKER_MAX_QUEUE more wait, and further requests get a 503. /health reports
+# the queue depth and per-operation latency percentiles. The POST operations
+# are only accepted from loopback and the hosts in WORKER_ALLOWED_CLIENTS (the
+# Kestra container); anyone else only gets the read-only GET endpoints.
+#
+#   POST /build    {match_id, player_name, agent_mode?, manual_agent?, match?, execution_id?} -> prompt + routing
+#   POST /route    {context}                                                                -> decision
+#   POST /generate {prompt}                                                                 -> text
+#   POST /analyze  {match_id, player_name, agent_mode?, manual_agent?, execution_id?, stream?} -> analysis.json
+#   POST /chat     {message, match_id?, player_name?, session_id?, context?, execution_id?, stream?} -> reply.json
+#   POST /prewarm  {player_name, match_ids}  queues background analyses (prewarm.py)
+#   POST /warmup   loads personas, opens the pooled session, asks Ollama to load the model
+#   GET  /health
+#   GET  /progress/<execution_id>   artifacts published so far, streamed text included (progress.py)
+
+PORT = int(os.environ.get('WORKER_PORT', '8790'))
+CONCURRENCY = max(1, int(os.environ.get('WORKER_CONCURRENCY', '4')))
+MAX_QUEUE = int(os.environ.get('WORKER_MAX_QUEUE', '32'))
+LATENCY_WINDOW = 500
+# Hostnames or IPs allowed to call the POST operations, besides loopback
+ALLOWED_CLIENTS = [h.strip() for h in os.environ.get('WORKER_ALLOWED_CLIENTS', 'kestra').split(',') if h.strip()]
+# Container IPs change on restart: hostnames are resolved again after this long
+RESOLVE_TTL_SEC = 60
+
+PERSONAS = sorted(set(analysis_pipeline.MANUAL_PERSONAS.values()) |
+                  set(analysis_pipeline.ROUTER_PERSONAS.values()) | {'standard'})
+
+_slots = threading.BoundedSemaphore(CONCURRENCY)
+_lock = threading.Lock()
+_state = {"queued": 0, "inflight": 0, "rejected": 0, "analyze_requests": 0, "prewarm_hits": 0}
+_ops = {}
+_started = time.time()
+_last_prune = [0.0]
+_allowed = {"ips": set(), "resolved_at": 0.0}
+
+class WorkerError(Exception):
+    """Bad request payload (400)."""
+
+def record(op, ms, ok):
+    with _lock:
+        stats = _ops.setdefault(op, {"count": 0, "errors": 0, "latencies": deque(maxlen=LATENCY_WINDOW)})
+        stats['count'] += 1
+        if not ok:
+            stats['errors'] += 1
+        stats['latencies'].append(ms)
+
+def latency_summary():
+    out = {}
+    with _lock:
+        for op, stats in _ops.items():
+            ms = sorted(stats['latencies'])
+            out[op] = {
+                "count": stats['count'],
+                "errors": stats['errors'],
+                "p50_ms": ms[len(ms) // 2] if ms else 0,
+                "p95_ms": ms[min(len(ms) - 1, int(len(ms) * 0.95))] if ms else 0,
+                "max_ms": ms[-1] if ms else 0
+            }
+    return out
+
+def health():
+    with _lock:
+        state = dict(_state)
+    return {
+        "status": "ok",
+        "uptime_sec": int(time.time() - _started),
+        "concurrency": CONCURRENCY,
+        "queue_depth": state['queued'],
+        "inflight": state['inflight'],
+        "rejected": state['rejected'],
+        "personas_loaded": len(analysis_pipeline._persona_cache),
+        "ops": latency_summary(),
+        "prewarm": dict(
+            prewarm.stats(),
+            analyze_requests=state['analyze_requests'],
+            request_hit_rate=round(state['prewarm_hits'] / state['analyze_requests'] * 100, 1) if state['analyze_requests'] else 0
+        )
+    }
+
+def allowed_ips():
+    """Loopback plus the current addresses of ALLOWED_CLIENTS."""
+    now = time.time()
+    with _lock:
+        if now - _allowed['resolved_at'] < RESOLVE_TTL_SEC:
+            return _allowed['ips']
+    ips = {'127.0.0.1', '::1'}
+    for host in ALLOWED_CLIENTS:
+        try:
+            ips.update(info[4][0] for info in socket.getaddrinfo(host, None))
+        except OSError:
+            continue
+    with _lock:
+        _allowed.update(ips=ips, resolved_at=now)
+    return ips
+
+def client_allowed(address):
+    # IPv4-mapped IPv6 peers ('::ffff:172.18.0.2') compare as plain IPv4
+    return address.removeprefix('::ffff:') in allowed_ips()
+
+def require(payload, *keys):
+    missing = [k for k in keys if not payload.get(k)]
+    if missing:
+        raise WorkerError(f"missing field(s): {', '.join(missing)}")
+
+def load_match(payload, priority=None):
+    """Inline payload, or the shared match store (API on a miss)."""
+    if payload.get('match'):
+        return payload['match']
+    raw, _ = match_store.get_match(payload['match_id'], os.environ.get('VALO_API_URL', ''), os.environ.get('VALO_API_KEY', ''),
+                                   priority=priority)
+    if not match_store.is_complete_match(raw):
+        raise WorkerError(f"no match data for {payload['match_id']}")
+    return json.loads(raw)
+
+def op_build(payload):
+    require(payload, 'match_id')
+    return analysis_pipeline.prepare(
+        load_match(payload), payload.get('player_name', ''), payload.get('agent_mode', 'autonomous'),
+        payload.get('manual_agent', ''), payload['match_id'], execution_id=payload.get('execution_id', '')
+    )
+
+def op_route(payload):
+    require(payload, 'context')
+    decision, summary = analyze_context.decide(payload['context'])
+    return {"decision": decision, "summary": summary}
+
+def op_generate(payload):
+    require(payload, 'prompt')
+    return {"text": ai_match_generator.generate_analysis(payload['prompt'])}
+
+def prune_progress():
+    """Drops expired progress records, at most once a minute."""
+    now = time.time()
+    if now - _last_prune[0] >= 60:
+        _last_prune[0] = now
+        progress.prune()
+
+def prewarmed_result(payload, start):
+    """The pre-warmed analysis for an autonomous request, republished as progress; None on a miss."""
+    if payload.get('agent_mode', 'autonomous') != 'autonomous':
+        return None
+    prewarm.cancel(payload['match_id'], payload.get('player_name', ''))
+    result = prewarm.take_result(payload['match_id'], payload.get('player_name', ''))
+    if result is None:
+        return None
+    execution_id = payload.get('execution_id', '')
+    progress.publish(execution_id, 'stats', context=result.get('context'))
+    progress.publish(execution_id, 'routed', decision=result.get('decision'), persona=result.get('persona'))
+    progress.publish(execution_id, 'done', text=result.get('text'))
+    result['timings'] = {"prewarm": int((time.time() - start) * 1000)}
+    result['prewarmed'] = True
+    return result
+
+def op_analyze(payload):
+    require(payload, 'match_id')
+    prune_progress()
+    start = time.time()
+    with _lock:
+        _state['analyze_requests'] += 1
+    result = prewarmed_result(payload, start)
+    if result is not None:
+        with _lock:
+            _state['prewarm_hits'] += 1
+        result['timings']['total'] = result['timings']['prewarm']
+        return result
+    try:
+        prepared = op_build(payload)
+    except Exception as e:
+        progress.publish(payload.get('execution_id', ''), 'failed', error=str(e))
+        raise
+    result = analysis_pipeline.finish(prepared, stream=bool(payload.get('stream')))
+    result['timings']['total'] = int((time.time() - start) * 1000)
+    return result
+
+def op_chat(payload):
+    require(payload, 'message')
+    prune_progress()
+    context = payload.get('context')
+    if context is not None and not isinstance(context, str):
+        context = json.dumps(context)
+    return chat_session.handle_turn(
+        payload['message'], payload.get('match_id', ''), payload.get('player_name', ''),
+        payload.get('session_id', ''), context, stream=bool(payload.get('stream')),
+        execution_id=payload.get('execution_id', '')
+    )
+
+def op_prewarm(payload):
+    require(payload, 'match_ids')
+    if not prewarm.running():
+        # PREWARM_TOP_N=0: nothing would ever run the jobs
+        return {"queued": [], "skipped": [], "cancelled": [], "disabled": True}
+    ids = payload['match_ids']
+    if isinstance(ids, str):
+        ids = ids.replace(',', ' ').split()
+    # A caller may ask for fewer matches, never more than the worker's own setting
+    top_n = min(int(payload.get('top_n', prewarm.TOP_N)), prewarm.TOP_N)
+    return prewarm.enqueue(payload.get('player_name', ''), [str(m) for m in ids], is_seen=memo_seen, top_n=top_n)
+
+def memo_seen(match_id, player):
+    """Already analysed (built) for this player: the build memo has it."""
+    return ai_prompt_builder.read_memo(ai_prompt_builder.memo_key(match_id, player)) is not None
+
+def prewarm_analyze(match_id, player):
+    """Background job: the autonomous pipeline, with background priority on the HenrikDev bucket."""
+    match = load_match({"match_id": match_id}, priority=henrik_client.BACKGROUND)
+    result = analysis_pipeline.finish(analysis_pipeline.prepare(match, player, 'autonomous', '', match_id))
+    if 'generation_error' in result:
+        # Not worth keeping: the interactive request should try the model again
+        raise RuntimeError(result['generation_error'])
+    return result
+
+def interactive_busy():
+    with _lock:
+        return _state['inflight'] > 0 or _state['queued'] > 0
+
+def op_warmup(payload):
+    timings = {}
+    t0 = time.time()
+    for key in PERSONAS:
+        analysis_pipeline.load_persona(key)
+    timings['personas_ms'] = int((time.time() - t0) * 1000)
+
+    t0 = time.time()
+    http_client.get_session()
+    result = {"model_loaded": False}
+    host = os.environ.get('OLLAMA_HOST', 'https://ollama.com')
+    api_key = os.environ.get('OLLAMA_API_KEY')
+    headers = {'Authorization': f"Bearer {api_key}"} if api_key else {}
+    try:
+        # A prompt-less generate only loads the model (and keeps it for keep_alive)
+        response = http_client.post(
+            f"{host}/api/generate",
+            json={"model": os.environ.get('OLLAMA_MODEL', 'gpt-oss:120b-cloud'),
+                  "keep_alive": os.environ.get('CHAT_KEEP_ALIVE', '30m')},
+            headers=headers, read_timeout=60, retries=0
+        )
+        result['model_loaded'] = response.ok
+    except Exception as e:
+        result['model_error'] = str(e)
+    timings['model_ms'] = int((time.time() - t0) * 1000)
+    result['timings'] = timings
+    return result
+
+OPS = {
+    "build": op_build,
+    "route": op_route,
+    "generate": op_generate,
+    "analyze": op_analyze,
+    "chat": op_chat,
+    "prewarm": op_prewarm,
+    "warmup": op_warmup
+}
+
+def run_op(op, payload):
+    """Runs one operation under the concurrency limit. Returns (status, body)."""
+    with _lock:
+        if _state['queued'] >= MAX_QUEUE:
+            _state['rejected'] += 1
+            return 503, {"error": "worker queue full", "queue_depth": _state['queued']}
+        _state['queued'] += 1
+    _slots.acquire()
+    with _lock:
+        _state['queued'] -= 1
+        _state['inflight'] += 1
+
+    start = time.time()
+    ok = False
+    try:
+        with tracing.capture() as trace:
+            body = OPS[op](payload)
+        if isinstance(body, dict):
+            # Stage spans and token counters, replayed by worker_client as the task's metrics
+            body['trace'] = trace
+        ok = True
+        return 200, body
+    except WorkerError as e:
+        return 400, {"error": str(e)}
+    except Exception as e:
+        print(f"Worker {op} failed: {e}", flush=True)
+        return 500, {"error": str(e)}
+    finally:
+        record(op, int((time.time() - start) * 1000), ok)
+        with _lock:
+            _state['inflight'] -= 1
+        _slots.release()
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path in ('/health', '/metrics'):
+            return self._send(200, health())
+        if self.path.startswith('/progress/'):
+            record = progress.read(self.path[len('/progress/'):].split('?')[0])
+            return self._send(200, record) if record else self._send(404, {"error": "no progress for this execution"})
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not client_allowed(self.client_address[0]):
+            # The body is left unread: do not reuse the connection
+            self.close_connection = True
+            return self._send(403, {"error": "operations are only accepted from the Kestra network"})
+        op = self.path.strip('/')
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send(400, {"error": "invalid JSON body"})
+        if op not in OPS:
+            return self._send(404, {"error": f"unknown operation '{op}'"})
+        self._send(*run_op(op, payload))
+
+    def log_message(self, fmt, *args):
+        pass
+
+def main():
+    # Several requests share this process: streamed text goes to each execution's
+    # progress record (the request's `stream` flag), never to a task-local file
+    ai_match_generator.STREAM_FILE = ''
+    chat_session.PARTIAL_FILE = ''
+    if os.environ.get('WORKER_WARMUP', 'true').lower() in ('1', 'true', 'yes'):
+        print(f"Warmup: {json.dumps(op_warmup({}))}", flush=True)
+    if prewarm.TOP_N > 0:
+        prewarm.start(prewarm_analyze, interactive_busy)
+    server = ThreadingHTTPServer(('0.0.0.0', PORT), Handler)
+    server.daemon_threads = True
+    print(f"Analysis worker on :{PORT} (concurrency {CONCURRENCY}, queue {MAX_QUEUE})", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -2,71 +2,107 @@ import json
 import sys
 import os
 
+import tracing
+
+# Router thresholds. router_backtest.py evaluates alternative sets of these
+# keys against stored matches before a change ships.
+DEFAULT_RULES = {
+    "team_diff_min_kda": 1.5,   # TEAM_DIFF: KDA above this in a defeat
+    "carried_max_acs": 160,     # CARRIED_WIN: ACS below this in a victory
+    "close_max_score_diff": 3,  # CLOSE_MATCH: round difference up to this
+    "stomp_max_rounds": 18,     # STOMP_WIN: victory within this many rounds
+    "tilt_max_kda": 0.6         # TILT_DETECTED: KDA below this in a defeat
+}
+
+# In rule priority order; STANDARD is the fallback
+DECISIONS = ["TEAM_DIFF", "CARRIED_WIN", "CLOSE_MATCH", "STOMP_WIN", "TILT_DETECTED", "STANDARD"]
+
+def features(data):
+    """The router inputs of a minified match."""
+    metadata = data.get('metadata', {})
+    combat = data.get('combat', {})
+
+    result = metadata.get('result', 'Defeat') # Victory / Defeat
+    score_str = metadata.get('score_string', '0 - 0') # "13 - 11"
+    rounds_played = metadata.get('rounds_played', 0)
+
+    kda_str = combat.get('kda', '0/0/0') # "5/18/3"
+    try:
+        k, d, a = map(int, kda_str.split('/'))
+    except:
+        k, d, a = 0, 1, 0
+
+    # 2. Calculate Metrics
+    try:
+        s1, s2 = map(int, score_str.split(' - '))
+        score_diff = abs(s1 - s2)
+    except:
+        score_diff = 0
+
+    return {
+        "result": result,
+        "score_string": score_str,
+        "rounds_played": rounds_played,
+        "kda_ratio": k / d if d > 0 else k,
+        "acs": float(combat.get('acs', 0)),
+        "score_diff": score_diff
+    }
+
+def classify(f, rules=DEFAULT_RULES):
+    """Decision for one features() dict."""
+    result = f['result']
+
+    # 3. Determine State (Heuristics)
+    # Heuristics provided by Architect:
+
+    # 1. Team Diff / "Smurfing but Lost" (High KDA + Defeat)
+    # Needs to be before Close Match to override "Close Loss" if you carried hard.
+    if f['kda_ratio'] > rules['team_diff_min_kda'] and result == "Defeat":
+        return "TEAM_DIFF"
+
+    # 2. Carried Win (Low ACS + Victory). "The Backpack"
+    if f['acs'] < rules['carried_max_acs'] and result == "Victory":
+        return "CARRIED_WIN"
+
+    # 3. Close Match (Score diff <= 3 e.g., 13-10, 13-11, Overtime)
+    if f['score_diff'] <= rules['close_max_score_diff']:
+        return "CLOSE_MATCH"
+
+    # 3. Stomp Win (Fast match <= 18 rounds and Victory. 13-5 or better)
+    if f['rounds_played'] <= rules['stomp_max_rounds'] and result == "Victory":
+        return "STOMP_WIN"
+
+    # 4. Tilt Detected (Bad KDA < 0.6 and Defeat)
+    if f['kda_ratio'] < rules['tilt_max_kda'] and result == "Defeat":
+        return "TILT_DETECTED"
+
+    # 5. Standard (Everything else)
+    return "STANDARD"
+
+def decide(data, rules=None):
+    """
+    Routes a minified match to a persona decision.
+    Returns (decision, summary line).
+    """
+    f = features(data)
+    decision = classify(f, rules or DEFAULT_RULES)
+    summary = (f"Analysis: {f['result']} ({f['score_string']}), Rounds: {f['rounds_played']}, "
+               f"KDA: {f['kda_ratio']:.2f} -> Decision: {decision}")
+    return decision, summary
+
 def main():
     try:
         # 1. Load Data
-        with open('minified_match.json', 'r') as f:
-            data = json.load(f)
-            
-        print("DEBUG: analyze_context.py v3 Loaded")
-        
-        metadata = data.get('metadata', {})
-        combat = data.get('combat', {})
-        
-        print(f"DEBUG INPUT: metadata={metadata}, combat={combat}")
-        
-        result = metadata.get('result', 'Defeat') # Victory / Defeat
-        score_str = metadata.get('score_string', '0 - 0') # "13 - 11"
-        rounds_played = metadata.get('rounds_played', 0)
-        
-        kda_str = combat.get('kda', '0/0/0') # "5/18/3"
-        try:
-            k, d, a = map(int, kda_str.split('/'))
-        except:
-            k, d, a = 0, 1, 0
-            
-        # 2. Calculate Metrics
-        try:
-            s1, s2 = map(int, score_str.split(' - '))
-            score_diff = abs(s1 - s2)
-        except:
-            score_diff = 0
-            
-        kda_ratio = k / d if d > 0 else k
-        acs = float(combat.get('acs', 0))
-        
-        # 3. Determine State (Heuristics)
-        decision = "STANDARD" # Default
-        
-        # Heuristics provided by Architect:
-        
-        # 1. Team Diff / "Smurfing but Lost" (High KDA + Defeat)
-        # Needs to be before Close Match to override "Close Loss" if you carried hard.
-        if kda_ratio > 1.5 and result == "Defeat":
-            decision = "TEAM_DIFF"
-            
-        # 2. Carried Win (Low ACS + Victory). "The Backpack"
-        elif acs < 160 and result == "Victory":
-            decision = "CARRIED_WIN"
-
-        # 3. Close Match (Score diff <= 3 e.g., 13-10, 13-11, Overtime)
-        elif score_diff <= 3:
-            decision = "CLOSE_MATCH"
-            
-        # 3. Stomp Win (Fast match <= 18 rounds and Victory. 13-5 or better)
-        elif rounds_played <= 18 and result == "Victory":
-            decision = "STOMP_WIN"
-            
-        # 4. Tilt Detected (Bad KDA < 0.6 and Defeat)
-        elif kda_ratio < 0.6 and result == "Defeat":
-            decision = "TILT_DETECTED"
-            
-        # 5. Standard (Everything else)
-        else:
-            decision = "STANDARD"
-
-        print(f"Analysis: {result} ({score_str}), Rounds: {rounds_played}, KDA: {kda_ratio:.2f} -> Decision: {decision}")
-        
+        with tracing.span('parse') as sp:
+            with open('minified_match.json', 'r') as f:
+                data = json.load(f)
+                sp.set('bytes', f.tell())
+
+        with tracing.span('route') as sp:
+            decision, summary = decide(data)
+            sp.set('decision', decision)
+        print(summary)
+
         # 4. Kestra Output
         print(f"::set-output name=decision::{decision}", flush=True)
 
@@ -78,6 +114,8 @@ def main():
         print(f"Error analyzing context: {e}")
         # Fallback
         print("::set-output name=decision::STANDARD")
+    finally:
+        tracing.flush()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import asyncio
+
+# Kestra drops sibling scripts next to this one as inputFiles
+sys.path.insert(0, os.getcwd())
+
+import match_store
+import analysis_pipeline
+import ai_match_generator
+import http_client
+import tracing
+
+# Batch analysis of several matches for one player.
+# Every match runs fetch -> build/route/assemble -> generate as its own asyncio
+# task; the blocking stages run in worker threads. Stats API fetches and LLM
+# generations are gated by separate semaphores, so a slow model never holds
+# back fetching and parsing the other matches. Each result is appended to
+# batch_results.ndjson (and logged) as soon as it finishes; batch.json holds
+# all results plus a combined summary.
+
+API_CONCURRENCY = max(1, int(os.environ.get('BATCH_API_CONCURRENCY', '4')))
+LLM_CONCURRENCY = max(1, int(os.environ.get('BATCH_LLM_CONCURRENCY', '2')))
+MAX_MATCHES = int(os.environ.get('BATCH_MAX_MATCHES', '20'))
+RESULTS_FILE = 'batch_results.ndjson'
+
+def parse_match_ids(value):
+    """JSON list or comma / whitespace separated ids, de-duplicated in order."""
+    value = (value or '').strip()
+    if value.startswith('['):
+        ids = json.loads(value)
+    else:
+        ids = value.replace(',', ' ').split()
+    seen = []
+    for match_id in ids:
+        match_id = str(match_id).strip()
+        if match_id and match_id not in seen:
+            seen.append(match_id)
+    return seen[:MAX_MATCHES]
+
+async def analyze_one(match_id, player, agent_mode, manual_agent, api_url, api_key, api_slots, llm_slots):
+    """One match through the whole pipeline. Never raises: failures come back as {'error': ...}."""
+    timings = {}
+    start = time.time()
+    result = {"match_id": match_id}
+    try:
+        async with api_slots:
+            t0 = time.time()
+            raw, cache = await asyncio.to_thread(match_store.get_match, match_id, api_url, api_key)
+            timings['fetch'] = int((time.time() - t0) * 1000)
+        if not match_store.is_complete_match(raw):
+            raise ValueError(f"no match data ({len(raw)} bytes)")
+        result['cache'] = cache
+
+        payload = json.loads(raw)
+        prepared = await asyncio.to_thread(
+            analysis_pipeline.prepare, payload, player, agent_mode, manual_agent, match_id, timings
+        )
+        async with llm_slots:
+            analysis = await asyncio.to_thread(analysis_pipeline.finish, prepared)
+        result.update(analysis)
+    except Exception as e:
+        result['error'] = str(e)
+    timings['total'] = int((time.time() - start) * 1000)
+    result['timings'] = timings
+    return result
+
+def summarize(results, wall_ms):
+    """Combined view over the finished matches: record, averages, router decisions, timing."""
+    ok = [r for r in results if 'error' not in r]
+    summary = {
+        "matches": len(results),
+        "analyzed": len(ok),
+        "failed": [{"match_id": r['match_id'], "error": r['error']} for r in results if 'error' in r],
+        "wins": 0,
+        "losses": 0,
+        "draws": 0,
+        "decisions": {},
+        "wall_ms": wall_ms,
+        "sum_ms": sum(r['timings'].get('total', 0) for r in results),
+        "slowest_ms": max((r['timings'].get('total', 0) for r in results), default=0)
+    }
+    totals = {"acs": 0, "adr": 0, "hs_percent": 0}
+    for r in ok:
+        context = r.get('context', {})
+        outcome = context.get('metadata', {}).get('result', '')
+        if outcome == 'Victory':
+            summary['wins'] += 1
+        elif outcome == 'Defeat':
+            summary['losses'] += 1
+        else:
+            summary['draws'] += 1
+        summary['decisions'][r['decision']] = summary['decisions'].get(r['decision'], 0) + 1
+        combat = context.get('combat', {})
+        for key in totals:
+            totals[key] += combat.get(key) or 0
+    if ok:
+        summary['avg'] = {k: round(v / len(ok), 1) for k, v in totals.items()}
+    return summary
+
+def format_summary(summary):
+    lines = [
+        f"Analyzed {summary['analyzed']}/{summary['matches']} matches: "
+        f"{summary['wins']}W {summary['losses']}L {summary['draws']}D"
+    ]
+    if 'avg' in summary:
+        avg = summary['avg']
+        lines.append(f"Avg ACS {avg['acs']}, ADR {avg['adr']}, HS {avg['hs_percent']}%")
+    if summary['decisions']:
+        lines.append("Router: " + ", ".join(f"{k} x{v}" for k, v in sorted(summary['decisions'].items())))
+    for failure in summary['failed']:
+        lines.append(f"Failed {failure['match_id']}: {failure['error']}")
+    lines.append(f"Wall {summary['wall_ms']} ms (slowest match {summary['slowest_ms']} ms, sequential sum {summary['sum_ms']} ms)")
+    return "\n".join(lines)
+
+async def run_batch(match_ids, player, agent_mode='autonomous', manual_agent='', api_url='', api_key='', on_result=None):
+    """Runs all matches concurrently; on_result(result) is called as each one completes. Returns (results, summary)."""
+    api_slots = asyncio.Semaphore(API_CONCURRENCY)
+    llm_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+    start = time.time()
+    tasks = [
+        asyncio.create_task(analyze_one(m, player, agent_mode, manual_agent, api_url, api_key, api_slots, llm_slots))
+        for m in match_ids
+    ]
+    results = []
+    for done in asyncio.as_completed(tasks):
+        result = await done
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    # Report in request order, not completion order
+    order = {m: i for i, m in enumerate(match_ids)}
+    results.sort(key=lambda r: order[r['match_id']])
+    return results, summarize(results, int((time.time() - start) * 1000))
+
+def main():
+    match_ids = parse_match_ids(os.environ.get('MATCH_IDS', ''))
+    if not match_ids:
+        print("CRITICAL ERROR: MATCH_IDS is required")
+        sys.exit(1)
+
+    # Concurrent generations would all write the same stream file
+    ai_match_generator.STREAM = False
+    print(f"Batch: {len(match_ids)} matches (api x{API_CONCURRENCY}, llm x{LLM_CONCURRENCY})")
+
+    with open(RESULTS_FILE, 'w') as out:
+        def on_result(result):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            status = f"ERROR {result['error']}" if 'error' in result else result['decision']
+            print(f"[done] {result['match_id']}: {status} in {result['timings']['total']} ms", flush=True)
+
+        with tracing.span('batch', matches=len(match_ids)):
+            results, summary = asyncio.run(run_batch(
+                match_ids,
+                os.environ.get('TARGET_PLAYER', ''),
+                agent_mode=os.environ.get('AGENT_MODE', 'autonomous'),
+                manual_agent=os.environ.get('MANUAL_AGENT', ''),
+                api_url=os.environ.get('VALO_API_URL', ''),
+                api_key=os.environ.get('VALO_API_KEY', ''),
+                on_result=on_result
+            ))
+
+    with open('batch.json', 'w') as f:
+        json.dump({"summary": summary, "results": results}, f)
+
+    print(format_summary(summary))
+    print(f"::set-output name=analyzed::{summary['analyzed']}", flush=True)
+    print(f"::set-output name=wall_ms::{summary['wall_ms']}", flush=True)
+    print(f"::set-output name=sum_ms::{summary['sum_ms']}", flush=True)
+    http_client.print_metrics()
+    tracing.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import time
+import secrets
+import hashlib
+import sqlite3
+
+sys.path.insert(0, os.getcwd())
+import http_client
+import progress
+import task_outputs
+import tracing
+from ai_match_generator import stream_ollama, print_stream_metrics, stream_summary, record_tokens
+
+# Server-side chat sessions, one per conversation.
+# A turn without a session_id opens a new session under a random id, which is
+# returned to the client and sent back on the following turns; ids are never
+# derived from the match or player, so two viewers of the same match never
+# share a history.
+# The match context is sent once, when the session is opened, and baked into a
+# system prompt that never changes afterwards; later turns only carry the new
+# message. Every request therefore starts with the same bytes (system prompt +
+# the stored turns), which keeps Ollama's prompt cache warm, and keep_alive
+# holds the model in memory between turns.
+# History is trimmed in windows: once CHAT_MAX_MESSAGES is reached the oldest
+# half is dropped at once, so the cached prefix is only invalidated every
+# CHAT_MAX_MESSAGES / 2 messages instead of on every turn.
+# CHAT_ENDPOINT=generate uses /api/generate and stores the context tokens it
+# returns, so each turn sends just the new message plus those tokens.
+
+DB_PATH = os.environ.get('CHAT_SESSION_DB', '/app/data/chat_sessions.sqlite')
+MAX_MESSAGES = max(2, int(os.environ.get('CHAT_MAX_MESSAGES', '40')))
+KEEP_ALIVE = os.environ.get('CHAT_KEEP_ALIVE', '30m')
+ENDPOINT = os.environ.get('CHAT_ENDPOINT', 'chat')
+MAX_CONTEXT_TOKENS = int(os.environ.get('CHAT_MAX_CONTEXT_TOKENS', '16384'))
+SESSION_TTL_SEC = int(os.environ.get('CHAT_SESSION_TTL_SEC', str(7 * 86400)))
+# Streamed replies are appended here as they arrive (empty: no file); with an
+# execution id the text so far is also published as its progress (progress.py)
+PARTIAL_FILE = os.environ.get('CHAT_PARTIAL_FILE', 'reply.partial.txt')
+
+SYSTEM_TEMPLATE = """ACT AS: A Ruthless, Tier-1 Valorant Esports Coach.
+
+INSTRUCTIONS:
+You are chatting with the player. Answer their question based on the match data provided.
+Be concise, direct, and helpful. Use the stats to back up your points.
+Respond using bullet points or lists. DO NOT use Markdown Tables.
+
+CONTEXT DATA:
+{context}
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    match_id TEXT,
+    user TEXT,
+    context_hash TEXT,
+    system_prompt TEXT NOT NULL,
+    window_start INTEGER NOT NULL DEFAULT 0,
+    ollama_context TEXT,
+    created_at REAL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL REFERENCES sessions(session_id),
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at);
+"""
+
+def connect(path=DB_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def new_session_id():
+    return secrets.token_hex(12)
+
+def system_prompt(context):
+    """Deterministic rendering, so the same context always yields the same prompt bytes."""
+    return SYSTEM_TEMPLATE.format(context=json.dumps(context, separators=(',', ':'), ensure_ascii=False))
+
+def open_session(conn, session_id, match_id, user, context):
+    """
+    Returns the session row. A supplied context (re)creates the session when it is
+    new or differs from the stored one; without a context only an existing session is returned.
+    """
+    row = conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+    if context is None:
+        return row
+
+    prompt = system_prompt(context)
+    context_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    if row and row['context_hash'] == context_hash:
+        return row
+
+    now = time.time()
+    with conn:
+        conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, 0, NULL, ?, ?)",
+            (session_id, match_id, user, context_hash, prompt, now, now)
+        )
+    return conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+
+def history(conn, session):
+    rows = conn.execute(
+        "SELECT seq, role, content FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+        (session['session_id'], session['window_start'])
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+def save_turn(conn, session_id, message, reply, ollama_context=None, reset_context=False):
+    """Appends the user message and the reply (and stores / resets the Ollama context). Returns the turn number."""
+    now = time.time()
+    with conn:
+        last = conn.execute("SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+        seq = 0 if last is None else last + 1
+        conn.executemany(
+            "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+            [(session_id, seq, 'user', message, now), (session_id, seq + 1, 'assistant', reply, now)]
+        )
+        conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (now, session_id))
+        if ollama_context is not None or reset_context:
+            conn.execute(
+                "UPDATE sessions SET ollama_context = ? WHERE session_id = ?",
+                (json.dumps(ollama_context) if ollama_context is not None else None, session_id)
+            )
+    return seq // 2 + 1
+
+def slide_window(conn, session):
+    """
+    Once the window holds MAX_MESSAGES, moves its start so only the newest half
+    stays (starting on a user message). Returns True when it moved.
+    """
+    rows = conn.execute(
+        "SELECT seq, role FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+        (session['session_id'], session['window_start'])
+    ).fetchall()
+    if len(rows) < MAX_MESSAGES:
+        return False
+    keep = rows[-(MAX_MESSAGES // 2):]
+    while keep and keep[0]['role'] != 'user':
+        keep = keep[1:]
+    if not keep:
+        return False
+    with conn:
+        conn.execute("UPDATE sessions SET window_start = ? WHERE session_id = ?", (keep[0]['seq'], session['session_id']))
+    return True
+
+def prune(conn, ttl_sec=SESSION_TTL_SEC):
+    """Drops sessions idle for longer than ttl_sec."""
+    cutoff = time.time() - ttl_sec
+    with conn:
+        conn.execute(
+            "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE updated_at < ?)", (cutoff,)
+        )
+        conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+
+def chat_payload(model, session, turns, message):
+    messages = [{"role": "system", "content": session['system_prompt']}]
+    messages += [{"role": t['role'], "content": t['content']} for t in turns]
+    messages.append({"role": "user", "content": message})
+    return {"model": model, "messages": messages, "keep_alive": KEEP_ALIVE, "stream": False}
+
+def generate_payload(model, session, turns, message):
+    """
+    /api/generate request: the new message on top of the stored context tokens, or,
+    when there are none yet (new session, or the context was reset), the system
+    prompt plus the current window as a transcript.
+    """
+    payload = {"model": model, "keep_alive": KEEP_ALIVE, "stream": False}
+    if session['ollama_context']:
+        payload.update(prompt=message, context=json.loads(session['ollama_context']))
+        return payload
+    transcript = ''.join(
+        ("PLAYER: " if t['role'] == 'user' else "COACH: ") + t['content'] + "\n\n" for t in turns
+    )
+    payload.update(system=session['system_prompt'], prompt=transcript + "PLAYER: " + message)
+    return payload
+
+def send(host, api_key, payload, stream, execution_id='', stream_metrics=None):
+    """
+    Returns (reply text, Ollama context tokens or None). A streamed reply is published
+    as the execution's progress while it arrives, and stream_metrics (a dict) receives
+    the request's TTFT and tokens/sec.
+    """
+    endpoint = 'generate' if 'prompt' in payload else 'chat'
+    url = f"{host}/api/{endpoint}"
+    headers = {}
+    if api_key:
+        headers['Authorization'] = f"Bearer {api_key}"
+
+    with tracing.span('llm_request', model=payload['model'], endpoint=endpoint, stream=stream) as sp:
+        sp.set('request_bytes', len(json.dumps(payload)))
+        sp.set('messages', len(payload.get('messages', [])))
+        if stream:
+            text, metrics = stream_ollama(
+                url, payload, headers, PARTIAL_FILE, timeout=60,
+                on_text=lambda partial: progress.publish(execution_id, 'generating', partial=partial)
+            )
+            print_stream_metrics(metrics)
+            if stream_metrics is not None:
+                stream_metrics.update(stream_summary(metrics))
+            sp.set('ttft_ms', metrics['ttft_ms'])
+            record_tokens(sp, metrics.get('prompt_tokens'), metrics['tokens'])
+            return text, metrics.get('context')
+
+        response = http_client.post(url, json=payload, headers=headers, read_timeout=60)
+        response.raise_for_status()
+        res_json = response.json()
+        record_tokens(sp, res_json.get('prompt_eval_count'), res_json.get('eval_count'))
+        # /api/chat returns 'message': {'role': 'assistant', 'content': '...'}, /api/generate 'response'
+        text = (res_json.get('message') or {}).get('content') or res_json.get('response', '')
+        return text, res_json.get('context')
+
+def parse_context(context_str):
+    """CHAT_CONTEXT input -> dict, or None when the caller relies on an existing session."""
+    if not context_str or context_str.strip() in ('', '{}', 'null'):
+        return None
+    try:
+        return json.loads(context_str)
+    except ValueError:
+        return {"info": "Context parsing failed"}
+
+def handle_turn(message, match_id='', user='', session_id='', context=None, stream=False, execution_id=''):
+    """
+    One chat turn. context: the CHAT_CONTEXT string (or None) used to open / reopen the session.
+    execution_id: a streamed reply is published under this id as it arrives, then the whole reply.
+    Returns the reply.json dict: { session_id, reply, turn | session_expired, stream_metrics? }.
+    """
+    host = os.environ.get('OLLAMA_HOST')
+    model = os.environ.get('OLLAMA_MODEL')
+    api_key = os.environ.get('OLLAMA_API_KEY')
+    session_id = session_id or new_session_id()
+    result = {"session_id": session_id}
+
+    try:
+        conn = connect()
+        with tracing.span('session_load') as sp:
+            session = open_session(conn, session_id, match_id, user, parse_context(context))
+            turns = history(conn, session) if session else []
+            sp.set('found', bool(session)).set('turns', len(turns))
+
+        if not session:
+            # Unknown or expired session and no context to rebuild it: the caller resends with context
+            result.update(reply="Chat session expired, please resend.", session_expired=True)
+        else:
+            if ENDPOINT == 'generate':
+                payload = generate_payload(model, session, turns, message)
+            else:
+                payload = chat_payload(model, session, turns, message)
+            print(f"Sending to {host} (session {session_id}, {len(turns)} stored messages)...")
+            stream_metrics = {}
+            reply, ollama_context = send(host, api_key, payload, stream, execution_id, stream_metrics)
+            reply = reply or 'No response text.'
+            progress.publish(execution_id, 'done', text=reply)
+            if stream_metrics:
+                result['stream_metrics'] = stream_metrics
+
+            # An over-long context token list is dropped; the next turn rebuilds from the transcript window
+            reset_context = bool(ollama_context) and len(ollama_context) > MAX_CONTEXT_TOKENS
+            with tracing.span('session_save') as sp:
+                turn = save_turn(
+                    conn, session_id, message, reply,
+                    ollama_context=None if reset_context else ollama_context,
+                    reset_context=reset_context
+                )
+                sp.set('window_moved', slide_window(conn, session))
+                prune(conn)
+            result.update(reply=reply, turn=turn, request_bytes=len(json.dumps(payload)))
+        conn.close()
+
+    except Exception as e:
+        err = f"Chat Error: {str(e)}"
+        print(err)
+        result["reply"] = err
+        progress.publish(execution_id, 'failed', error=str(e))
+    return result
+
+def main():
+    result = handle_turn(
+        os.environ.get('CHAT_MESSAGE', ''),
+        match_id=os.environ.get('CHAT_MATCH_ID', ''),
+        user=os.environ.get('CHAT_USER', ''),
+        session_id=os.environ.get('CHAT_SESSION_ID', ''),
+        context=os.environ.get('CHAT_CONTEXT'),
+        stream=os.environ.get('CHAT_STREAM', '').lower() in ('1', 'true', 'yes'),
+        execution_id=os.environ.get('KESTRA_EXECUTION_ID', '')
+    )
+    task_outputs.write_reply(result)
+    http_client.print_metrics()
+    tracing.flush()
+
+if __name__ == "__main__":
+    main()
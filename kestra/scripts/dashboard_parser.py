@@ -1,8 +1,37 @@
-
 import json
 import sys
 import os
 
+import tracing
+
+try:
+    # Streaming projection for raw v3 match lists (falls back to json.load)
+    import match_stream
+except ImportError:
+    match_stream = None
+
+DASHBOARD_SIZE = 10
+
+# What a dashboard row reads from each v3 match; rounds, kills and economy are skipped
+V3_SUMMARY_SPEC = {
+    "metadata": {"matchid": True, "map": True},
+    "players": {
+        "all_players": {
+            "*": {
+                "name": True,
+                "tag": True,
+                "team": True,
+                "stats": {"kills": True, "deaths": True, "assists": True},
+                "assets": {"agent": {"small": True}}
+            }
+        }
+    },
+    "teams": {
+        "red": {"has_won": True, "rounds_won": True},
+        "blue": {"has_won": True, "rounds_won": True}
+    }
+}
+
 def load_json(filename):
     with open(filename, 'r') as f:
         data = json.load(f)
@@ -10,100 +39,135 @@ def load_json(filename):
         data = json.loads(data)
     return data
 
-# Check if files exist
-files = ['account.json', 'mmr.json', 'matches.json']
-for filename in files:
-    if not os.path.exists(filename):
-        print(f"CRITICAL ERROR: {filename} was not found!")
-        sys.exit(1)
-
-account_data = load_json('account.json')
-mmr_data = load_json('mmr.json')
-matches_data = load_json('matches.json')
-
-# Extract Account Info
-account = account_data.get('data', {})
-name = account.get('name', 'Unknown')
-tag = account.get('tag', 'Unknown')
-level = account.get('account_level', 0)
-
-# Extract Rank Info
-mmr = mmr_data.get('data', {})
-# v1 structure: data.currenttierpatched
-rank = mmr.get('currenttierpatched', 'Unrated')
-
-# Process Matches
-matches_list = matches_data.get('data', [])
-processed_matches = []
-
-if matches_list:
-    for match in matches_list[:10]:
-        meta = match.get('metadata', {})
-        match_id = meta.get('matchid')
-        map_name = meta.get('map')
-        
-        # Find player stats
-        result = "Unknown"
-        kda = "0/0/0"
-        agent_image = None
-        score = "0-0"
-        
-        players = match.get('players', {}).get('all_players', [])
-        for p in players:
-            if p.get('name').lower() == name.lower() and p.get('tag').lower() == tag.lower():
-                # Stats
-                stats = p.get('stats', {})
-                k = stats.get('kills', 0)
-                d = stats.get('deaths', 0)
-                a = stats.get('assists', 0)
-                kda = f"{k}/{d}/{a}"
-                
-                # Agent
-                assets = p.get('assets', {})
-                agent_image = assets.get('agent', {}).get('small')
-                
-                # Result
-                team = p.get('team', '').lower()
-                teams = match.get('teams', {})
-                team_data = teams.get(team, {})
-                has_won = team_data.get('has_won', None)
-                
-                # Score Calculation
-                red_rounds = teams.get('red', {}).get('rounds_won', 0)
-                blue_rounds = teams.get('blue', {}).get('rounds_won', 0)
-                
-                if team == 'red':
-                    score = f"{red_rounds} - {blue_rounds}"
-                elif team == 'blue':
-                    score = f"{blue_rounds} - {red_rounds}"
-                else:
-                    score = f"{red_rounds} - {blue_rounds}"
-                
-                if has_won is True:
-                    result = "Victory"
-                elif has_won is False:
-                    result = "Defeat"
-                else:
-                    result = "Draw"
+def load_match_list(filename, limit=DASHBOARD_SIZE):
+    """The first `limit` matches of a v3 list, projected to V3_SUMMARY_SPEC when streaming is available."""
+    if match_stream:
+        matches = []
+        for match in match_stream.iter_array(filename, ('data',), V3_SUMMARY_SPEC):
+            if len(matches) >= limit:
                 break
-        
-        match_details = {
-            "match_id": match_id,
-            "map": map_name,
-            "result": result,
-            "kda": kda,
-            "score": score,
-            "agent_image": agent_image
-        }
-        processed_matches.append(match_details)
-
-output = {
-    "name": name,
-    "tag": tag,
-    "level": level,
-    "rank": rank,
-    "matches": processed_matches
-}
+            matches.append(match)
+        return matches
+    return (load_json(filename).get('data') or [])[:limit]
+
+def player_key(name, tag):
+    return f"{name or ''}#{tag or ''}".lower()
+
+def find_player(match, name, tag):
+    """The all_players entry for name#tag (case-insensitive), or None."""
+    players = match.get('players', {}).get('all_players', [])
+    index = {player_key(p.get('name'), p.get('tag')): p for p in players}
+    return index.get(player_key(name, tag))
+
+def summarize_match(match, name, tag, player=None):
+    """Dashboard row for one v3 match document, from the point of view of name#tag."""
+    meta = match.get('metadata', {})
+    match_id = meta.get('matchid')
+    map_name = meta.get('map')
+
+    # Find player stats
+    result = "Unknown"
+    kda = "0/0/0"
+    agent_image = None
+    score = "0-0"
+
+    p = player or find_player(match, name, tag)
+    if p:
+        # Stats
+        stats = p.get('stats', {})
+        k = stats.get('kills', 0)
+        d = stats.get('deaths', 0)
+        a = stats.get('assists', 0)
+        kda = f"{k}/{d}/{a}"
+
+        # Agent
+        assets = p.get('assets', {})
+        agent_image = assets.get('agent', {}).get('small')
+
+        # Result
+        team = p.get('team', '').lower()
+        teams = match.get('teams', {})
+        team_data = teams.get(team, {})
+        has_won = team_data.get('has_won', None)
+
+        # Score Calculation
+        red_rounds = teams.get('red', {}).get('rounds_won', 0)
+        blue_rounds = teams.get('blue', {}).get('rounds_won', 0)
+
+        if team == 'red':
+            score = f"{red_rounds} - {blue_rounds}"
+        elif team == 'blue':
+            score = f"{blue_rounds} - {red_rounds}"
+        else:
+            score = f"{red_rounds} - {blue_rounds}"
+
+        if has_won is True:
+            result = "Victory"
+        elif has_won is False:
+            result = "Defeat"
+        else:
+            result = "Draw"
+
+    return {
+        "match_id": match_id,
+        "map": map_name,
+        "result": result,
+        "kda": kda,
+        "score": score,
+        "agent_image": agent_image
+    }
+
+def main():
+    # Match rows come from the synced history (history.json) or a raw v3 list (matches.json)
+    matches_file = 'history.json' if os.path.exists('history.json') else 'matches.json'
+
+    # Check if files exist
+    files = ['account.json', 'mmr.json', matches_file]
+    for filename in files:
+        if not os.path.exists(filename):
+            print(f"CRITICAL ERROR: {filename} was not found!")
+            sys.exit(1)
+
+    with tracing.span('parse', source=matches_file) as sp:
+        account_data = load_json('account.json')
+        mmr_data = load_json('mmr.json')
+        if matches_file == 'history.json':
+            matches_data = load_json(matches_file)
+        else:
+            matches_data = {"data": load_match_list(matches_file)}
+        sp.set('bytes', sum(os.path.getsize(f) for f in files))
+
+    # Extract Account Info
+    account = account_data.get('data', {})
+    name = account.get('name', 'Unknown')
+    tag = account.get('tag', 'Unknown')
+    level = account.get('account_level', 0)
+
+    # Extract Rank Info
+    mmr = mmr_data.get('data', {})
+    # v1 structure: data.currenttierpatched
+    rank = mmr.get('currenttierpatched', 'Unrated')
+
+    # Process Matches
+    with tracing.span('summarize'):
+        if matches_file == 'history.json':
+            # Already summarized by match_history.py, newest first
+            processed_matches = matches_data.get('matches', [])[:DASHBOARD_SIZE]
+        else:
+            processed_matches = [summarize_match(match, name, tag) for match in matches_data['data']]
+
+    output = {
+        "name": name,
+        "tag": tag,
+        "level": level,
+        "rank": rank,
+        "matches": processed_matches
+    }
+
+    with open('output.json', 'w') as f:
+        json.dump(output, f)
+
+    tracing.flush()
 
-with open('output.json', 'w') as f:
-    json.dump(output, f)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import sqlite3
+import hashlib
+import tempfile
+import urllib.parse
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.getcwd())
+import tracing
+
+# Shared client for the HenrikDev API, used by every task that calls it.
+# - Rate limiting: one token bucket per API key, kept in SQLite under
+#   HENRIK_STATE_DIR so all task processes on the worker draw from the same
+#   budget. x-ratelimit-limit / -remaining / -reset headers correct the bucket
+#   after every response, and a 429 blocks the key until its reset. The
+#   reset header only speeds up the refill of the current window (windows
+#   table); the bucket's base rate stays limit / HENRIK_RATE_WINDOW_SEC.
+# - Priorities: interactive requests (dashboard, single analysis) may use the
+#   whole bucket; background requests (batch, pre-warm) leave
+#   HENRIK_INTERACTIVE_RESERVE tokens untouched and wait while an interactive
+#   request is waiting.
+# - Coalescing: identical GETs in flight at the same time (two users opening
+#   the same profile) are sent once; the others wait on a per-URL file lock and
+#   reuse the response for HENRIK_COALESCE_TTL_SEC seconds. Bodies (and their
+#   lock files) past that window are swept on the next get().
+
+STATE_DIR = os.environ.get('HENRIK_STATE_DIR', '/app/data/henrik_client') or os.path.join(tempfile.gettempdir(), 'henrik_client')
+RATE_LIMIT = int(os.environ.get('HENRIK_RATE_LIMIT', '30'))
+RATE_WINDOW_SEC = float(os.environ.get('HENRIK_RATE_WINDOW_SEC', '60'))
+INTERACTIVE_RESERVE = float(os.environ.get('HENRIK_INTERACTIVE_RESERVE', '3'))
+COALESCE_TTL_SEC = float(os.environ.get('HENRIK_COALESCE_TTL_SEC', '5'))
+MAX_WAIT_SEC = float(os.environ.get('HENRIK_MAX_WAIT_SEC', '120'))
+MAX_RETRIES = int(os.environ.get('HENRIK_MAX_RETRIES', '3'))
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITIES = {'interactive': INTERACTIVE, 'background': BACKGROUND}
+DEFAULT_PRIORITY = PRIORITIES.get(os.environ.get('HENRIK_PRIORITY', 'interactive'), INTERACTIVE)
+
+# An interactive waiter older than this is assumed dead (killed task) and ignored
+WAITER_STALE_SEC = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    capacity REAL NOT NULL,
+    rate REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS windows (
+    key TEXT PRIMARY KEY,
+    rate REAL NOT NULL,
+    until REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS waiters (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    since REAL NOT NULL
+);
+"""
+
+class ApiError(Exception):
+    pass
+
+class ApiResponse:
+    __slots__ = ('status', 'body', 'headers', 'source')
+
+    def __init__(self, status, body, headers, source='API'):
+        self.status = status
+        self.body = body
+        self.headers = headers
+        self.source = source # 'API' | 'COALESCED'
+
+    def json(self):
+        data = json.loads(self.body)
+        # Some HenrikDev proxies double-encode the body
+        return json.loads(data) if isinstance(data, str) else data
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise ApiError(f"HTTP Error {self.status}")
+        return self
+
+def key_id(api_key):
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+
+def connect(state_dir=STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(state_dir, 'buckets.sqlite'), timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _bucket(conn, key, now):
+    """(capacity, refill rate in effect now, tokens now, blocked_until) of the key's bucket."""
+    row = conn.execute("SELECT capacity, rate, tokens, updated, blocked_until FROM buckets WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        row = (float(RATE_LIMIT), RATE_LIMIT / RATE_WINDOW_SEC, float(RATE_LIMIT), now, 0.0)
+        conn.execute("INSERT INTO buckets VALUES (?, ?, ?, ?, ?, ?)", (key,) + row)
+    capacity, rate, tokens, updated, blocked_until = row
+    window = conn.execute("SELECT rate, until FROM windows WHERE key = ?", (key,)).fetchone()
+    if window and updated < window[1]:
+        if now >= window[1]:
+            # The server has refilled the whole window by its reset
+            return capacity, rate, capacity, blocked_until
+        rate = max(rate, window[0])
+    return capacity, rate, min(capacity, tokens + max(0.0, now - updated) * rate), blocked_until
+
+def try_acquire(conn, key, priority, now=None):
+    """Takes one token if the priority allows it. Returns 0 on success, else the seconds to wait."""
+    now = time.time() if now is None else now
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        capacity, rate, tokens, blocked_until = _bucket(conn, key, now)
+        if now < blocked_until:
+            wait = blocked_until - now
+        else:
+            floor = 0.0
+            if priority != INTERACTIVE:
+                floor = min(INTERACTIVE_RESERVE, capacity - 1)
+                waiting = conn.execute(
+                    "SELECT COUNT(*) FROM waiters WHERE key = ? AND since > ?", (key, now - WAITER_STALE_SEC)
+                ).fetchone()[0]
+                if waiting:
+                    floor = capacity
+            if tokens - 1 >= floor:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = max(0.05, (floor + 1 - tokens) / rate)
+        conn.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE key = ?", (tokens, now, key))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return wait
+
+def acquire(key, priority=INTERACTIVE, max_wait=MAX_WAIT_SEC):
+    """Blocks until the key's bucket grants a token. Returns the seconds waited."""
+    conn = connect()
+    waiter = f"{os.getpid()}-{os.urandom(6).hex()}"
+    start = time.time()
+    try:
+        while True:
+            now = time.time()
+            wait = try_acquire(conn, key, priority, now)
+            if not wait:
+                return now - start
+            if now - start + wait > max_wait:
+                raise ApiError(f"Rate limit wait would exceed {max_wait:.0f}s")
+            if priority == INTERACTIVE:
+                # (Re)announce ourselves so background requests hold off
+                conn.execute("INSERT OR REPLACE INTO waiters VALUES (?, ?, ?)", (waiter, key, now))
+            # Short sleeps: headers from other processes' responses can change the budget
+            time.sleep(min(wait, 1.0))
+    finally:
+        conn.execute("DELETE FROM waiters WHERE id = ?", (waiter,))
+        conn.close()
+
+def _header(headers, name):
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def observe(key, status, headers, now=None):
+    """Corrects the key's bucket from the rate-limit headers / a 429."""
+    now = time.time() if now is None else now
+    limit = _header(headers, 'x-ratelimit-limit')
+    remaining = _header(headers, 'x-ratelimit-remaining')
+    reset = _header(headers, 'x-ratelimit-reset')
+    retry_after = _header(headers, 'retry-after')
+    if status != 429 and limit is None and remaining is None:
+        return
+
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        capacity, rate, tokens, blocked_until = _bucket(conn, key, now)
+        base_rate = None
+        if limit:
+            capacity = limit
+            base_rate = rate = limit / RATE_WINDOW_SEC
+        if remaining is not None:
+            tokens = min(tokens, remaining)
+            if reset:
+                # The server refills everything by `reset`; don't refill slower than that in this window
+                conn.execute("INSERT OR REPLACE INTO windows VALUES (?, ?, ?)",
+                             (key, (capacity - tokens) / reset, now + reset))
+                if remaining <= 0:
+                    blocked_until = max(blocked_until, now + reset)
+        if status == 429:
+            tokens = 0.0
+            blocked_until = max(blocked_until, now + (retry_after or reset or 1.0 / rate))
+        conn.execute(
+            "UPDATE buckets SET capacity = ?, rate = COALESCE(?, rate), tokens = ?, updated = ?, blocked_until = ? WHERE key = ?",
+            (capacity, base_rate, tokens, now, blocked_until, key)
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def _send(url, api_key, timeout):
+    req = urllib.request.Request(url)
+    if api_key:
+        req.add_header('Authorization', api_key)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            return ApiResponse(res.status, res.read(), {k.lower(): v for k, v in res.headers.items()})
+    except urllib.error.HTTPError as e:
+        return ApiResponse(e.code, e.read(), {k.lower(): v for k, v in e.headers.items()})
+
+def request(url, api_key='', priority=None, timeout=30):
+    """Rate-limited GET with 429 retries (each retry waits for the bucket again)."""
+    priority = DEFAULT_PRIORITY if priority is None else priority
+    key = key_id(api_key)
+    attempt = 0
+    while True:
+        with tracing.span('api_wait', priority=priority) as sp:
+            sp.set('wait_ms', int(acquire(key, priority) * 1000))
+        response = _send(url, api_key, timeout)
+        observe(key, response.status, response.headers)
+        tracing.counter('api_requests', 1)
+        if response.status != 429 or attempt >= MAX_RETRIES:
+            return response
+        tracing.counter('api_429', 1)
+        attempt += 1
+
+@contextmanager
+def lock_file(path):
+    """Exclusive flock on path. Yields True if the lock had to be waited for."""
+    waited = False
+    while True:
+        with open(path, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waited = True
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # sweep_inflight may have deleted the file while we waited: lock the new one instead
+                if os.path.exists(path) and os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                    yield waited
+                    return
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def sweep_inflight(base, now=None):
+    """
+    Deletes coalescing files older than COALESCE_TTL_SEC (body, lock and any
+    leftover tmp file of a URL), each URL under its own lock; URLs whose lock
+    is held by a request in progress are skipped.
+    """
+    now = time.time() if now is None else now
+    files, newest = {}, {}
+    for name in os.listdir(base):
+        try:
+            mtime = os.path.getmtime(os.path.join(base, name))
+        except OSError:
+            continue
+        digest = name.split('.')[0]
+        files.setdefault(digest, []).append(name)
+        newest[digest] = max(newest.get(digest, 0.0), mtime)
+    for digest, names in files.items():
+        if now - newest[digest] <= COALESCE_TTL_SEC:
+            continue
+        lock_path = os.path.join(base, digest + '.lock')
+        with open(lock_path, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            try:
+                # Lock file last: anyone blocked on it retries on a new file once the body is gone
+                for name in sorted(set(names) | {digest + '.lock'}, key=lambda n: n.endswith('.lock')):
+                    try:
+                        os.remove(os.path.join(base, name))
+                    except OSError:
+                        pass
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def get(url, api_key='', priority=None, timeout=30, coalesce=True):
+    """
+    GET through the shared scheduler. Returns an ApiResponse (errors are not raised;
+    call raise_for_status). Identical concurrent GETs share one upstream request.
+    """
+    if not coalesce or COALESCE_TTL_SEC <= 0:
+        return request(url, api_key, priority, timeout)
+
+    digest = hashlib.sha256(f"{key_id(api_key)} {url}".encode('utf-8')).hexdigest()[:24]
+    base = os.path.join(STATE_DIR, 'inflight')
+    os.makedirs(base, exist_ok=True)
+    body_path = os.path.join(base, digest + '.json')
+    sweep_inflight(base)
+
+    with lock_file(os.path.join(base, digest + '.lock')) as waited:
+        if waited:
+            # Someone fetched this URL while we waited on the lock
+            try:
+                if time.time() - os.path.getmtime(body_path) <= COALESCE_TTL_SEC:
+                    with open(body_path, 'rb') as f:
+                        cached = json.loads(f.read())
+                    tracing.counter('api_coalesced', 1)
+                    return ApiResponse(cached['status'], cached['body'].encode('utf-8'), cached['headers'], 'COALESCED')
+            except (OSError, ValueError, KeyError):
+                pass
+
+        response = request(url, api_key, priority, timeout)
+        if response.status == 200:
+            tmp = f"{body_path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump({"status": response.status, "body": response.body.decode('utf-8', 'replace'), "headers": response.headers}, f)
+            os.replace(tmp, body_path)
+        return response
+
+def main():
+    """
+    Fetches several API paths concurrently into files.
+    HENRIK_FETCH: JSON {"account.json": "/valorant/v1/account/name/tag", ...}
+    Every body is written as returned (error bodies included), like an HTTP request task.
+    """
+    api_url = os.environ.get('VALO_API_URL', '')
+    api_key = os.environ.get('VALO_API_KEY', '')
+    targets = json.loads(os.environ.get('HENRIK_FETCH', '{}'))
+    if not targets:
+        print("CRITICAL ERROR: HENRIK_FETCH is required")
+        sys.exit(1)
+
+    def fetch(item):
+        out_file, path = item
+        start = time.time()
+        with tracing.span('api_fetch', file=out_file) as sp:
+            try:
+                response = get(api_url + urllib.parse.quote(path, safe='/?=&'), api_key)
+            except (ApiError, OSError) as e:
+                # Rate-limit waits read as a 429, network failures (URLError, timeouts) as a 502
+                status = 429 if isinstance(e, ApiError) else 502
+                response = ApiResponse(status, json.dumps({"status": status, "errors": [{"message": str(e)}]}).encode('utf-8'), {})
+            sp.set('status', response.status).set('bytes', len(response.body)).set('source', response.source)
+        tracing.counter('payload_bytes', len(response.body), source=out_file)
+        with open(out_file, 'wb') as f:
+            f.write(response.body)
+        return out_file, response, int((time.time() - start) * 1000)
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        for out_file, response, ms in pool.map(fetch, targets.items()):
+            print(f"{out_file}: HTTP {response.status} ({response.source}) in {ms} ms")
+            print(f"::set-output name={out_file.split('.')[0]}_status::{response.status}", flush=True)
+    tracing.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import time
+import random
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared HTTP client for the LLM call sites.
+# One pooled keep-alive session per process, bounded retries with jittered
+# exponential backoff on 429/5xx and connection errors, separate connect/read
+# timeouts, and per-request latency records (the most recent
+# HTTP_METRICS_WINDOW, so a resident process does not grow them forever).
+
+CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '120'))
+MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', '3'))
+BACKOFF_BASE_SEC = float(os.environ.get('HTTP_BACKOFF_BASE_SEC', '0.5'))
+BACKOFF_MAX_SEC = float(os.environ.get('HTTP_BACKOFF_MAX_SEC', '8'))
+POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '16'))
+METRICS_WINDOW = int(os.environ.get('HTTP_METRICS_WINDOW', '500'))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+_session = None
+METRICS = deque(maxlen=METRICS_WINDOW)
+
+def get_session():
+    """Lazily builds the process-wide pooled session."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff; a numeric Retry-After header wins if present."""
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_SEC)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * (2 ** attempt)))
+
+def request(method, url, json=None, headers=None, read_timeout=None, stream=False, retries=None):
+    """
+    Sends a request through the pooled session.
+    Retries connection errors, timeouts and RETRY_STATUSES up to `retries` times.
+    A read timeout is only retried for idempotent methods: a POST that timed out
+    may still be running upstream (a generation), and resending it would run it again.
+    Returns the last response (callers still call raise_for_status).
+    """
+    retries = MAX_RETRIES if retries is None else retries
+    timeout = (CONNECT_TIMEOUT, read_timeout or READ_TIMEOUT)
+    session = get_session()
+
+    start = time.time()
+    attempt = 0
+    while True:
+        try:
+            response = session.request(method, url, json=json, headers=headers, timeout=timeout, stream=stream)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            resend_safe = method.upper() in IDEMPOTENT_METHODS or not isinstance(e, requests.ReadTimeout)
+            if attempt >= retries or not resend_safe:
+                record(method, url, None, attempt + 1, start, error=type(e).__name__)
+                raise
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            delay = backoff_delay(attempt, response.headers.get('Retry-After'))
+            print(f"HTTP {response.status_code} from {url}, retry {attempt + 1}/{retries} in {delay:.2f}s")
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        record(method, url, response.status_code, attempt + 1, start)
+        return response
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def record(method, url, status, attempts, start, error=None):
+    # Latency until headers arrive; streamed bodies are timed by the caller
+    METRICS.append({
+        "method": method,
+        "url": url.split('?')[0],
+        "status": status,
+        "attempts": attempts,
+        "latency_ms": int((time.time() - start) * 1000),
+        "error": error
+    })
+
+def metrics_summary():
+    if not METRICS:
+        return {"requests": 0}
+    latencies = sorted(m['latency_ms'] for m in METRICS)
+    return {
+        "requests": len(METRICS),
+        "retries": sum(m['attempts'] - 1 for m in METRICS),
+        "errors": sum(1 for m in METRICS if m['error'] or (m['status'] or 0) >= 400),
+        "p50_ms": latencies[len(latencies) // 2],
+        "max_ms": latencies[-1]
+    }
+
+def print_metrics():
+    s = metrics_summary()
+    if s['requests']:
+        print(f"HTTP: {s['requests']} request(s), {s['retries']} retries, {s['errors']} error(s), "
+              f"p50 {s['p50_ms']} ms, max {s['max_ms']} ms")
@@ -1,10 +1,22 @@
 import json
 import sys
 
+import tracing
+
+try:
+    # Streaming projection parser, when shipped alongside
+    import match_stream
+except ImportError:
+    match_stream = None
+
 def main():
     try:
-        with open('match_detail.json', 'r') as f:
-            match_data = json.load(f)
+        with tracing.span('parse', parser='stream' if match_stream else 'json'):
+            if match_stream:
+                match_data = match_stream.load_projected('match_detail.json')
+            else:
+                with open('match_detail.json', 'r') as f:
+                    match_data = json.load(f)
 
 
         import os
@@ -98,6 +110,8 @@ def main():
     except Exception as e:
         print(json.dumps({"error": str(e)}))
         sys.exit(1)
+    finally:
+        tracing.flush()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import urllib.parse
+
+sys.path.insert(0, os.getcwd())
+from dashboard_parser import find_player, summarize_match
+import henrik_client
+import tracing
+
+try:
+    # v3 lists are projected while they are parsed (falls back to json)
+    import match_stream
+except ImportError:
+    match_stream = None
+
+try:
+    # Newly stored matches also feed the rank/agent/map percentile sketches
+    import percentiles
+except ImportError:
+    percentiles = None
+
+# Per-player match history in SQLite.
+# Each dashboard run syncs only the matches the store has not seen yet; older
+# matches stay queryable ("last 100 on Jett") from indexed tables without any
+# API call. When a player already has history, a size=1 probe decides whether
+# the full size=N match list needs to be fetched at all.
+
+DB_PATH = os.environ.get('MATCH_HISTORY_DB', '/app/data/match_history.sqlite')
+FETCH_SIZE = int(os.environ.get('HISTORY_FETCH_SIZE', '10'))
+DASHBOARD_SIZE = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY,
+    region TEXT NOT NULL,
+    name_lc TEXT NOT NULL,
+    tag_lc TEXT NOT NULL,
+    name TEXT,
+    tag TEXT,
+    last_sync REAL,
+    UNIQUE (region, name_lc, tag_lc)
+);
+CREATE TABLE IF NOT EXISTS matches (
+    match_id TEXT PRIMARY KEY,
+    map TEXT,
+    mode TEXT,
+    started_at INTEGER,
+    rounds_played INTEGER,
+    red_rounds INTEGER,
+    blue_rounds INTEGER
+);
+CREATE TABLE IF NOT EXISTS player_matches (
+    player_id INTEGER NOT NULL REFERENCES players(id),
+    match_id TEXT NOT NULL REFERENCES matches(match_id),
+    started_at INTEGER,
+    map TEXT,
+    mode TEXT,
+    agent TEXT,
+    team TEXT,
+    result TEXT,
+    kills INTEGER,
+    deaths INTEGER,
+    assists INTEGER,
+    score INTEGER,
+    headshots INTEGER,
+    bodyshots INTEGER,
+    legshots INTEGER,
+    damage_made INTEGER,
+    rounds_played INTEGER,
+    summary TEXT,
+    PRIMARY KEY (player_id, match_id)
+);
+CREATE INDEX IF NOT EXISTS idx_pm_recent ON player_matches (player_id, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_pm_agent ON player_matches (player_id, agent, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_pm_map ON player_matches (player_id, map, started_at DESC);
+"""
+
+def connect(path=DB_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def player_id(conn, region, name, tag):
+    key = (region.lower(), name.lower(), tag.lower())
+    row = conn.execute(
+        "SELECT id FROM players WHERE region = ? AND name_lc = ? AND tag_lc = ?", key
+    ).fetchone()
+    if row:
+        return row['id']
+    cur = conn.execute(
+        "INSERT INTO players (region, name_lc, tag_lc, name, tag) VALUES (?, ?, ?, ?, ?)",
+        key + (name, tag)
+    )
+    return cur.lastrowid
+
+def known_match_ids(conn, pid, match_ids):
+    if not match_ids:
+        return set()
+    marks = ','.join('?' * len(match_ids))
+    rows = conn.execute(
+        f"SELECT match_id FROM player_matches WHERE player_id = ? AND match_id IN ({marks})",
+        [pid] + list(match_ids)
+    ).fetchall()
+    return {r['match_id'] for r in rows}
+
+def insert_match(conn, pid, match, name, tag, player=None):
+    """Stores one v3 match document for the player. Returns False if the player is not in it."""
+    meta = match.get('metadata', {})
+    match_id = meta.get('matchid')
+    teams = match.get('teams', {})
+    player = player or find_player(match, name, tag)
+    if not match_id or not player:
+        return False
+
+    summary = summarize_match(match, name, tag, player)
+    stats = player.get('stats', {})
+    started_at = meta.get('game_start') or 0
+
+    conn.execute(
+        "INSERT OR IGNORE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (match_id, meta.get('map'), meta.get('mode'), started_at, meta.get('rounds_played', 0),
+         teams.get('red', {}).get('rounds_won', 0), teams.get('blue', {}).get('rounds_won', 0))
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO player_matches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (pid, match_id, started_at, meta.get('map'), meta.get('mode'), player.get('character'),
+         player.get('team'), summary['result'],
+         stats.get('kills', 0), stats.get('deaths', 0), stats.get('assists', 0), stats.get('score', 0),
+         stats.get('headshots', 0), stats.get('bodyshots', 0), stats.get('legshots', 0),
+         player.get('damage_made') or stats.get('damage_made') or 0, meta.get('rounds_played', 0),
+         json.dumps(summary))
+    )
+    return True
+
+def store_matches(conn, pid, matches, name, tag):
+    """Inserts the matches the store has not seen yet. Returns the number inserted."""
+    ids = [m.get('metadata', {}).get('matchid') for m in matches]
+    known = known_match_ids(conn, pid, [i for i in ids if i])
+    inserted = 0
+    for match, match_id in zip(matches, ids):
+        if match_id and match_id not in known and insert_match(conn, pid, match, name, tag):
+            inserted += 1
+            if percentiles:
+                percentiles.ingest_payload({"data": match})
+    return inserted
+
+def has_history(conn, pid):
+    return conn.execute("SELECT 1 FROM player_matches WHERE player_id = ? LIMIT 1", (pid,)).fetchone() is not None
+
+def sync_player(conn, region, name, tag, fetch_matches):
+    """
+    Delta sync for one player. fetch_matches(size) returns a list of v3 match documents.
+    Returns { new_matches, probed, fetched }.
+    """
+    pid = player_id(conn, region, name, tag)
+    result = {"new_matches": 0, "probed": False, "fetched": False}
+
+    # Newest match already stored -> nothing new since the last sync
+    if has_history(conn, pid):
+        result['probed'] = True
+        newest = fetch_matches(1)
+        newest_ids = [m.get('metadata', {}).get('matchid') for m in newest]
+        if newest_ids and known_match_ids(conn, pid, newest_ids) == set(newest_ids):
+            conn.execute("UPDATE players SET last_sync = ? WHERE id = ?", (time.time(), pid))
+            conn.commit()
+            return result
+
+    result['fetched'] = True
+    result['new_matches'] = store_matches(conn, pid, fetch_matches(FETCH_SIZE), name, tag)
+    conn.execute("UPDATE players SET last_sync = ? WHERE id = ?", (time.time(), pid))
+    conn.commit()
+    return result
+
+def recent_matches(conn, region, name, tag, limit=DASHBOARD_SIZE, agent=None, map_name=None):
+    """Newest-first player_matches rows, optionally filtered by agent and/or map."""
+    pid = player_id(conn, region, name, tag)
+    sql = "SELECT * FROM player_matches WHERE player_id = ?"
+    args = [pid]
+    if agent:
+        sql += " AND agent = ?"
+        args.append(agent)
+    if map_name:
+        sql += " AND map = ?"
+        args.append(map_name)
+    sql += " ORDER BY started_at DESC LIMIT ?"
+    args.append(limit)
+    return [dict(r) for r in conn.execute(sql, args).fetchall()]
+
+def summarize_rows(rows):
+    """Aggregates player_matches rows: games, win rate, K/D, ACS, HS%."""
+    if not rows:
+        return {"games": 0}
+    kills = sum(r['kills'] for r in rows)
+    deaths = sum(r['deaths'] for r in rows)
+    score = sum(r['score'] for r in rows)
+    rounds = sum(r['rounds_played'] for r in rows)
+    head = sum(r['headshots'] for r in rows)
+    hits = head + sum(r['bodyshots'] + r['legshots'] for r in rows)
+    wins = sum(1 for r in rows if r['result'] == 'Victory')
+    return {
+        "games": len(rows),
+        "win_rate": round(wins / len(rows) * 100, 1),
+        "kd": round(kills / deaths, 2) if deaths > 0 else kills,
+        "acs": round(score / rounds, 0) if rounds > 0 else 0,
+        "hs_percent": round(head / hits * 100, 1) if hits > 0 else 0
+    }
+
+def api_fetcher(api_url, api_key, region, name, tag):
+    """fetch_matches(size) against /valorant/v3/matches."""
+    def fetch(size):
+        path = "/".join(urllib.parse.quote(p) for p in (region, name, tag))
+        with tracing.span('api_fetch', size=size) as sp:
+            response = henrik_client.get(f"{api_url}/valorant/v3/matches/{path}?size={size}", api_key)
+            body = response.raise_for_status().body
+            sp.set('bytes', len(body)).set('source', response.source)
+        tracing.counter('payload_bytes', len(body), source='matches')
+        return parse_match_list(body)
+    return fetch
+
+def parse_match_list(body):
+    """v3 list body -> match documents, trimmed to what the history and percentiles read."""
+    with tracing.span('parse', parser='stream' if match_stream else 'json'):
+        if match_stream:
+            return list(match_stream.iter_array(body, ('data',), match_stream.V3_HISTORY_SPEC))
+        data = json.loads(body)
+        # Some HenrikDev proxies double-encode the body
+        data = json.loads(data) if isinstance(data, str) else data
+        return data.get('data') or []
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', nargs='?', default='sync', choices=['sync', 'query'])
+    parser.add_argument('--agent')
+    parser.add_argument('--map')
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    region = os.environ.get('REGION', 'ap')
+    name = os.environ.get('PLAYER_NAME', '')
+    tag = os.environ.get('PLAYER_TAG', '')
+    conn = connect()
+
+    if args.command == 'query':
+        rows = recent_matches(conn, region, name, tag, args.limit, args.agent, args.map)
+        print(json.dumps({"summary": summarize_rows(rows), "matches": [json.loads(r['summary']) for r in rows]}))
+        return
+
+    fetch = api_fetcher(os.environ.get('VALO_API_URL', ''), os.environ.get('VALO_API_KEY', ''), region, name, tag)
+    start = time.time()
+    with tracing.span('history_sync') as sp:
+        result = sync_player(conn, region, name, tag, fetch)
+        sp.set('new_matches', result['new_matches']).set('fetched', result['fetched'])
+    with tracing.span('history_query'):
+        rows = recent_matches(conn, region, name, tag, DASHBOARD_SIZE)
+
+    with open('history.json', 'w') as f:
+        json.dump(dict(result, matches=[json.loads(r['summary']) for r in rows]), f)
+
+    print(f"History sync {name}#{tag} ({region}): {result['new_matches']} new, "
+          f"probed={result['probed']}, fetched={result['fetched']} in {int((time.time() - start) * 1000)} ms")
+    print(f"::set-output name=new_matches::{result['new_matches']}", flush=True)
+    tracing.flush()
+
+if __name__ == "__main__":
+    main()
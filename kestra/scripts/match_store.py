@@ -0,0 +1,168 @@
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+
+import henrik_client
+import tracing
+
+# Local store for HenrikDev v2 match payloads.
+# A finished match never changes, so once fetched it is kept on disk (gzip)
+# under a hash of its match_id. The store is capped in size and evicts the
+# least recently used payloads first. Hit/miss counters live in stats.json,
+# updated under an flock on stats.lock so concurrent tasks don't lose counts.
+
+STORE_DIR = os.environ.get('MATCH_STORE_DIR', '/app/data/match_store')
+MAX_BYTES = int(float(os.environ.get('MATCH_STORE_MAX_MB', '512')) * 1024 * 1024)
+STATS_FILE = 'stats.json'
+STATS_LOCK = 'stats.lock'
+
+def store_path(match_id, store_dir=STORE_DIR):
+    """Content-addressed path: <dir>/<h[:2]>/<h>.json.gz with h = sha256(match_id)."""
+    h = hashlib.sha256(match_id.strip().lower().encode('utf-8')).hexdigest()
+    return os.path.join(store_dir, h[:2], f"{h}.json.gz")
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def read_stats(store_dir=STORE_DIR):
+    try:
+        with open(os.path.join(store_dir, STATS_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"hits": 0, "misses": 0, "evictions": 0}
+
+def record_stat(store_dir, key, n=1):
+    """Bumps one counter and returns all counters."""
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, STATS_LOCK), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            stats = read_stats(store_dir)
+            stats[key] = stats.get(key, 0) + n
+            write_atomic(os.path.join(store_dir, STATS_FILE), json.dumps(stats).encode('utf-8'))
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return stats
+
+def load_match(match_id, store_dir=STORE_DIR):
+    """Returns the raw JSON bytes of a stored match, or None. Counts a hit or a miss."""
+    path = store_path(match_id, store_dir)
+    try:
+        with gzip.open(path, 'rb') as f:
+            raw = f.read()
+    except (OSError, EOFError):
+        record_stat(store_dir, 'misses')
+        return None
+
+    # Touch on read so eviction order is least-recently-used
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    record_stat(store_dir, 'hits')
+    return raw
+
+def save_match(match_id, raw, store_dir=STORE_DIR, max_bytes=MAX_BYTES):
+    path = store_path(match_id, store_dir)
+    write_atomic(path, gzip.compress(raw, compresslevel=6))
+    evict(store_dir, max_bytes)
+    return path
+
+def evict(store_dir=STORE_DIR, max_bytes=MAX_BYTES):
+    """Deletes least recently used payloads until the store fits in max_bytes."""
+    entries = []
+    total = 0
+    for root, _, files in os.walk(store_dir):
+        for name in files:
+            if not name.endswith('.json.gz'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    if total <= max_bytes:
+        return 0
+
+    evicted = 0
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        evicted += 1
+
+    if evicted:
+        record_stat(store_dir, 'evictions', evicted)
+    return evicted
+
+def fetch_match(match_id, api_url, api_key, timeout=30, priority=None):
+    """Fetches /valorant/v2/match/{match_id} through the shared rate-limited client and returns the raw body bytes."""
+    response = henrik_client.get(f"{api_url}/valorant/v2/match/{match_id}", api_key, priority=priority, timeout=timeout)
+    return response.raise_for_status().body
+
+def is_complete_match(raw):
+    """Only successful payloads are worth keeping; errors and rate-limit bodies are not."""
+    try:
+        doc = json.loads(raw)
+    except ValueError:
+        return False
+    return isinstance(doc, dict) and bool(doc.get('data')) and doc.get('status', 200) == 200
+
+def get_match(match_id, api_url, api_key, store_dir=STORE_DIR, max_bytes=MAX_BYTES, priority=None):
+    """Store first, API on a miss. Returns (raw bytes, 'HIT' | 'MISS')."""
+    with tracing.span('store_read'):
+        raw = load_match(match_id, store_dir)
+    if raw is not None:
+        return raw, 'HIT'
+
+    with tracing.span('api_fetch'):
+        raw = fetch_match(match_id, api_url, api_key, priority=priority)
+    with tracing.span('store_save'):
+        if is_complete_match(raw):
+            save_match(match_id, raw, store_dir, max_bytes)
+    return raw, 'MISS'
+
+def main():
+    match_id = os.environ.get('MATCH_ID', '').strip()
+    out_file = os.environ.get('MATCH_OUTPUT_FILE', 'match_data.json')
+    api_url = os.environ.get('VALO_API_URL', '')
+    api_key = os.environ.get('VALO_API_KEY', '')
+
+    if not match_id:
+        print("CRITICAL ERROR: MATCH_ID is required")
+        sys.exit(1)
+
+    start = time.time()
+    with tracing.span('fetch_match') as sp:
+        raw, status = get_match(match_id, api_url, api_key)
+        sp.set('cache', status).set('bytes', len(raw))
+    elapsed_ms = int((time.time() - start) * 1000)
+    tracing.counter('payload_bytes', len(raw), source='match')
+
+    with open(out_file, 'wb') as f:
+        f.write(raw)
+
+    stats = read_stats()
+    print(f"Match {match_id}: {status} in {elapsed_ms} ms "
+          f"(store hits={stats.get('hits', 0)}, misses={stats.get('misses', 0)}, evictions={stats.get('evictions', 0)})")
+    print(f"::set-output name=cache::{status}", flush=True)
+    tracing.flush()
+
+if __name__ == "__main__":
+    main()
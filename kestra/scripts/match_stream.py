@@ -0,0 +1,356 @@
+import io
+import re
+import json
+
+# Streaming, projection-only parser for HenrikDev v2 match payloads and v3
+# match lists.
+# The payload is read in chunks and tokenized incrementally; only the fields
+# named in a projection spec are materialized. Everything else (damage events,
+# player locations, the top-level `kills` duplicate, asset URLs...) is scanned
+# past without ever being built, so peak memory is the kept data plus one read
+# buffer rather than the whole document tree. iter_array() hands out the
+# elements of a list one at a time, so a reader that needs only the first few
+# matches stops there.
+
+CHUNK_SIZE = 64 * 1024
+
+# Projection spec: True keeps a whole subtree, a dict keeps only its keys,
+# and "*" applies a spec to every element of an array.
+
+class Decoded:
+    """
+    Spec wrapper: the value is decoded whole by the C json parser, then
+    projected. Faster than tokenizing for small, dense subtrees (one round),
+    at the cost of holding that one subtree in memory.
+    """
+    __slots__ = ('spec',)
+
+    def __init__(self, spec):
+        self.spec = spec
+
+KILL_FIELDS = {
+    "kill_time_in_round": True,
+    "killer_puuid": True,
+    "killer_team": True,
+    "victim_puuid": True,
+    "victim_team": True
+}
+
+ROUND_FIELDS = {
+    "*": {
+        "winning_team": True,
+        "end_type": True,
+        "bomb_planted": True,
+        "bomb_defused": True,
+        "plant_events": {"plant_time_in_round": True, "planted_by": True, "plant_site": True},
+        "defuse_events": {"defuse_time_in_round": True, "defused_by": True},
+        "player_stats": {
+            "*": {
+                "player_puuid": True,
+                "player_team": True,
+                "damage": True,
+                "ability_casts": True,
+                "economy": True,
+                "kill_events": {"*": KILL_FIELDS}
+            }
+        }
+    }
+}
+
+V2_METRICS_SPEC = {
+    "status": True,
+    "data": {
+        "metadata": True,
+        "players": {
+            "all_players": {
+                "*": {
+                    "puuid": True,
+                    "name": True,
+                    "tag": True,
+                    "team": True,
+                    "character": True,
+                    "currenttier_patched": True,
+                    "stats": True,
+                    "ability_casts": True,
+                    "economy": True,
+                    "damage_made": True
+                }
+            }
+        },
+        "teams": True,
+        "rounds": ROUND_FIELDS
+    },
+    # Older payloads carry rounds at the top level
+    "rounds": ROUND_FIELDS
+}
+
+# What the match history (match_history.insert_match) and the percentile
+# sketches (percentiles.match_samples) read from each v3 list item
+V3_HISTORY_SPEC = {
+    "metadata": True,
+    "players": {
+        "all_players": {
+            "*": {
+                "puuid": True,
+                "name": True,
+                "tag": True,
+                "team": True,
+                "character": True,
+                "currenttier_patched": True,
+                "stats": True,
+                "damage_made": True,
+                "assets": {"agent": {"small": True}}
+            }
+        }
+    },
+    "teams": True,
+    "rounds": {
+        "*": Decoded({
+            "player_stats": {
+                "*": {
+                    "player_puuid": True,
+                    "damage": True,
+                    "kill_events": {"*": {"kill_time_in_round": True, "killer_puuid": True, "victim_puuid": True}}
+                }
+            }
+        })
+    }
+}
+
+_TOKEN_RE = re.compile(r'\s*(?:([{}\[\]:,])|(")|([^\s{}\[\]:,"]+))')
+# Runs of anything but brackets, with complete strings swallowed whole
+_SCAN_RE = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+_LITERALS = {"true": True, "false": False, "null": None}
+
+class TokenReader:
+    """
+    Incremental tokenizer over a text file object, chunk_size characters at a time.
+    Tokens are (kind, raw): kind is one of '{', '}', '[', ']', ':', ',' (raw None),
+    's' (raw string body, escapes untouched) or 'v' (number / literal text).
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = f.read(chunk_size)
+        self.pos = 0
+        self.eof = not self.buf
+        self.mark = None # buffer offset that must survive refills
+
+    def fill(self):
+        """Reads one more chunk, dropping consumed text before pos (or mark). False at EOF."""
+        if self.eof:
+            return False
+        more = self.f.read(self.chunk_size)
+        self.eof = not more
+        keep = self.pos if self.mark is None else self.mark
+        self.buf = self.buf[keep:] + more
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark = 0
+        return bool(more)
+
+    def next(self):
+        while True:
+            m = _TOKEN_RE.match(self.buf, self.pos)
+            # A token touching the end of the buffer may be cut in half: refill first
+            if (m is None or m.end() >= len(self.buf)) and not self.eof:
+                self.fill()
+                continue
+            if m is None:
+                raise ValueError(f"Unexpected JSON near: {self.buf[self.pos:self.pos + 40]!r}")
+
+            punct, quote, scalar = m.groups()
+            self.pos = m.end()
+            if punct:
+                return punct, None
+            if scalar:
+                return 'v', scalar
+            # Pin the string start in case skip_string has to refill
+            self.mark = self.pos
+            try:
+                self.skip_string()
+                return 's', self.buf[self.mark:self.pos - 1]
+            finally:
+                self.mark = None
+
+    def skip_string(self):
+        """pos is just after an opening quote; moves it just past the closing quote."""
+        end = self.pos
+        while True:
+            end = self.buf.find('"', end)
+            if end < 0:
+                offset = len(self.buf) - self.pos
+                if not self.fill():
+                    raise ValueError("Unterminated JSON string")
+                end = self.pos + offset
+                continue
+            backslashes = 0
+            i = end - 1
+            while i >= self.pos and self.buf[i] == '\\':
+                backslashes += 1
+                i -= 1
+            if backslashes % 2 == 0:
+                self.pos = end + 1
+                return
+            end += 1
+
+    def skip_container(self):
+        """pos is just after '{' or '['; moves it past the matching close without tokenizing."""
+        depth = 1
+        while True:
+            self.pos = _SCAN_RE.match(self.buf, self.pos).end()
+            if self.pos >= len(self.buf):
+                if not self.fill():
+                    raise ValueError("Unterminated JSON container")
+                continue
+            c = self.buf[self.pos]
+            if c == '"':
+                # String cut by the end of the buffer
+                if not self.fill():
+                    raise ValueError("Unterminated JSON string")
+                continue
+            self.pos += 1
+            if c in '{[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def read_container(self):
+        """pos is just after '{' or '['; returns the whole container decoded by the C json parser."""
+        self.mark = self.pos - 1
+        try:
+            self.skip_container()
+            return json.loads(self.buf[self.mark:self.pos])
+        finally:
+            self.mark = None
+
+def decode_string(raw):
+    return json.loads(f'"{raw}"') if '\\' in raw else raw
+
+def decode_scalar(raw):
+    if raw in _LITERALS:
+        return _LITERALS[raw]
+    if any(c in raw for c in '.eE'):
+        return float(raw)
+    return int(raw)
+
+def build_value(reader, first, spec=True):
+    """Materializes one value, keeping only what spec selects."""
+    kind, raw = first
+    if kind == 's':
+        return decode_string(raw)
+    if kind == 'v':
+        return decode_scalar(raw)
+    if spec is True:
+        return reader.read_container()
+    if isinstance(spec, Decoded):
+        return project(reader.read_container(), spec.spec)
+
+    if kind == '{':
+        obj = {}
+        tok = reader.next()
+        while tok[0] != '}':
+            if tok[0] == ',':
+                tok = reader.next()
+                continue
+            key = decode_string(tok[1])
+            reader.next() # ':'
+            value_tok = reader.next()
+            sub = spec.get(key)
+            if sub is None:
+                if value_tok[0] in '{[':
+                    reader.skip_container()
+            else:
+                obj[key] = build_value(reader, value_tok, sub)
+            tok = reader.next()
+        return obj
+
+    if kind == '[':
+        arr = []
+        sub = spec.get('*')
+        if sub is None:
+            reader.skip_container()
+            return arr
+        tok = reader.next()
+        while tok[0] != ']':
+            if tok[0] != ',':
+                arr.append(build_value(reader, tok, sub))
+            tok = reader.next()
+        return arr
+
+    raise ValueError(f"Unexpected JSON token {kind!r}")
+
+def project(value, spec):
+    """Applies a projection spec to an already-decoded value."""
+    if isinstance(spec, Decoded):
+        spec = spec.spec
+    if spec is True or not isinstance(value, (dict, list)):
+        return value
+    if isinstance(value, list):
+        sub = spec.get('*')
+        return [project(v, sub) for v in value] if sub is not None else []
+    return {k: project(v, spec[k]) for k, v in value.items() if k in spec}
+
+def _descend(reader, tok, keys):
+    """From the object starting at tok, follows `keys`; returns the target value's first token, or None."""
+    for key in keys:
+        if tok[0] != '{':
+            return None
+        tok = reader.next()
+        while tok[0] != '}':
+            if tok[0] == ',':
+                tok = reader.next()
+                continue
+            name = decode_string(tok[1])
+            reader.next() # ':'
+            tok = reader.next()
+            if name == key:
+                break
+            if tok[0] in '{[':
+                reader.skip_container()
+            tok = reader.next()
+        else:
+            return None
+    return tok
+
+def iter_array(source, keys=('data',), spec=True, chunk_size=CHUNK_SIZE):
+    """
+    Yields the projected elements of the array at `keys` (data[] of a v3 match
+    list by default), one at a time. source is a path, a text file object or a
+    response body (bytes). Stopping early means the rest is never read.
+    """
+    if isinstance(source, bytes):
+        source = io.TextIOWrapper(io.BytesIO(source), encoding='utf-8')
+    with (open(source, 'r') if isinstance(source, str) else source) as f:
+        reader = TokenReader(f, chunk_size)
+        tok = reader.next()
+        if tok[0] == 's':
+            # Double-encoded response: decode once, then project element by element
+            doc = json.loads(decode_string(tok[1]))
+            for key in keys:
+                doc = doc.get(key) if isinstance(doc, dict) else None
+            for item in doc if isinstance(doc, list) else []:
+                yield project(item, spec)
+            return
+        tok = _descend(reader, tok, keys)
+        if tok is None or tok[0] != '[':
+            return
+        tok = reader.next()
+        while tok[0] != ']':
+            if tok[0] != ',':
+                yield build_value(reader, tok, spec)
+            tok = reader.next()
+
+def load_projected(path, spec=V2_METRICS_SPEC, chunk_size=CHUNK_SIZE):
+    """Streams a JSON file and returns only the projected fields."""
+    with open(path, 'r') as f:
+        reader = TokenReader(f, chunk_size)
+        doc = build_value(reader, reader.next(), spec)
+
+    # Some API responses are double-encoded (a JSON string holding the document)
+    if isinstance(doc, str):
+        doc = project(json.loads(doc), spec)
+    return doc
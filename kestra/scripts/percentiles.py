@@ -0,0 +1,425 @@
+import os
+import json
+import math
+import gzip
+import bisect
+import sqlite3
+import argparse
+from array import array
+
+# Percentile context from mergeable quantile sketches.
+# Every locally ingested match feeds one t-digest per (rank tier, agent, map,
+# metric), so "ADR 142 is the 82nd percentile for Gold Jett on Ascent" can be
+# answered without keeping raw samples. Each digest is bounded by its
+# compression (about COMPRESSION centroids), stored as a packed blob in SQLite,
+# and digests from different stores merge by simply re-compressing centroids.
+# Off unless PERCENTILE_DB is set: ingest and lookup are then no-ops.
+
+DB_PATH = os.environ.get('PERCENTILE_DB', '')
+COMPRESSION = int(os.environ.get('PERCENTILE_COMPRESSION', '100'))
+# Below this many samples a scope is too thin to quote; fall back to a wider one
+MIN_SAMPLES = int(os.environ.get('PERCENTILE_MIN_SAMPLES', '30'))
+
+METRICS = ('acs', 'adr', 'hs_percent', 'kd', 'first_duel_win')
+METRIC_LABELS = {
+    'acs': 'ACS',
+    'adr': 'ADR',
+    'hs_percent': 'HS%',
+    'kd': 'K/D',
+    'first_duel_win': 'First duel win%'
+}
+# Only modes where per-round stats are comparable across matches
+RANKED_MODES = {'competitive', 'unrated', 'premier'}
+ANY = '*'
+
+class TDigest:
+    """
+    Merging t-digest (k1 scale function). Values are buffered and folded into
+    centroids on compress(); cdf/quantile interpolate between centroid means.
+    """
+
+    def __init__(self, compression=COMPRESSION, means=None, weights=None, vmin=math.inf, vmax=-math.inf):
+        self.compression = compression
+        self.means = list(means or [])
+        self.weights = list(weights or [])
+        self.min = vmin
+        self.max = vmax
+        self.count = sum(self.weights)
+        self.buffer = []
+        self._cum = None
+
+    def add(self, value, weight=1.0):
+        self.buffer.append((value, weight))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.buffer) > 5 * self.compression:
+            self.compress()
+
+    def merge(self, other):
+        """Folds another digest into this one."""
+        other.compress()
+        self.buffer.extend(zip(other.means, other.weights))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def compress(self):
+        if not self.buffer:
+            return
+        items = sorted(list(zip(self.means, self.weights)) + self.buffer)
+        self.buffer = []
+        total = self.count
+        means, weights = [], []
+        cur_m, cur_w = items[0]
+        done = 0.0
+        k_lower = self._k(0.0)
+        for m, w in items[1:]:
+            # Centroid may grow while it spans at most one unit of k
+            if self._k((done + cur_w + w) / total) - k_lower <= 1:
+                cur_w += w
+                cur_m += (m - cur_m) * w / cur_w
+            else:
+                means.append(cur_m)
+                weights.append(cur_w)
+                done += cur_w
+                k_lower = self._k(done / total)
+                cur_m, cur_w = m, w
+        means.append(cur_m)
+        weights.append(cur_w)
+        self.means, self.weights = means, weights
+        self._cum = None
+
+    def _cumulative(self):
+        """Cumulative weight at each centroid mean (half of the centroid counted)."""
+        if self._cum is None:
+            cum, run = [], 0.0
+            for w in self.weights:
+                cum.append(run + w / 2)
+                run += w
+            self._cum = cum
+        return self._cum
+
+    def cdf(self, x):
+        """Fraction of samples <= x, or None when empty."""
+        self.compress()
+        if not self.count:
+            return None
+        if x < self.min:
+            return 0.0
+        if x >= self.max:
+            return 1.0
+        means, cum, total = self.means, self._cumulative(), self.count
+        i = bisect.bisect_right(means, x)
+        if i == 0:
+            lo_x, lo_c, hi_x, hi_c = self.min, 0.0, means[0], cum[0]
+        elif i == len(means):
+            lo_x, lo_c, hi_x, hi_c = means[-1], cum[-1], self.max, total
+        else:
+            lo_x, lo_c, hi_x, hi_c = means[i - 1], cum[i - 1], means[i], cum[i]
+        if hi_x <= lo_x:
+            return hi_c / total
+        return (lo_c + (hi_c - lo_c) * (x - lo_x) / (hi_x - lo_x)) / total
+
+    def quantile(self, q):
+        """Approximate value at quantile q in [0, 1], or None when empty."""
+        self.compress()
+        if not self.count:
+            return None
+        means, cum, total = self.means, self._cumulative(), self.count
+        target = q * total
+        i = bisect.bisect_left(cum, target)
+        if i == 0:
+            lo_x, lo_c, hi_x, hi_c = self.min, 0.0, means[0], cum[0]
+        elif i == len(means):
+            lo_x, lo_c, hi_x, hi_c = means[-1], cum[-1], self.max, total
+        else:
+            lo_x, lo_c, hi_x, hi_c = means[i - 1], cum[i - 1], means[i], cum[i]
+        if hi_c <= lo_c:
+            return hi_x
+        return lo_x + (hi_x - lo_x) * (target - lo_c) / (hi_c - lo_c)
+
+    def to_bytes(self):
+        self.compress()
+        return array('d', [self.min, self.max] + self.means + self.weights).tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob, compression=COMPRESSION):
+        values = array('d')
+        values.frombytes(blob)
+        n = (len(values) - 2) // 2
+        return cls(compression, values[2:2 + n], values[2 + n:], values[0], values[1])
+
+# Match payloads -> samples
+
+def rank_tier(rank_patched):
+    """'Gold 2' -> 'Gold', 'Immortal 3' -> 'Immortal'; unranked players share one tier."""
+    if not rank_patched or rank_patched.lower() in ('unrated', 'unranked'):
+        return 'Unranked'
+    return rank_patched.split()[0]
+
+def match_samples(match):
+    """
+    Per-player metric samples for one match document (v2 'data' or a v3 list item).
+    Returns [(tier, agent, map, {metric: value})], empty for non-ranked-like modes.
+    """
+    meta = match.get('metadata', {})
+    if (meta.get('mode') or '').lower() not in RANKED_MODES:
+        return []
+    players = match.get('players', {}).get('all_players', [])
+    rounds = match.get('rounds') or []
+    rounds_played = meta.get('rounds_played') or len(rounds)
+    if not players or not rounds_played:
+        return []
+
+    # Opening duel of each round and per-round damage (fallback for damage_made)
+    duels_taken, duels_won, round_damage = {}, {}, {}
+    for r in rounds:
+        first = None
+        for ps in r.get('player_stats', []):
+            pid = ps.get('player_puuid')
+            round_damage[pid] = round_damage.get(pid, 0) + (ps.get('damage') or 0)
+            for k in ps.get('kill_events') or []:
+                if first is None or k.get('kill_time_in_round', 0) < first.get('kill_time_in_round', 0):
+                    first = k
+        if first:
+            killer, victim = first.get('killer_puuid'), first.get('victim_puuid')
+            duels_taken[killer] = duels_taken.get(killer, 0) + 1
+            duels_taken[victim] = duels_taken.get(victim, 0) + 1
+            duels_won[killer] = duels_won.get(killer, 0) + 1
+
+    samples = []
+    for p in players:
+        stats = p.get('stats', {})
+        puuid = p.get('puuid')
+        kills = stats.get('kills') or 0
+        deaths = stats.get('deaths') or 0
+        head = stats.get('headshots') or 0
+        hits = head + (stats.get('bodyshots') or 0) + (stats.get('legshots') or 0)
+        damage = p.get('damage_made') or stats.get('damage_made') or round_damage.get(puuid, 0)
+        values = {
+            'acs': (stats.get('score') or 0) / rounds_played,
+            'adr': damage / rounds_played,
+            'kd': kills / deaths if deaths > 0 else float(kills)
+        }
+        if hits > 0:
+            values['hs_percent'] = head / hits * 100
+        if duels_taken.get(puuid):
+            values['first_duel_win'] = duels_won.get(puuid, 0) / duels_taken[puuid] * 100
+        samples.append((rank_tier(p.get('currenttier_patched')), p.get('character') or 'Unknown', meta.get('map') or 'Unknown', values))
+    return samples
+
+def scope_keys(tier, agent, map_name):
+    """Scopes a sample rolls up into, narrowest first (also the lookup fallback order)."""
+    return [(tier, agent, map_name), (tier, agent, ANY), (tier, ANY, map_name), (tier, ANY, ANY)]
+
+def scope_label(tier, agent, map_name):
+    label = tier if agent == ANY else f"{tier} {agent}"
+    return label if map_name == ANY else f"{label} on {map_name}"
+
+# Store
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sketches (
+    tier TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    map TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    count REAL NOT NULL,
+    digest BLOB NOT NULL,
+    PRIMARY KEY (tier, agent, map, metric)
+);
+CREATE TABLE IF NOT EXISTS ingested (
+    match_id TEXT PRIMARY KEY
+);
+"""
+
+def connect(path=DB_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def load_digest(conn, tier, agent, map_name, metric):
+    row = conn.execute(
+        "SELECT digest FROM sketches WHERE tier = ? AND agent = ? AND map = ? AND metric = ?",
+        (tier, agent, map_name, metric)
+    ).fetchone()
+    return TDigest.from_bytes(row[0]) if row else None
+
+def save_digest(conn, tier, agent, map_name, metric, digest):
+    conn.execute(
+        "INSERT OR REPLACE INTO sketches VALUES (?, ?, ?, ?, ?, ?)",
+        (tier, agent, map_name, metric, digest.count, digest.to_bytes())
+    )
+
+def add_samples(conn, samples):
+    """Adds samples to every scope they roll up into; one read-modify-write per sketch."""
+    pending = {}
+    for tier, agent, map_name, values in samples:
+        for scope in scope_keys(tier, agent, map_name):
+            for metric, value in values.items():
+                pending.setdefault(scope + (metric,), []).append(value)
+
+    for key, values in pending.items():
+        digest = load_digest(conn, *key) or TDigest()
+        for v in values:
+            digest.add(v)
+        save_digest(conn, *key, digest)
+
+def ingest_match(conn, match_id, match):
+    """Ingests one match document once. Returns the number of player samples added."""
+    if not match_id:
+        return 0
+    with conn:
+        if conn.execute("INSERT OR IGNORE INTO ingested VALUES (?)", (match_id.lower(),)).rowcount == 0:
+            return 0
+        samples = match_samples(match)
+        add_samples(conn, samples)
+    return len(samples)
+
+def ingest_payload(data, path=DB_PATH):
+    """Ingests a raw v2 payload (as returned by /v2/match) into the store at path."""
+    if not path:
+        return 0
+    match = data.get('data', {}) if isinstance(data, dict) else {}
+    match_id = match.get('metadata', {}).get('matchid')
+    try:
+        conn = connect(path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Percentile ingest skipped: {e}")
+        return 0
+    try:
+        return ingest_match(conn, match_id, match)
+    except sqlite3.Error as e:
+        print(f"Percentile ingest skipped: {e}")
+        return 0
+    finally:
+        conn.close()
+
+def merge_store(conn, other_path):
+    """Merges every sketch of another store into this one (the sketches are mergeable)."""
+    other = sqlite3.connect(other_path)
+    merged = 0
+    with conn:
+        for tier, agent, map_name, metric, _, blob in other.execute("SELECT * FROM sketches"):
+            digest = load_digest(conn, tier, agent, map_name, metric) or TDigest()
+            digest.merge(TDigest.from_bytes(blob))
+            save_digest(conn, tier, agent, map_name, metric, digest)
+            merged += 1
+        ids = [r for r in other.execute("SELECT match_id FROM ingested")]
+        conn.executemany("INSERT OR IGNORE INTO ingested VALUES (?)", ids)
+    other.close()
+    return merged
+
+# Lookup
+
+def ordinal(n):
+    suffix = 'th' if 10 <= n % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
+    return f"{n}{suffix}"
+
+def percentile_of(conn, tier, agent, map_name, metric, value, min_samples=MIN_SAMPLES):
+    """
+    Percentile of value within the narrowest scope with enough samples.
+    Returns { percentile, median, scope, samples } or None.
+    """
+    for scope in scope_keys(tier, agent, map_name):
+        digest = load_digest(conn, *scope, metric)
+        if digest and digest.count >= min_samples:
+            return {
+                "percentile": min(99, int(digest.cdf(value) * 100)),
+                "median": round(digest.quantile(0.5), 1),
+                "scope": scope_label(*scope),
+                "samples": int(digest.count)
+            }
+    return None
+
+def lookup(rank_patched, agent, map_name, mode, values, path=DB_PATH):
+    """
+    Percentile context for the prompt: { metric: percentile_of(...) } for the
+    metrics that have a populated scope. None when disabled or nothing is known.
+    """
+    if not path or not os.path.exists(path) or (mode or '').lower() not in RANKED_MODES:
+        return None
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        tier = rank_tier(rank_patched)
+        result = {}
+        for metric, value in values.items():
+            if value is None:
+                continue
+            found = percentile_of(conn, tier, agent, map_name, metric, value)
+            if found:
+                result[metric] = found
+        return result or None
+    except sqlite3.Error as e:
+        print(f"Percentile lookup skipped: {e}")
+        return None
+    finally:
+        conn.close()
+
+def format_line(context):
+    """One markdown line: 'ADR 82nd | HS% 40th (Gold Jett on Ascent)'."""
+    parts = []
+    scopes = []
+    for metric in METRICS:
+        entry = context.get(metric)
+        if not entry:
+            continue
+        parts.append(f"{METRIC_LABELS[metric]} {ordinal(entry['percentile'])}")
+        if entry['scope'] not in scopes:
+            scopes.append(entry['scope'])
+    return f"• **Percentiles ({', '.join(scopes)}):** " + " | ".join(parts)
+
+def main():
+    parser = argparse.ArgumentParser(description="Percentile sketches per (rank tier, agent, map, metric)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    ingest = sub.add_parser('ingest', help="ingest every payload of a match_store directory")
+    ingest.add_argument('store_dir', nargs='?', default=os.environ.get('MATCH_STORE_DIR', '/app/data/match_store'))
+    query = sub.add_parser('query', help="percentile of a value")
+    query.add_argument('rank')
+    query.add_argument('agent')
+    query.add_argument('map')
+    query.add_argument('metric', choices=METRICS)
+    query.add_argument('value', type=float)
+    merge = sub.add_parser('merge', help="merge another percentile store into this one")
+    merge.add_argument('other')
+    args = parser.parse_args()
+    if not DB_PATH:
+        parser.error("PERCENTILE_DB is not set")
+
+    conn = connect()
+    if args.command == 'ingest':
+        added = matches = 0
+        for root, _, files in os.walk(args.store_dir):
+            for name in files:
+                if not name.endswith('.json.gz'):
+                    continue
+                try:
+                    with gzip.open(os.path.join(root, name), 'rb') as f:
+                        data = json.loads(f.read())
+                    if isinstance(data, str):
+                        data = json.loads(data)
+                except (OSError, EOFError, ValueError) as e:
+                    print(f"Skipping {name}: {e}")
+                    continue
+                match = data.get('data', {})
+                n = ingest_match(conn, match.get('metadata', {}).get('matchid'), match)
+                matches += 1 if n else 0
+                added += n
+        print(f"Ingested {matches} new match(es), {added} player sample(s)")
+    elif args.command == 'query':
+        found = percentile_of(conn, rank_tier(args.rank), args.agent, args.map, args.metric, args.value)
+        print(json.dumps(found))
+    elif args.command == 'merge':
+        print(f"Merged {merge_store(conn, args.other)} sketch(es)")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import deque
+
+# Background pre-warming of match analyses (runs inside analysis_worker.py).
+# After a dashboard run the newest PREWARM_TOP_N match ids the player has not
+# analysed yet are queued and run through the autonomous pipeline at low
+# priority: at most PREWARM_CONCURRENCY at a time, only while no interactive
+# request is in flight, with background priority on the HenrikDev bucket.
+# Finished analyses are kept in a small SQLite ledger, so a later analysis
+# request for the same match and player is answered from it at once.
+# When the queue holds more than PREWARM_MAX_QUEUE jobs the oldest are
+# cancelled, as are jobs that waited longer than PREWARM_MAX_AGE_SEC.
+# stats() reports how many pre-warmed analyses were actually used (hit rate).
+
+DB_PATH = os.environ.get('PREWARM_DB', '/app/data/prewarm.sqlite')
+TOP_N = int(os.environ.get('PREWARM_TOP_N', '3'))
+CONCURRENCY = max(1, int(os.environ.get('PREWARM_CONCURRENCY', '1')))
+MAX_QUEUE = int(os.environ.get('PREWARM_MAX_QUEUE', '6'))
+MAX_AGE_SEC = int(os.environ.get('PREWARM_MAX_AGE_SEC', '600'))
+RESULT_TTL_SEC = int(os.environ.get('PREWARM_RESULT_TTL_SEC', '86400'))
+
+# How long a job waits for interactive traffic to clear before checking again
+IDLE_POLL_SEC = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prewarmed (
+    match_id TEXT NOT NULL,
+    player TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    queued_at REAL,
+    finished_at REAL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (match_id, player)
+);
+CREATE INDEX IF NOT EXISTS idx_prewarmed_finished ON prewarmed (finished_at);
+"""
+
+_db_lock = threading.Lock()
+_queue = deque()
+_cond = threading.Condition()
+_running = [0]
+_conn = []
+_started = []
+
+def connect(path=DB_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def db():
+    """One shared connection per process (all access goes through _db_lock)."""
+    if not _conn:
+        _conn.append(connect())
+    return _conn[0]
+
+def job_key(match_id, player):
+    return match_id.strip().lower(), (player or '').strip().lower()
+
+def set_status(match_id, player, status, result=None, error=None):
+    now = time.time()
+    with _db_lock:
+        conn = db()
+        conn.execute(
+            "INSERT INTO prewarmed (match_id, player, status, result, error, queued_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(match_id, player) DO UPDATE SET status = excluded.status, result = excluded.result, "
+            "error = excluded.error, finished_at = excluded.finished_at, hits = CASE WHEN excluded.status = 'queued' THEN 0 ELSE hits END, "
+            "queued_at = CASE WHEN excluded.status = 'queued' THEN excluded.queued_at ELSE queued_at END",
+            (match_id, player, status, json.dumps(result) if result is not None else None, error, now,
+             now if status in ('done', 'failed', 'cancelled') else None)
+        )
+        conn.commit()
+
+def known(match_id, player):
+    """True when the ledger already has this match for the player (queued, running or a fresh result)."""
+    with _db_lock:
+        row = db().execute(
+            "SELECT status, finished_at FROM prewarmed WHERE match_id = ? AND player = ?", job_key(match_id, player)
+        ).fetchone()
+    if not row:
+        return False
+    status, finished_at = row
+    if status in ('queued', 'running'):
+        return True
+    return status == 'done' and time.time() - (finished_at or 0) < RESULT_TTL_SEC
+
+def take_result(match_id, player):
+    """The pre-warmed analysis for a match + player (counting the hit), or None."""
+    key = job_key(match_id, player)
+    with _db_lock:
+        conn = db()
+        row = conn.execute(
+            "SELECT result, finished_at FROM prewarmed WHERE match_id = ? AND player = ? AND status = 'done'", key
+        ).fetchone()
+        if not row or time.time() - (row[1] or 0) >= RESULT_TTL_SEC:
+            return None
+        conn.execute("UPDATE prewarmed SET hits = hits + 1 WHERE match_id = ? AND player = ?", key)
+        conn.commit()
+    return json.loads(row[0])
+
+def enqueue(player, match_ids, is_seen=None, top_n=TOP_N):
+    """
+    Queues the newest top_n match ids (input is newest first) that are not in the
+    ledger and not seen otherwise (is_seen(match_id, player), with the name as
+    typed). Returns {"queued": [...], "skipped": [...], "cancelled": [...]}.
+    """
+    name = (player or '').strip()
+    queued, skipped = [], []
+    for match_id in match_ids[:max(0, top_n)]:
+        match_id = match_id.strip().lower()
+        if not match_id or known(match_id, name) or (is_seen and is_seen(match_id, name)):
+            skipped.append(match_id)
+            continue
+        set_status(*job_key(match_id, name), 'queued')
+        queued.append(match_id)
+
+    cancelled = []
+    with _cond:
+        # Newest dashboard first: its jobs jump the queue
+        for match_id in reversed(queued):
+            _queue.appendleft({"match_id": match_id, "player": name.lower(), "name": name, "queued_at": time.time()})
+        while len(_queue) > MAX_QUEUE:
+            job = _queue.pop()
+            cancelled.append(job['match_id'])
+            set_status(job['match_id'], job['player'], 'cancelled', error='queue over budget')
+        _cond.notify_all()
+    return {"queued": queued, "skipped": skipped, "cancelled": cancelled}
+
+def cancel(match_id, player):
+    """Drops a still-queued job (an interactive request is analysing the match itself). True if one was removed."""
+    key = job_key(match_id, player)
+    with _cond:
+        for job in list(_queue):
+            if (job['match_id'], job['player']) == key:
+                _queue.remove(job)
+                set_status(*key, 'cancelled', error='requested interactively')
+                return True
+    return False
+
+def _next_job():
+    with _cond:
+        while True:
+            while not _queue:
+                _cond.wait()
+            job = _queue.popleft()
+            if time.time() - job['queued_at'] <= MAX_AGE_SEC:
+                _running[0] += 1
+                return job
+            set_status(job['match_id'], job['player'], 'cancelled', error='waited too long')
+
+def _loop(analyze, busy):
+    while True:
+        job = _next_job()
+        try:
+            # Low priority: interactive requests go first
+            while busy():
+                time.sleep(IDLE_POLL_SEC)
+            set_status(job['match_id'], job['player'], 'running')
+            result = analyze(job['match_id'], job['name'])
+            set_status(job['match_id'], job['player'], 'done', result=result)
+        except Exception as e:
+            print(f"Prewarm {job['match_id']} failed: {e}", flush=True)
+            set_status(job['match_id'], job['player'], 'failed', error=str(e))
+        finally:
+            with _cond:
+                _running[0] -= 1
+
+def start(analyze, busy):
+    """Starts the background threads. analyze(match_id, player) -> analysis dict; busy() -> interactive work in flight."""
+    # Jobs queued by a previous process are gone with its memory
+    with _db_lock:
+        conn = db()
+        conn.execute("UPDATE prewarmed SET status = 'cancelled', error = 'worker restarted', finished_at = ? "
+                     "WHERE status IN ('queued', 'running')", (time.time(),))
+        conn.commit()
+    for _ in range(CONCURRENCY):
+        threading.Thread(target=_loop, args=(analyze, busy), daemon=True, name='prewarm').start()
+    _started.append(True)
+
+def running():
+    """True once start() has launched the background threads."""
+    return bool(_started)
+
+def stats():
+    """Queue state plus ledger totals; hit_rate is the share of finished pre-warms that were used."""
+    with _db_lock:
+        rows = db().execute("SELECT status, COUNT(*), SUM(hits > 0), SUM(hits) FROM prewarmed GROUP BY status").fetchall()
+    by_status = {status: count for status, count, _, _ in rows}
+    done = by_status.get('done', 0)
+    used = sum(used or 0 for status, _, used, _ in rows if status == 'done')
+    with _cond:
+        pending, running = len(_queue), _running[0]
+    return {
+        "pending": pending,
+        "running": running,
+        "done": done,
+        "failed": by_status.get('failed', 0),
+        "cancelled": by_status.get('cancelled', 0),
+        "used": used,
+        "hits": sum(hits or 0 for _, _, _, hits in rows),
+        "hit_rate": round(used / done * 100, 1) if done else 0
+    }
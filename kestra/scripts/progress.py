@@ -0,0 +1,74 @@
+import os
+import re
+import json
+import time
+import threading
+
+# Progressive results, addressable by Kestra execution id.
+# The analysis pipeline publishes each artifact as soon as it exists (the stats
+# block and minified match after the build, then the router decision and
+# persona, then the text generated so far while the LLM streams (`partial`),
+# then the coaching text), so the UI can render the scoreboard and the first
+# sentences while the LLM is still writing. Chat turns publish `partial` and
+# the final `text` the same way. One small JSON file per execution under
+# PROGRESS_DIR, replaced atomically on every stage; the analysis worker serves
+# it at GET /progress/<execution_id>. Empty PROGRESS_DIR disables publishing.
+
+PROGRESS_DIR = os.environ.get('PROGRESS_DIR', '')
+PROGRESS_TTL_SEC = int(os.environ.get('PROGRESS_TTL_SEC', '3600'))
+
+# Stages in publish order ('failed' can replace any of them)
+STAGES = ['stats', 'routed', 'generating', 'done', 'failed']
+
+_SAFE_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def progress_path(execution_id, progress_dir=None):
+    progress_dir = PROGRESS_DIR if progress_dir is None else progress_dir
+    if not progress_dir or not execution_id or not _SAFE_ID.match(execution_id):
+        return None
+    return os.path.join(progress_dir, f"{execution_id}.json")
+
+def read(execution_id, progress_dir=None):
+    """The published record for an execution, or None."""
+    path = progress_path(execution_id, progress_dir)
+    if not path:
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def publish(execution_id, stage, progress_dir=None, **fields):
+    """Merges fields into the execution's record and moves it to `stage`. Never raises."""
+    path = progress_path(execution_id, progress_dir)
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        record = read(execution_id, progress_dir) or {"execution_id": execution_id, "started_at": time.time()}
+        record.update(fields)
+        record['stage'] = stage
+        record['updated_at'] = time.time()
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Progress publish failed ({stage}): {e}")
+
+def prune(progress_dir=None, ttl_sec=PROGRESS_TTL_SEC):
+    """Deletes records older than the TTL. Returns how many were removed."""
+    progress_dir = PROGRESS_DIR if progress_dir is None else progress_dir
+    if not progress_dir or not os.path.isdir(progress_dir):
+        return 0
+    cutoff = time.time() - ttl_sec
+    removed = 0
+    for entry in os.scandir(progress_dir):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
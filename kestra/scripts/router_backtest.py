@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import glob
+import hashlib
+import argparse
+
+sys.path.insert(0, os.getcwd())
+from analyze_context import DEFAULT_RULES, DECISIONS, features, classify
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Batch router and backtest harness for analyze_context.
+# Loads stored minified matches (the build memo, analysis.json files, batch
+# NDJSON results), turns the router inputs into NumPy columns and evaluates
+# the rule cascade for all of them at once. Prints the decision distribution
+# for a rule set and, given a second one, which matches would change persona.
+# Without NumPy the same rules run match by match through classify().
+#
+#   python router_backtest.py /app/data/build_memo
+#   python router_backtest.py /app/data/build_memo --compare carried_max_acs=180,tilt_max_kda=0.5
+
+def iter_documents(path):
+    """Yields (label, minified match) from a file, or from every JSON / NDJSON file under a directory."""
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, '**', '*.json'), recursive=True) +
+                       glob.glob(os.path.join(path, '**', '*.ndjson'), recursive=True))
+    else:
+        files = [path]
+    for file_path in files:
+        try:
+            with open(file_path, 'r') as f:
+                if file_path.endswith('.ndjson'):
+                    docs = [json.loads(line) for line in f if line.strip()]
+                else:
+                    docs = [json.load(f)]
+        except (OSError, ValueError):
+            continue
+        for i, doc in enumerate(docs):
+            if isinstance(doc, dict) and isinstance(doc.get('results'), list):
+                # batch.json: { summary, results: [analysis...] }
+                for result in doc['results']:
+                    if isinstance(result, dict) and 'context' in result:
+                        yield result.get('match_id') or f"{file_path}:{i}", result['context']
+                continue
+            # analysis.json / batch NDJSON lines carry the minified match as 'context'
+            minified = doc.get('context') if isinstance(doc, dict) and 'context' in doc else doc
+            if isinstance(minified, dict) and 'metadata' in minified and 'combat' in minified:
+                label = doc.get('match_id') or (file_path if len(docs) == 1 else f"{file_path}:{i}")
+                yield label, minified
+
+def load_matches(paths):
+    """(labels, feature dicts), de-duplicated by content (the memo keeps one copy per builder version)."""
+    labels, rows, seen = [], [], set()
+    for path in paths:
+        for label, minified in iter_documents(path):
+            digest = hashlib.sha256(json.dumps(minified, sort_keys=True).encode('utf-8')).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            labels.append(label)
+            rows.append(features(minified))
+    return labels, rows
+
+def to_columns(rows):
+    """Feature dicts -> NumPy columns."""
+    return {
+        "victory": np.fromiter((r['result'] == 'Victory' for r in rows), dtype=bool, count=len(rows)),
+        "defeat": np.fromiter((r['result'] == 'Defeat' for r in rows), dtype=bool, count=len(rows)),
+        "kda": np.fromiter((r['kda_ratio'] for r in rows), dtype=np.float64, count=len(rows)),
+        "acs": np.fromiter((r['acs'] for r in rows), dtype=np.float64, count=len(rows)),
+        "score_diff": np.fromiter((r['score_diff'] for r in rows), dtype=np.int32, count=len(rows)),
+        "rounds": np.fromiter((r['rounds_played'] for r in rows), dtype=np.int32, count=len(rows))
+    }
+
+def route_columns(cols, rules):
+    """Decision index (into DECISIONS) per match; same cascade as analyze_context.classify."""
+    conditions = [
+        (cols['kda'] > rules['team_diff_min_kda']) & cols['defeat'],
+        (cols['acs'] < rules['carried_max_acs']) & cols['victory'],
+        cols['score_diff'] <= rules['close_max_score_diff'],
+        (cols['rounds'] <= rules['stomp_max_rounds']) & cols['victory'],
+        (cols['kda'] < rules['tilt_max_kda']) & cols['defeat']
+    ]
+    # np.select takes the first true condition, like the if/elif chain
+    return np.select(conditions, list(range(len(conditions))), default=len(DECISIONS) - 1)
+
+def route_all(rows, rules, cols=None):
+    """Decision indices for every match (vectorized when NumPy is available)."""
+    if np is not None:
+        return route_columns(cols if cols is not None else to_columns(rows), rules).tolist()
+    index = {d: i for i, d in enumerate(DECISIONS)}
+    return [index[classify(r, rules)] for r in rows]
+
+def distribution(decisions):
+    counts = [0] * len(DECISIONS)
+    for d in decisions:
+        counts[d] += 1
+    return {DECISIONS[i]: c for i, c in enumerate(counts)}
+
+def parse_rules(value):
+    """None -> defaults; a JSON file path; or inline 'key=value,key=value' overrides."""
+    rules = dict(DEFAULT_RULES)
+    if not value:
+        return rules
+    if os.path.exists(value):
+        with open(value) as f:
+            overrides = json.load(f)
+    else:
+        overrides = {}
+        for pair in value.split(','):
+            key, _, raw = pair.partition('=')
+            overrides[key.strip()] = float(raw)
+    unknown = set(overrides) - set(DEFAULT_RULES)
+    if unknown:
+        raise ValueError(f"Unknown rule(s): {', '.join(sorted(unknown))} (known: {', '.join(DEFAULT_RULES)})")
+    rules.update(overrides)
+    return rules
+
+def backtest(labels, rows, rules_a, rules_b=None, max_flips=50):
+    cols = to_columns(rows) if np is not None and rows else None
+    a = route_all(rows, rules_a, cols)
+    report = {
+        "matches": len(rows),
+        "engine": "numpy" if np is not None else "python",
+        "rules": rules_a,
+        "distribution": distribution(a)
+    }
+    if rules_b is None:
+        return report
+
+    b = route_all(rows, rules_b, cols)
+    transitions = {}
+    flips = []
+    for label, da, db in zip(labels, a, b):
+        if da == db:
+            continue
+        key = f"{DECISIONS[da]} -> {DECISIONS[db]}"
+        transitions[key] = transitions.get(key, 0) + 1
+        if len(flips) < max_flips:
+            flips.append({"match": label, "from": DECISIONS[da], "to": DECISIONS[db]})
+    report.update(
+        compare_rules=rules_b,
+        compare_distribution=distribution(b),
+        flipped=sum(transitions.values()),
+        transitions=dict(sorted(transitions.items(), key=lambda kv: -kv[1])),
+        flips=flips
+    )
+    return report
+
+def print_report(report):
+    n = report['matches'] or 1
+    print(f"{report['matches']} matches ({report['engine']})")
+    header = f"  {'decision':<16}{'count':>8}{'share':>9}"
+    if 'compare_distribution' in report:
+        header += f"{'compare':>10}{'share':>9}{'delta':>8}"
+    print(header)
+    for decision in DECISIONS:
+        a = report['distribution'][decision]
+        line = f"  {decision:<16}{a:>8}{a / n:>9.1%}"
+        if 'compare_distribution' in report:
+            b = report['compare_distribution'][decision]
+            line += f"{b:>10}{b / n:>9.1%}{b - a:>+8}"
+        print(line)
+    if 'compare_distribution' in report:
+        changed = {k: v for k, v in report['compare_rules'].items() if report['rules'].get(k) != v}
+        print(f"\n{report['flipped']} match(es) change decision with {changed}")
+        for transition, count in report['transitions'].items():
+            print(f"  {transition}: {count}")
+        for flip in report['flips']:
+            print(f"    {flip['match']}: {flip['from']} -> {flip['to']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-route stored matches and compare router rule sets")
+    parser.add_argument('paths', nargs='*', default=[os.environ.get('BUILD_MEMO_DIR') or '.'],
+                        help="memo dir, analysis.json / batch files, or directories of them")
+    parser.add_argument('--rules', help="rule set A: JSON file or key=value,... (default: current rules)")
+    parser.add_argument('--compare', help="rule set B to diff against A")
+    parser.add_argument('--max-flips', type=int, default=50, help="flipped matches to list")
+    parser.add_argument('-o', '--output', help="write the report as JSON")
+    args = parser.parse_args()
+
+    labels, rows = load_matches(args.paths)
+    report = backtest(labels, rows, parse_rules(args.rules),
+                      parse_rules(args.compare) if args.compare else None, args.max_flips)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import os
+import re
+import sys
+import json
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.getcwd())
+from dashboard_parser import player_key
+import henrik_client
+import match_history
+import tracing
+
+try:
+    # Newly stored matches also feed the rank/agent/map percentile sketches
+    import percentiles
+except ImportError:
+    percentiles = None
+
+# Squad dashboard: several Riot IDs in one execution.
+# Account, MMR and match-list requests for every member run concurrently
+# through the shared HenrikDev client, so the squad draws from one rate budget
+# (the per-key token bucket) instead of one dashboard execution per profile.
+# A member whose newest match is already in the history store only costs a
+# size=1 probe. Games the squad played together come back once per member's
+# list; they are de-duplicated by match id, so each document is stored and
+# ingested once, for every member it contains. Lists are streamed through the
+# match_stream projection, never decoded whole. The output has one card per
+# member plus squad aggregates over the games at least two members played on
+# the same team.
+#
+#   SQUAD_PLAYERS="Name#Tag, Name#Tag, ..."  REGION=ap
+
+MAX_MEMBERS = int(os.environ.get('SQUAD_MAX_MEMBERS', '5'))
+CONCURRENCY = max(1, int(os.environ.get('SQUAD_CONCURRENCY', '6')))
+# Newest stored games per member the squad aggregates look at
+WINDOW = int(os.environ.get('SQUAD_WINDOW', '20'))
+
+_SEPARATORS = re.compile(r'[,;\n]+')
+
+def parse_riot_ids(text, max_members=MAX_MEMBERS):
+    """'Name#Tag, Name#Tag' -> [(name, tag)], without duplicates (case-insensitive)."""
+    members, seen = [], set()
+    for item in _SEPARATORS.split(text or ''):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, tag = item.rpartition('#')
+        if not sep or not name.strip() or not tag.strip():
+            raise ValueError(f"Invalid Riot ID '{item}' (expected Name#Tag)")
+        key = player_key(name.strip(), tag.strip())
+        if key not in seen:
+            seen.add(key)
+            members.append((name.strip(), tag.strip()))
+    if not members:
+        raise ValueError("SQUAD_PLAYERS is empty")
+    if len(members) > max_members:
+        raise ValueError(f"{len(members)} members given, at most {max_members} allowed")
+    return members
+
+def api_get(api_url, api_key, path, label):
+    """Raw body of one GET through the shared client (raises on HTTP errors)."""
+    with tracing.span('api_fetch', file=label) as sp:
+        response = henrik_client.get(api_url + path, api_key)
+        body = response.raise_for_status().body
+        sp.set('bytes', len(body)).set('source', response.source)
+    tracing.counter('payload_bytes', len(body), source=label.split(':')[0])
+    return response
+
+def riot_path(*parts):
+    return "/".join(urllib.parse.quote(p) for p in parts)
+
+def fetch_member_matches(api_url, api_key, region, name, tag, stored_ids):
+    """
+    The member's new v3 match documents. With stored history a size=1 probe
+    comes first; the full list is only fetched when its match is unknown.
+    Returns (matches, probed, fetched).
+    """
+    path = f"/valorant/v3/matches/{riot_path(region, name, tag)}"
+    label = f"matches:{name}#{tag}"
+    if stored_ids:
+        newest = match_history.parse_match_list(api_get(api_url, api_key, f"{path}?size=1", label).body)
+        newest_ids = {m.get('metadata', {}).get('matchid') for m in newest}
+        if newest_ids and newest_ids <= stored_ids:
+            return [], True, False
+    # Streamed and projected to what the history and percentile ingest read (match_stream)
+    matches = match_history.parse_match_list(api_get(api_url, api_key, f"{path}?size={match_history.FETCH_SIZE}", label).body)
+    return matches, bool(stored_ids), True
+
+def fetch_squad(api_url, api_key, region, members, stored):
+    """
+    Account, MMR and matches for every member, all in flight together.
+    Returns {member: {"account", "mmr", "matches", "probed", "fetched", "errors"}}.
+    """
+    results = {m: {"account": None, "mmr": None, "matches": [], "probed": False, "fetched": False, "errors": []}
+               for m in members}
+
+    def account(member):
+        name, tag = member
+        return api_get(api_url, api_key, f"/valorant/v1/account/{riot_path(name, tag)}", f"account:{name}#{tag}").json()
+
+    def mmr(member):
+        name, tag = member
+        return api_get(api_url, api_key, f"/valorant/v1/mmr/{riot_path(region, name, tag)}", f"mmr:{name}#{tag}").json()
+
+    def matches(member):
+        return fetch_member_matches(api_url, api_key, region, *member, stored.get(member, set()))
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        futures = [(member, kind, pool.submit(fn, member))
+                   for member in members for kind, fn in (("account", account), ("mmr", mmr), ("matches", matches))]
+        for member, kind, future in futures:
+            try:
+                value = future.result()
+            except (henrik_client.ApiError, OSError, ValueError) as e:
+                results[member]['errors'].append(f"{kind}: {e}")
+                continue
+            if kind == 'matches':
+                results[member]['matches'], results[member]['probed'], results[member]['fetched'] = value
+            else:
+                results[member][kind] = value.get('data') or {}
+    return results
+
+def dedupe_matches(lists):
+    """{match_id: document} over every member's list, first copy kept. Returns (unique, duplicates dropped)."""
+    unique, duplicates = {}, 0
+    for matches in lists:
+        for match in matches:
+            match_id = match.get('metadata', {}).get('matchid')
+            if not match_id:
+                continue
+            if match_id in unique:
+                duplicates += 1
+            else:
+                unique[match_id] = match
+    return unique, duplicates
+
+def store_squad_matches(conn, pids, unique):
+    """
+    Stores each unique match once for every member in it. pids: {(name, tag): player id}.
+    Returns {member: matches inserted}.
+    """
+    known = {m: match_history.known_match_ids(conn, pid, list(unique)) for m, pid in pids.items()}
+    inserted = {m: 0 for m in pids}
+    for match_id, match in unique.items():
+        # One name#tag index per document, shared by every member lookup
+        index = {player_key(p.get('name'), p.get('tag')): p
+                 for p in match.get('players', {}).get('all_players', [])}
+        stored = False
+        for member, pid in pids.items():
+            player = index.get(player_key(*member))
+            if player and match_id not in known[member] and match_history.insert_match(conn, pid, match, *member, player):
+                inserted[member] += 1
+                stored = True
+        if stored and percentiles:
+            percentiles.ingest_payload({"data": match})
+    conn.commit()
+    return inserted
+
+def shared_games(rows_by_member):
+    """
+    Games at least two members played on the same team, newest first:
+    [{match_id, map, started_at, result, team, members}].
+    """
+    groups = {}
+    for member, rows in rows_by_member.items():
+        for r in rows:
+            groups.setdefault((r['match_id'], r['team']), []).append((member, r))
+    games = []
+    for (match_id, team), entries in groups.items():
+        if len(entries) < 2:
+            continue
+        first = entries[0][1]
+        games.append({
+            "match_id": match_id,
+            "map": first['map'],
+            "started_at": first['started_at'],
+            "result": first['result'],
+            "team": team,
+            "members": [f"{name}#{tag}" for (name, tag), _ in entries]
+        })
+    games.sort(key=lambda g: g['started_at'] or 0, reverse=True)
+    return games
+
+def squad_aggregates(rows_by_member, games):
+    """Shared win rate, plus each member's stats in shared games and in the rest of their window."""
+    shared = {(g['match_id'], g['team']) for g in games}
+    wins = sum(1 for g in games if g['result'] == 'Victory')
+    members = {}
+    for (name, tag), rows in rows_by_member.items():
+        together = [r for r in rows if (r['match_id'], r['team']) in shared]
+        apart = [r for r in rows if (r['match_id'], r['team']) not in shared]
+        members[f"{name}#{tag}"] = {
+            "together": match_history.summarize_rows(together),
+            "apart": match_history.summarize_rows(apart)
+        }
+    return {
+        "shared_games": len(games),
+        "shared_wins": wins,
+        "shared_win_rate": round(wins / len(games) * 100, 1) if games else 0,
+        "members": members
+    }
+
+def member_card(member, fetched, rows, inserted):
+    name, tag = member
+    account = fetched['account'] or {}
+    mmr = fetched['mmr'] or {}
+    return {
+        "name": account.get('name', name),
+        "tag": account.get('tag', tag),
+        "level": account.get('account_level', 0),
+        "rank": mmr.get('currenttierpatched', 'Unrated'),
+        "card": (account.get('card') or {}).get('small'),
+        "summary": match_history.summarize_rows(rows),
+        "matches": [json.loads(r['summary']) for r in rows[:match_history.DASHBOARD_SIZE]],
+        "sync": {"new_matches": inserted, "probed": fetched['probed'], "fetched": fetched['fetched']},
+        "errors": fetched['errors']
+    }
+
+def main():
+    region = os.environ.get('REGION', 'ap')
+    try:
+        members = parse_riot_ids(os.environ.get('SQUAD_PLAYERS', ''))
+    except ValueError as e:
+        print(f"CRITICAL ERROR: {e}")
+        sys.exit(1)
+
+    start = time.time()
+    conn = match_history.connect()
+    pids = {m: match_history.player_id(conn, region, *m) for m in members}
+    # Each member's newest stored games: the size=1 probe is checked against them
+    stored = {m: {r['match_id'] for r in match_history.recent_matches(conn, region, *m, limit=match_history.DASHBOARD_SIZE)} for m in members}
+
+    with tracing.span('squad_fetch', members=len(members)):
+        fetched = fetch_squad(os.environ.get('VALO_API_URL', ''), os.environ.get('VALO_API_KEY', ''),
+                              region, members, stored)
+
+    with tracing.span('squad_store') as sp:
+        unique, duplicates = dedupe_matches(fetched[m]['matches'] for m in members)
+        inserted = store_squad_matches(conn, pids, unique)
+        now = time.time()
+        for m in members:
+            if not fetched[m]['errors']:
+                conn.execute("UPDATE players SET last_sync = ? WHERE id = ?", (now, pids[m]))
+        conn.commit()
+        sp.set('unique_matches', len(unique)).set('duplicates', duplicates)
+
+    with tracing.span('squad_aggregate'):
+        rows_by_member = {m: match_history.recent_matches(conn, region, *m, limit=WINDOW) for m in members}
+        games = shared_games(rows_by_member)
+        output = {
+            "region": region,
+            "players": [member_card(m, fetched[m], rows_by_member[m], inserted[m]) for m in members],
+            "squad": dict(squad_aggregates(rows_by_member, games), window=WINDOW),
+            "shared_matches": games[:match_history.DASHBOARD_SIZE],
+            "fetch": {"unique_matches": len(unique), "duplicates_skipped": duplicates}
+        }
+
+    with open('squad.json', 'w') as f:
+        json.dump(output, f)
+
+    print(f"Squad of {len(members)} ({region}): {len(unique)} new match document(s), {duplicates} shared duplicate(s) "
+          f"skipped, {len(games)} shared game(s) in {int((time.time() - start) * 1000)} ms")
+    print(f"::set-output name=shared_games::{len(games)}", flush=True)
+    tracing.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import json
+
+# Output files and Kestra task outputs of the analysis and chat tasks.
+# Stdlib only: written by the in-process scripts (analysis_pipeline.py,
+# chat_session.py) and by worker_client.py for results from the resident
+# worker, so both paths produce the same files and outputs.
+
+def write_stream_metrics(stream_metrics):
+    """Time to first token and generation speed of a streamed LLM request."""
+    print(f"::set-output name=ttft_ms::{stream_metrics['ttft_ms']}", flush=True)
+    print(f"::set-output name=tokens_per_sec::{stream_metrics['tokens_per_sec']}", flush=True)
+
+def write_analysis(result):
+    """analysis.json plus the stage timing / decision / prompt token / streaming outputs."""
+    with open('analysis.json', 'w') as f:
+        json.dump(result, f)
+
+    timings = result.get('timings', {})
+    print("Stage timings (ms): " + ", ".join(f"{k}={v}" for k, v in timings.items()))
+    for stage, ms in timings.items():
+        print(f"::set-output name={stage}_ms::{ms}", flush=True)
+    if 'decision' in result:
+        print(f"::set-output name=decision::{result['decision']}", flush=True)
+    if 'prompt_tokens' in result:
+        print(f"::set-output name=prompt_tokens_before::{result['prompt_tokens']['before']}", flush=True)
+        print(f"::set-output name=prompt_tokens_after::{result['prompt_tokens']['after']}", flush=True)
+    if result.get('stream_metrics'):
+        write_stream_metrics(result['stream_metrics'])
+
+def write_reply(result):
+    """reply.json plus the turn / streaming outputs."""
+    if 'turn' in result:
+        print(f"::set-output name=turn::{result['turn']}", flush=True)
+        print(f"::set-output name=request_bytes::{result['request_bytes']}", flush=True)
+    if result.get('stream_metrics'):
+        write_stream_metrics(result['stream_metrics'])
+    with open('reply.json', 'w') as f:
+        json.dump(result, f)
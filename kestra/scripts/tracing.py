@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+from contextlib import contextmanager
+
+# Lightweight spans and counters for the task scripts.
+# Every finished span / counter is printed as a Kestra metric line
+# (::{"metrics": [...]}::, the format the Kestra Python library emits), and
+# flush() writes the whole task as a structured trace.json. TRACE_ENABLED=false
+# turns span() into a shared no-op object, so instrumented code pays one
+# function call per span.
+# A long-running process (the analysis worker) uses capture() instead: the
+# spans and counters of one request are collected for the current thread only,
+# returned to the caller, and replay()ed by the task as its own metrics.
+
+ENABLED = os.environ.get('TRACE_ENABLED', 'true').lower() not in ('0', 'false', 'no', 'off')
+TRACE_FILE = os.environ.get('TRACE_FILE', 'trace.json')
+
+_started = time.time()
+_spans = []
+_counters = {}
+# Open spans per thread, so concurrent work (batch runs) keeps its own parent chain
+_local = threading.local()
+_lock = threading.Lock()
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def _capture():
+    return getattr(_local, 'capture', None)
+
+def emit(name, kind, value, tags=None):
+    """Prints one Kestra metric (kind: 'timer' in seconds, or 'counter')."""
+    metric = {"name": name, "type": kind, "value": value, "tags": {k: str(v) for k, v in (tags or {}).items()}}
+    print("::" + json.dumps({"metrics": [metric]}) + "::", flush=True)
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+class Span:
+    """Timed section; attributes set on it (sizes, token counts, status) go into the trace."""
+    __slots__ = ('name', 'tags', 'attrs', 'parent', 't0')
+
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.attrs = {}
+        self.parent = None
+        self.t0 = 0.0
+
+    def set(self, key, value):
+        self.attrs[key] = value
+        return self
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.t0
+        _stack().pop()
+        capture = _capture()
+        started = capture['started'] if capture is not None else _started
+        record = {
+            "name": self.name,
+            "parent": self.parent,
+            "start_ms": round((time.time() - elapsed - started) * 1000, 1),
+            "duration_ms": round(elapsed * 1000, 1),
+            "peak_rss_kb": peak_rss_kb()
+        }
+        if self.tags:
+            record["tags"] = self.tags
+        if self.attrs:
+            record["attrs"] = self.attrs
+        if exc_type:
+            record["error"] = exc_type.__name__
+        if capture is not None:
+            capture['spans'].append(record)
+            return False
+        _spans.append(record)
+        emit(self.name, 'timer', round(elapsed, 6), self.tags)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, key, value):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopSpan()
+
+def span(name, **tags):
+    """with span('parse', source='store') as s: ...; s.set('bytes', n)"""
+    return Span(name, tags) if ENABLED or _capture() is not None else _NOOP
+
+def counter(name, value, **tags):
+    """Adds to a named counter (payload bytes, tokens...)."""
+    if value is None:
+        return
+    capture = _capture()
+    if capture is not None:
+        capture['counters'][name] = capture['counters'].get(name, 0) + value
+        return
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    emit(name, 'counter', value, tags)
+
+@contextmanager
+def capture():
+    """
+    Collects this thread's spans and counters (whatever TRACE_ENABLED says)
+    without printing them: with capture() as trace: ...; trace -> {spans, counters}.
+    """
+    trace = {"started": time.time(), "spans": [], "counters": {}}
+    previous = _capture()
+    _local.capture = trace
+    try:
+        yield trace
+    finally:
+        _local.capture = previous
+        trace.pop('started')
+
+def replay(trace):
+    """Records spans and counters captured in another process as this task's own."""
+    if not ENABLED or not trace:
+        return
+    for record in trace.get('spans', []):
+        _spans.append(record)
+        emit(record['name'], 'timer', round(record['duration_ms'] / 1000, 6), record.get('tags'))
+    for name, value in trace.get('counters', {}).items():
+        counter(name, value)
+
+def flush(path=None):
+    """Emits peak RSS and writes the task's trace file. Call once, at the end of main()."""
+    if not ENABLED:
+        return
+    peak = peak_rss_kb()
+    emit('peak_rss_kb', 'counter', peak)
+    trace = {
+        "execution_id": os.environ.get('KESTRA_EXECUTION_ID', ''),
+        "task": os.environ.get('TRACE_TASK', os.path.basename(sys.argv[0] or '')),
+        "started_at": _started,
+        "total_ms": round((time.time() - _started) * 1000, 1),
+        "peak_rss_kb": peak,
+        "spans": _spans,
+        "counters": _counters
+    }
+    try:
+        with open(path or TRACE_FILE, 'w') as f:
+            json.dump(trace, f, indent=2)
+    except OSError as e:
+        print(f"Trace not written: {e}")
@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.getcwd())
+# Same output files / outputs as the in-process scripts (stdlib only)
+import task_outputs
+try:
+    # The worker returns each request's spans; replayed here as the task's metrics + trace.json
+    import tracing
+except ImportError:
+    tracing = None
+
+# Kestra-side client for the resident analysis worker (analysis_worker.py).
+# Stdlib only, so the task needs no container and no pip install: it posts the
+# task's inputs to the worker and writes the same output files and outputs as
+# the in-process scripts. When the worker cannot be reached it falls back to
+# running that script in-process (which needs the scripts' own dependencies);
+# the in-process scripts import requests, so they are only imported for the
+# fallback.
+#
+#   python worker_client.py analyze   -> analysis.json (as analysis_pipeline.py)
+#   python worker_client.py chat      -> reply.json (as chat_session.py)
+#   python worker_client.py prewarm   queues background analyses of the dashboard's
+#                                     newest matches (output.json); skipped without a worker
+
+WORKER_URL = os.environ.get('ANALYSIS_WORKER_URL', 'http://analysis-worker:8790')
+TIMEOUT_SEC = float(os.environ.get('WORKER_TIMEOUT_SEC', '300'))
+
+class WorkerUnavailable(Exception):
+    pass
+
+def call(op, payload, timeout=TIMEOUT_SEC):
+    """POSTs one operation. Returns the response body; raises WorkerUnavailable when there is no usable worker."""
+    req = urllib.request.Request(
+        f"{WORKER_URL}/{op}", data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            return json.loads(res.read())
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        if e.code in (502, 503, 504):
+            raise WorkerUnavailable(f"HTTP {e.code}")
+        try:
+            message = json.loads(body).get('error', body)
+        except ValueError:
+            message = body
+        raise RuntimeError(f"worker {op} failed: {message}")
+    except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+        raise WorkerUnavailable(str(e))
+
+def enabled(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes')
+
+def record_trace(result):
+    """Replays the spans and counters the worker captured for this request."""
+    trace = result.pop('trace', None)
+    if tracing:
+        tracing.replay(trace)
+        tracing.flush()
+
+def analyze():
+    payload = {
+        "match_id": os.environ.get('MATCH_ID', ''),
+        "player_name": os.environ.get('TARGET_PLAYER', ''),
+        "agent_mode": os.environ.get('AGENT_MODE', 'autonomous'),
+        "manual_agent": os.environ.get('MANUAL_AGENT', ''),
+        "execution_id": os.environ.get('KESTRA_EXECUTION_ID', ''),
+        # The worker publishes the streamed text under the execution id
+        "stream": enabled('LLM_STREAM')
+    }
+    try:
+        result = call('analyze', payload)
+    except WorkerUnavailable as e:
+        print(f"Worker unavailable ({e}), running in-process")
+        import analysis_pipeline
+        return analysis_pipeline.main()
+    except Exception as e:
+        print(f"Pipeline Error: {e}")
+        result = {"text": f"Error extracting stats: {e}", "timings": {}}
+    record_trace(result)
+    task_outputs.write_analysis(result)
+    print(f"::set-output name=prewarm_hit::{str(bool(result.get('prewarmed'))).lower()}", flush=True)
+
+def chat():
+    payload = {
+        "message": os.environ.get('CHAT_MESSAGE', ''),
+        "match_id": os.environ.get('CHAT_MATCH_ID', ''),
+        "player_name": os.environ.get('CHAT_USER', ''),
+        "session_id": os.environ.get('CHAT_SESSION_ID', ''),
+        "context": os.environ.get('CHAT_CONTEXT') or None,
+        "execution_id": os.environ.get('KESTRA_EXECUTION_ID', ''),
+        "stream": enabled('CHAT_STREAM')
+    }
+    try:
+        result = call('chat', payload)
+    except WorkerUnavailable as e:
+        print(f"Worker unavailable ({e}), running in-process")
+        import chat_session
+        return chat_session.main()
+    except Exception as e:
+        print(f"Chat Error: {e}")
+        result = {"reply": f"Chat Error: {e}"}
+    record_trace(result)
+    task_outputs.write_reply(result)
+
+def prewarm():
+    with open(os.environ.get('DASHBOARD_FILE', 'output.json'), 'r') as f:
+        matches = json.load(f).get('matches', [])
+    payload = {
+        "player_name": os.environ.get('PLAYER_NAME', ''),
+        "match_ids": [m['match_id'] for m in matches if m.get('match_id')]
+    }
+    try:
+        # Pre-warming is an optimisation: no worker, no pre-warm
+        result = call('prewarm', payload, timeout=10)
+    except WorkerUnavailable as e:
+        print(f"Worker unavailable ({e}), skipping pre-warm")
+        return
+    if result.get('disabled'):
+        print("Pre-warm is disabled on the worker (PREWARM_TOP_N=0)")
+        return
+    print(f"Pre-warm: queued {result['queued']}, skipped {result['skipped']}, cancelled {result['cancelled']}")
+    print(f"::set-output name=prewarm_queued::{len(result['queued'])}", flush=True)
+
+COMMANDS = {"analyze": analyze, "chat": chat, "prewarm": prewarm}
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('WORKER_OP', 'analyze')
+    if command not in COMMANDS:
+        print(f"Unknown command '{command}' (expected one of: {', '.join(COMMANDS)})")
+        sys.exit(1)
+    start = time.time()
+    COMMANDS[command]()
+    print(f"::set-output name=worker_call_ms::{int((time.time() - start) * 1000)}", flush=True)
+
+if __name__ == "__main__":
+    main()